@@ -3,12 +3,24 @@ Pathology Module - WSGI Flask Application
 Server-rendered HTML with Jinja2 templating
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, stream_with_context
 from datetime import datetime, date
+import io
 import os
 
 from app.models import db, PathologyTest, LabTestOrder, LabTestResult, OrderStatusEnum, ResultStatusEnum
-from app.controllers import PathologyTestController, LabTestOrderController, LabTestResultController
+from app.controllers import PathologyTestController, LabTestOrderController, LabTestResultController, PatientController
+from app.ingest import detect_format, parse_order_rows
+from app import export
+from app.catalog import test_catalog
+from app.dashboard import dashboard_cache
+from app.pagecache import page_cache, order_version, result_version, test_version
+from app.config import load_config, engine_options, replica_bind
+from app.routing import REPLICA_BIND, init_replica_routing
+from app.migrations import SCHEMA_BOOT_MODES, check_schema_version, upgrade_schema
+from app.poolstats import pool_stats
+from app.assets import init_assets
+from app.compression import init_compression
 
 
 def create_app(config=None):
@@ -19,48 +31,79 @@ def create_app(config=None):
     
     # Configuration
     if config is None:
-        config = {
-            'SQLALCHEMY_DATABASE_URI': 'mysql+pymysql://root:@localhost:3306/pathology_db',  # MySQL from XAMPP
-            'SQLALCHEMY_TRACK_MODIFICATIONS': False,
-            'SECRET_KEY': 'dev-secret-key-change-in-production',
-            'JSON_SORT_KEYS': False,
-        }
+        config = load_config()
     
     app.config.update(config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    if app.config.get('REPLICA_DATABASE_URI'):
+        app.config['SQLALCHEMY_BINDS'] = {
+            **app.config.get('SQLALCHEMY_BINDS', {}),
+            REPLICA_BIND: replica_bind(app.config),
+        }
     
     # Initialize database
     db.init_app(app)
+    init_replica_routing(app, db)
+    
+    # Schema fast path: DDL lives in `flask init-db`; boot reads one version row
+    schema_mode = app.config.get('SCHEMA_BOOT_MODE', 'check')
+    if schema_mode not in SCHEMA_BOOT_MODES:
+        raise ValueError(f"Invalid SCHEMA_BOOT_MODE: {schema_mode}")
+    if schema_mode in ('check', 'warn'):
+        with app.app_context():
+            check_schema_version(app.logger, strict=schema_mode == 'check')
+    elif schema_mode == 'create':
+        with app.app_context():
+            upgrade_schema()
+    
+    # Fingerprinted static assets and gzip/brotli responses
+    init_assets(app)
+    init_compression(app)
+    
+    # Opt-in per-request SQL/template profiling
+    if app.config.get('PROFILING_ENABLED'):
+        from app.profiling import init_profiling
+        init_profiling(app)
     
-    with app.app_context():
-        db.create_all()
+    # Versioned JSON API
+    from app.api import api_v1
+    app.register_blueprint(api_v1)
     
     # ===== PATHOLOGY TEST ENDPOINTS =====
     
     @app.route('/')
     def index():
         """Dashboard/Home page"""
-        test_count = PathologyTest.query.count()
-        order_count = LabTestOrder.query.count()
-        result_count = LabTestResult.query.count()
-        today_orders = LabTestOrder.query.filter_by(order_date=date.today()).count()
+        stats = dashboard_cache.get()
         
         return render_template('index.html',
-                             test_count=test_count,
-                             order_count=order_count,
-                             result_count=result_count,
-                             today_orders=today_orders)
+                             test_count=stats['test_count'],
+                             order_count=stats['order_count'],
+                             result_count=stats['result_count'],
+                             today_orders=stats['today_orders'],
+                             status_counts=stats['status_counts'],
+                             tat_today=stats['tat_today'])
     
     @app.route('/tests', methods=['GET'])
     def list_tests():
         """List all tests with search"""
         search = request.args.get('search', '').strip()
+        sort = request.args.get('sort', '')
+        descending = request.args.get('dir') == 'desc'
         
         if search:
             tests = PathologyTestController.search_tests(search)
         else:
             tests = PathologyTestController.list_all_tests()
+        stats = PathologyTestController.get_order_stats()
+        try:
+            tests = PathologyTestController.sort_tests(tests, stats, sort, descending)
+        except ValueError as e:
+            flash(f'Error: {str(e)}', 'error')
+            sort = ''
         
-        return render_template('tests/list.html', tests=tests, search=search)
+        return render_template('tests/list.html', tests=tests, search=search, stats=stats,
+                             sort=sort, descending=descending)
     
     @app.route('/tests/new', methods=['GET', 'POST'])
     def create_test():
@@ -73,7 +116,9 @@ def create_app(config=None):
                     sample_type=request.form.get('sample_type'),
                     normal_range=request.form.get('normal_range'),
                     price=request.form.get('price'),
-                    is_active=request.form.get('is_active') == 'on'
+                    is_active=request.form.get('is_active') == 'on',
+                    critical_low=request.form.get('critical_low'),
+                    critical_high=request.form.get('critical_high'),
                 )
                 flash(f'Test "{test.test_name}" created successfully (ID: {test.id})', 'success')
                 return redirect(url_for('list_tests'))
@@ -97,7 +142,9 @@ def create_app(config=None):
                     'test_name': request.form.get('test_name'),
                     'price': request.form.get('price'),
                     'normal_range': request.form.get('normal_range'),
-                    'is_active': request.form.get('is_active') == 'on'
+                    'is_active': request.form.get('is_active') == 'on',
+                    'critical_low': request.form.get('critical_low'),
+                    'critical_high': request.form.get('critical_high'),
                 }
                 test = PathologyTestController.update_test(test_id, **updates)
                 flash(f'Test "{test.test_name}" updated successfully', 'success')
@@ -111,8 +158,12 @@ def create_app(config=None):
     def view_test(test_id):
         """View test details"""
         try:
-            test = PathologyTestController.get_test_by_id(test_id)
-            return render_template('tests/view.html', test=test)
+            def render():
+                test = PathologyTestController.get_test_by_id(test_id)
+                stats = PathologyTestController.get_order_stats([test_id]).get(test_id)
+                return render_template('tests/view.html', test=test, stats=stats)
+            
+            return page_cache.respond('test', test_id, test_version(test_id), render)
         except ValueError as e:
             flash(f'Error: {str(e)}', 'error')
             return redirect(url_for('list_tests'))
@@ -124,16 +175,22 @@ def create_app(config=None):
         """List all orders"""
         filter_type = request.args.get('filter', 'all')
         search = request.args.get('search', '').strip()
+        archived = request.args.get('archived') == '1'
+        page_args = {
+            'cursor': request.args.get('cursor') or None,
+            'direction': request.args.get('dir', 'next'),
+            'per_page': request.args.get('per_page', type=int),
+        }
         
         try:
             if search:
-                orders = LabTestOrderController.search_orders(search)
+                orders = LabTestOrderController.search_orders(search, include_archived=archived, **page_args)
             elif filter_type == 'today':
-                orders = LabTestOrderController.list_today_orders()
+                orders = LabTestOrderController.list_today_orders(**page_args)
             elif filter_type in ['Draft', 'Ordered', 'Completed', 'Cancelled']:
-                orders = LabTestOrderController.list_orders_by_status(filter_type)
+                orders = LabTestOrderController.list_orders_by_status(filter_type, **page_args)
             else:
-                orders = LabTestOrderController.list_all_orders()
+                orders = LabTestOrderController.list_all_orders(**page_args)
         except ValueError as e:
             flash(f'Error: {str(e)}', 'error')
             orders = []
@@ -142,6 +199,7 @@ def create_app(config=None):
                              orders=orders,
                              filter_type=filter_type,
                              search=search,
+                             archived=archived,
                              statuses=[s.value for s in OrderStatusEnum])
     
     @app.route('/orders/new', methods=['GET', 'POST'])
@@ -154,7 +212,7 @@ def create_app(config=None):
                 order = LabTestOrderController.create_order(
                     patient_name=request.form.get('patient_name'),
                     patient_phone=request.form.get('patient_phone'),
-                    test_id=int(request.form.get('test_id')),
+                    test_ids=request.form.getlist('test_ids'),
                     order_date=request.form.get('order_date')
                 )
                 flash(f'Order "{order.order_id}" created successfully', 'success')
@@ -164,22 +222,74 @@ def create_app(config=None):
         
         return render_template('orders/form.html', order=None, tests=active_tests)
     
+    @app.route('/orders/import', methods=['POST'])
+    def import_orders():
+        """
+        Bulk-create orders from CSV or JSON lines
+        Accepts a multipart 'file' upload or the raw request body and
+        returns a JSON report of created orders and failed rows.
+        """
+        upload = request.files.get('file')
+        if upload:
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig')
+            filename, content_type = upload.filename, upload.mimetype
+        else:
+            stream = io.StringIO(request.get_data(as_text=True))
+            filename, content_type = None, request.content_type
+
+        sample = stream.readline()
+        fmt = request.args.get('format') or detect_format(filename, content_type, sample)
+        lines = _chain_first_line(sample, stream)
+
+        try:
+            report = LabTestOrderController.bulk_create_orders(parse_order_rows(lines, fmt))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        status_code = 201 if report['created'] else 422
+        return jsonify(report), status_code
+    
+    @app.route('/patients/<int:patient_id>')
+    def view_patient(patient_id):
+        """A patient's order history, newest first"""
+        archived = request.args.get('archived') == '1'
+        try:
+            patient = PatientController.get_patient_by_id(patient_id)
+            orders = PatientController.list_patient_orders(
+                patient_id,
+                cursor=request.args.get('cursor') or None,
+                direction=request.args.get('dir', 'next'),
+                per_page=request.args.get('per_page', type=int),
+                include_archived=archived,
+            )
+            counts = PatientController.get_status_counts(patient_id, include_archived=archived)
+        except ValueError as e:
+            flash(f'Error: {str(e)}', 'error')
+            return redirect(url_for('list_orders'))
+        
+        return render_template('patients/view.html', patient=patient, orders=orders, counts=counts,
+                               archived=archived)
+    
     @app.route('/orders/<int:order_id>')
     def view_order(order_id):
         """View order details"""
         try:
-            order = LabTestOrderController.get_order_by_id(order_id)
-            result = LabTestResult.query.filter_by(order_id=order_id).first()
-            
-            # Determine available actions based on status
-            actions = {
-                'can_order': order.status == OrderStatusEnum.DRAFT.value,
-                'can_create_result': order.status == OrderStatusEnum.ORDERED.value,
-                'can_cancel': order.status in [OrderStatusEnum.DRAFT.value, OrderStatusEnum.ORDERED.value],
-                'can_complete_result': result and result.status == ResultStatusEnum.DRAFT.value,
-            }
+            def render():
+                order = LabTestOrderController.get_order_by_id(order_id, profile='detail', include_archived=True)
+                results = [line.result for line in order.lines if line.result]
+                
+                # Determine available actions based on status
+                actions = {
+                    'can_order': order.status == OrderStatusEnum.DRAFT.value,
+                    'can_create_result': order.status == OrderStatusEnum.ORDERED.value,
+                    'can_cancel': order.status in [OrderStatusEnum.DRAFT.value, OrderStatusEnum.ORDERED.value],
+                    'can_complete_result': any(result.status == ResultStatusEnum.DRAFT.value for result in results),
+                }
+                
+                return render_template('orders/view.html', order=order, lines=order.lines,
+                                       total=sum(line.price for line in order.lines), actions=actions)
             
-            return render_template('orders/view.html', order=order, result=result, actions=actions)
+            return page_cache.respond('order', order_id, order_version(order_id), render)
         except ValueError as e:
             flash(f'Error: {str(e)}', 'error')
             return redirect(url_for('list_orders'))
@@ -208,18 +318,47 @@ def create_app(config=None):
         
         return redirect(url_for('view_order', order_id=order_id))
     
+    @app.route('/orders/batch/status', methods=['POST'])
+    def batch_update_order_status():
+        """Move many orders to one status (form or JSON), with a per-ID report"""
+        payload = request.get_json(silent=True) if request.is_json else None
+        if payload is not None:
+            order_ids, new_status = payload.get('ids'), payload.get('status')
+        else:
+            order_ids, new_status = request.form.getlist('ids'), request.form.get('status')
+        
+        try:
+            report = LabTestOrderController.batch_transition_status(order_ids, new_status)
+        except ValueError as e:
+            if payload is not None:
+                return jsonify({'error': str(e)}), 400
+            flash(f'Error: {str(e)}', 'error')
+            return redirect(request.referrer or url_for('list_orders'))
+        
+        if payload is not None:
+            return jsonify(report)
+        _flash_batch_report(report['updated'], report['outcomes'], f'moved to "{new_status}"')
+        return redirect(request.referrer or url_for('list_orders'))
+    
     # ===== LAB TEST RESULT ENDPOINTS =====
     
     @app.route('/results', methods=['GET'])
     def list_results():
         """List all results"""
         filter_type = request.args.get('filter', 'all')
+        page_args = {
+            'cursor': request.args.get('cursor') or None,
+            'direction': request.args.get('dir', 'next'),
+            'per_page': request.args.get('per_page', type=int),
+        }
         
         try:
             if filter_type == 'completed':
-                results = LabTestResultController.list_completed_results()
+                results = LabTestResultController.list_completed_results(**page_args)
+            elif filter_type == 'abnormal':
+                results = LabTestResultController.list_abnormal_results(**page_args)
             else:
-                results = LabTestResultController.list_all_results()
+                results = LabTestResultController.list_all_results(**page_args)
         except ValueError as e:
             flash(f'Error: {str(e)}', 'error')
             results = []
@@ -228,9 +367,9 @@ def create_app(config=None):
     
     @app.route('/orders/<int:order_id>/result/new', methods=['GET', 'POST'])
     def create_result(order_id):
-        """Create a result for an order"""
+        """Create a result for one line of an order (?line_id=, default the first open line)"""
         try:
-            order = LabTestOrderController.get_order_by_id(order_id)
+            order = LabTestOrderController.get_order_by_id(order_id, profile='detail')
         except ValueError as e:
             flash(f'Error: {str(e)}', 'error')
             return redirect(url_for('list_orders'))
@@ -240,35 +379,44 @@ def create_app(config=None):
             flash(f'Result can only be created for orders in "{OrderStatusEnum.ORDERED.value}" status', 'error')
             return redirect(url_for('view_order', order_id=order_id))
         
+        try:
+            line = order.line_for_new_result(request.values.get('line_id', type=int))
+        except ValueError as e:
+            flash(f'Error: {str(e)}', 'error')
+            return redirect(url_for('view_order', order_id=order_id))
+        
         if request.method == 'POST':
             try:
                 result = LabTestResultController.create_result(
                     order_id=order_id,
                     result_value=request.form.get('result_value'),
-                    technician_notes=request.form.get('technician_notes')
+                    technician_notes=request.form.get('technician_notes'),
+                    line_id=line.id,
                 )
                 flash(f'Result created successfully', 'success')
                 return redirect(url_for('view_result', result_id=result.id))
             except ValueError as e:
                 flash(f'Error: {str(e)}', 'error')
         
-        return render_template('results/form.html', order=order, result=None)
+        return render_template('results/form.html', order=order, line=line, test=line.test, result=None)
     
     @app.route('/results/<int:result_id>')
     def view_result(result_id):
         """View result details"""
         try:
-            result = LabTestResultController.get_result_by_id(result_id)
-            order = result.order
-            test = order.test
-            
-            # Determine available actions
-            actions = {
-                'can_edit': result.status == ResultStatusEnum.DRAFT.value,
-                'can_complete': result.can_complete(),
-            }
+            def render():
+                result = LabTestResultController.get_result_by_id(result_id, profile='detail', include_archived=True)
+                
+                # Determine available actions
+                actions = {
+                    'can_edit': result.status == ResultStatusEnum.DRAFT.value and not result.archived,
+                    'can_complete': result.can_complete(),
+                }
+                
+                return render_template('results/view.html', result=result, order=result.order, test=result.test,
+                                       actions=actions)
             
-            return render_template('results/view.html', result=result, order=order, test=test, actions=actions)
+            return page_cache.respond('result', result_id, result_version(result_id), render)
         except ValueError as e:
             flash(f'Error: {str(e)}', 'error')
             return redirect(url_for('list_results'))
@@ -301,7 +449,7 @@ def create_app(config=None):
             except ValueError as e:
                 flash(f'Error: {str(e)}', 'error')
         
-        return render_template('results/form.html', order=order, result=result)
+        return render_template('results/form.html', order=order, test=result.test, result=result)
     
     @app.route('/results/<int:result_id>/complete', methods=['POST'])
     def complete_result(result_id):
@@ -314,6 +462,81 @@ def create_app(config=None):
             flash(f'Error: {str(e)}', 'error')
             return redirect(url_for('view_result', result_id=result_id))
     
+    @app.route('/results/batch/complete', methods=['POST'])
+    def batch_complete_results():
+        """Complete many Draft results at once (form or JSON), with a per-ID report"""
+        payload = request.get_json(silent=True) if request.is_json else None
+        result_ids = payload.get('ids') if payload is not None else request.form.getlist('ids')
+        
+        try:
+            report = LabTestResultController.batch_complete_results(result_ids)
+        except ValueError as e:
+            if payload is not None:
+                return jsonify({'error': str(e)}), 400
+            flash(f'Error: {str(e)}', 'error')
+            return redirect(request.referrer or url_for('list_results'))
+        
+        if payload is not None:
+            return jsonify(report)
+        _flash_batch_report(report['completed'], report['outcomes'], 'completed')
+        return redirect(request.referrer or url_for('list_results'))
+    
+    # ===== EXPORT ENDPOINTS =====
+    
+    def _export_filters(statuses):
+        return export.parse_export_filters(
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to'),
+            status=request.args.get('status'),
+            test_code=request.args.get('test_code'),
+            statuses=statuses,
+            include_archived=request.args.get('archived') == '1',
+        )
+    
+    @app.route('/export/orders.csv')
+    def export_orders_csv():
+        """Stream orders (with any results) as CSV"""
+        try:
+            filters = _export_filters(export.ORDER_STATUSES)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return Response(
+            stream_with_context(export.stream_orders_csv(filters)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=orders.csv'},
+        )
+    
+    @app.route('/export/results.ndjson')
+    def export_results_ndjson():
+        """Stream results joined with order and test as NDJSON"""
+        try:
+            filters = _export_filters(export.RESULT_STATUSES)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return Response(
+            stream_with_context(export.stream_results_ndjson(filters)),
+            mimetype='application/x-ndjson',
+            headers={'Content-Disposition': 'attachment; filename=results.ndjson'},
+        )
+    
+    # ===== ADMIN ENDPOINTS =====
+    
+    @app.route('/admin/cache-stats')
+    def cache_stats():
+        """Hit/miss counters for the in-process caches"""
+        return jsonify({
+            'test_catalog': test_catalog.stats(),
+            'dashboard': dashboard_cache.stats(),
+            'pages': page_cache.stats(),
+        })
+    
+    @app.route('/admin/pool-stats')
+    def db_pool_stats():
+        """Connection pool checkout wait times and current usage"""
+        return jsonify(pool_stats(db.engine) or {'enabled': False})
+    
     # ===== ERROR HANDLERS =====
     
     @app.errorhandler(404)
@@ -327,6 +550,23 @@ def create_app(config=None):
     return app
 
 
+def _flash_batch_report(succeeded, outcomes, verb):
+    """Summarize a batch outcome report as flash messages"""
+    failures = [outcome for outcome in outcomes if not outcome['ok']]
+    if succeeded:
+        flash(f'{succeeded} record(s) {verb}', 'success')
+    for outcome in failures[:10]:
+        flash(f'ID {outcome["id"]}: {outcome["error"]}', 'error')
+    if len(failures) > 10:
+        flash(f'...and {len(failures) - 10} more failure(s)', 'error')
+
+
+def _chain_first_line(first_line, stream):
+    """Re-attach a line consumed for format sniffing to the rest of the stream"""
+    yield first_line
+    yield from stream
+
+
 if __name__ == '__main__':
     app = create_app()
     app.run(debug=True, host='0.0.0.0', port=5000)
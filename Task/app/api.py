@@ -0,0 +1,272 @@
+"""
+JSON REST API (v1) for LIS integration
+Built on the models' to_dict serializers and the controllers' listing
+methods, with cursor pagination, sparse fieldsets (?fields=a,b; only the
+requested fields are read, and relationships only loaded for fields that
+need them) and ETag/If-None-Match so pollers get 304 Not Modified for
+unchanged pages.
+"""
+
+from datetime import date
+
+from flask import Blueprint, jsonify, request, url_for
+
+from app.models import OrderStatusEnum
+from app.controllers import PathologyTestController, LabTestOrderController, LabTestResultController, PatientController
+
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+TEST_FIELDS = ('id', 'test_name', 'test_code', 'sample_type', 'normal_range', 'price', 'is_active', 'created_at')
+ORDER_FIELDS = ('id', 'order_id', 'patient_id', 'patient_name', 'patient_phone', 'test_id', 'test_name',
+                'lines', 'order_date', 'status', 'ordered_at', 'completed_at', 'cancelled_at', 'created_at', 'archived')
+PATIENT_FIELDS = ('id', 'name', 'phone', 'created_at')
+RESULT_FIELDS = ('id', 'order_id', 'line_id', 'result_value', 'technician_notes', 'status', 'created_at', 'updated_at')
+# Order fields read through a relationship (test, lines), so the listing eager-loads them
+ORDER_RELATIONSHIP_FIELDS = ('test_name', 'lines')
+
+
+def _requested_fields(allowed):
+    """Parse ?fields= into a tuple of field names, validating each"""
+    raw = request.args.get('fields', '').strip()
+    if not raw:
+        return allowed
+    fields = tuple(field.strip() for field in raw.split(',') if field.strip())
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return fields
+
+
+def _serialize(obj, fields):
+    return obj.to_dict(fields)
+
+
+def _order_profile(fields):
+    """Loading profile for an order listing: none unless a requested field reads a relationship"""
+    return 'list' if any(field in ORDER_RELATIONSHIP_FIELDS for field in fields) else None
+
+
+def _page_args():
+    return {
+        'cursor': request.args.get('cursor') or None,
+        'direction': request.args.get('dir', 'next'),
+        'per_page': request.args.get('per_page', type=int),
+    }
+
+
+def _archived_arg():
+    return request.args.get('archived') in ('1', 'true')
+
+
+def _page_links(endpoint, page):
+    """Absolute next/prev links preserving the current path and query arguments"""
+    args = dict(request.view_args or {})
+    args.update((key, value) for key, value in request.args.items() if key not in ('cursor', 'dir'))
+    links = {'next': None, 'prev': None}
+    if getattr(page, 'has_next', False):
+        links['next'] = url_for(endpoint, _external=True, cursor=page.next_cursor, **args)
+    if getattr(page, 'has_prev', False):
+        links['prev'] = url_for(endpoint, _external=True, cursor=page.prev_cursor, dir='prev', **args)
+    return links
+
+
+def _conditional(payload, status_code=200):
+    """JSON response carrying an ETag; 304 when If-None-Match matches"""
+    response = jsonify(payload)
+    response.status_code = status_code
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def _iso_date(value):
+    """Parse an optional YYYY-MM-DD query argument"""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value!r} (expected YYYY-MM-DD)")
+
+
+def _error(message, status_code):
+    return jsonify({'error': message}), status_code
+
+
+# ===== TESTS =====
+
+@api_v1.route('/tests')
+def list_tests():
+    """All tests (the catalog is small, so it is not paginated)"""
+    try:
+        fields = _requested_fields(TEST_FIELDS)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    search = request.args.get('search', '').strip()
+    if search:
+        tests = PathologyTestController.search_tests(search)
+    elif request.args.get('active') in ('1', 'true'):
+        tests = PathologyTestController.list_active_tests()
+    else:
+        tests = PathologyTestController.list_all_tests()
+    return _conditional({'data': [_serialize(test, fields) for test in tests]})
+
+
+@api_v1.route('/tests/<int:test_id>')
+def get_test(test_id):
+    try:
+        fields = _requested_fields(TEST_FIELDS)
+    except ValueError as e:
+        return _error(str(e), 400)
+    try:
+        test = PathologyTestController.get_test_by_id(test_id)
+    except ValueError as e:
+        return _error(str(e), 404)
+    return _conditional({'data': _serialize(test, fields)})
+
+
+# ===== ORDERS =====
+
+@api_v1.route('/orders')
+def list_orders():
+    """
+    Orders newest first; ?status=, ?date=today or ?search= narrow the list
+    and ?archived=1 adds archived orders to a search
+    """
+    status = request.args.get('status')
+    search = request.args.get('search', '').strip()
+    try:
+        fields = _requested_fields(ORDER_FIELDS)
+        profile = _order_profile(fields)
+        if search:
+            page = LabTestOrderController.search_orders(search, profile=profile, include_archived=_archived_arg(),
+                                                        **_page_args())
+        elif request.args.get('date') == 'today':
+            page = LabTestOrderController.list_today_orders(profile=profile, **_page_args())
+        elif status:
+            page = LabTestOrderController.list_orders_by_status(status, profile=profile, **_page_args())
+        else:
+            page = LabTestOrderController.list_all_orders(profile=profile, **_page_args())
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    return _conditional({
+        'data': [_serialize(order, fields) for order in page],
+        'links': _page_links('api_v1.list_orders', page),
+        'meta': {'statuses': [s.value for s in OrderStatusEnum]},
+    })
+
+
+@api_v1.route('/orders/<int:order_id>')
+def get_order(order_id):
+    try:
+        fields = _requested_fields(ORDER_FIELDS)
+    except ValueError as e:
+        return _error(str(e), 400)
+    try:
+        order = LabTestOrderController.get_order_by_id(order_id, profile='detail', include_archived=True)
+    except ValueError as e:
+        return _error(str(e), 404)
+
+    data = _serialize(order, fields)
+    if request.args.get('include') == 'results':
+        data['results'] = [result.to_dict() for result in order.test_results]
+    return _conditional({'data': data})
+
+
+# ===== PATIENTS =====
+
+@api_v1.route('/patients')
+def find_patients():
+    """Patients filed under ?phone= (any formatting of the number), narrowed by ?name="""
+    try:
+        fields = _requested_fields(PATIENT_FIELDS)
+        found = PatientController.find_patients_by_phone(request.args.get('phone'), request.args.get('name'))
+    except ValueError as e:
+        return _error(str(e), 400)
+    if not found:
+        return _error("No patient with that phone", 404)
+    return _conditional({'data': [_serialize(patient, fields) for patient in found]})
+
+
+@api_v1.route('/patients/<int:patient_id>/orders')
+def list_patient_orders(patient_id):
+    """A patient's orders, newest first; ?archived=1 includes archived orders"""
+    try:
+        PatientController.get_patient_by_id(patient_id)
+    except ValueError as e:
+        return _error(str(e), 404)
+    try:
+        fields = _requested_fields(ORDER_FIELDS)
+        page = PatientController.list_patient_orders(patient_id, profile=_order_profile(fields),
+                                                     include_archived=_archived_arg(), **_page_args())
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    return _conditional({
+        'data': [_serialize(order, fields) for order in page],
+        'links': _page_links('api_v1.list_patient_orders', page),
+    })
+
+
+# ===== RESULTS =====
+
+@api_v1.route('/results')
+def list_results():
+    """Results newest first; ?status=Completed limits to completed results"""
+    try:
+        fields = _requested_fields(RESULT_FIELDS)
+        # Result fields are all columns, so nothing is eager-loaded
+        if request.args.get('status', '').lower() == 'completed':
+            page = LabTestResultController.list_completed_results(profile=None, **_page_args())
+        else:
+            page = LabTestResultController.list_all_results(profile=None, **_page_args())
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    return _conditional({
+        'data': [_serialize(result, fields) for result in page],
+        'links': _page_links('api_v1.list_results', page),
+    })
+
+
+@api_v1.route('/results/<int:result_id>')
+def get_result(result_id):
+    try:
+        fields = _requested_fields(RESULT_FIELDS)
+    except ValueError as e:
+        return _error(str(e), 400)
+    try:
+        result = LabTestResultController.get_result_by_id(result_id, include_archived=True)
+    except ValueError as e:
+        return _error(str(e), 404)
+    return _conditional({'data': _serialize(result, fields)})
+
+
+# ===== ANALYTICS =====
+
+@api_v1.route('/analytics/tat')
+def turnaround_times():
+    """
+    p50/p90/p99 turnaround times from the daily rollups
+    ?by=test (default) or ?by=day, ?from= / ?to= (YYYY-MM-DD), ?test_code= with by=day
+    """
+    from app.tat import tat_by_day, tat_by_test
+
+    try:
+        date_from = _iso_date(request.args.get('from'))
+        date_to = _iso_date(request.args.get('to'))
+        by = request.args.get('by', 'test')
+        if by == 'test':
+            rows = tat_by_test(date_from, date_to)
+        elif by == 'day':
+            rows = tat_by_day(date_from, date_to, test_code=request.args.get('test_code') or None)
+            for row in rows:
+                row['day'] = row['day'].isoformat()
+        else:
+            raise ValueError("by must be 'test' or 'day'")
+    except ValueError as e:
+        return _error(str(e), 400)
+    return _conditional({'data': rows})
@@ -0,0 +1,161 @@
+"""
+Archival of finished orders
+Completed and Cancelled orders never change again (can_transition_to
+allows nothing from them), yet they stay in the tables every /orders
+listing, status filter and search reads. archive_orders moves the ones
+finished more than `older_than_days` ago, with their lines, results and
+search tokens, into the *_archive tables (same ids and columns) in
+id-ordered batches, one transaction per batch. Run it from cron with
+`flask archive-orders`.
+
+Archived rows stay reachable: order and result pages fall back to the
+archive, and order search and patient history include archived orders
+when asked (include_archived=True / ?archived=1). The per-test counters
+and turnaround rollups already count archived orders, and their rebuilds
+read both tables. Date-partitioned tables would need MySQL to drop the
+foreign keys (InnoDB does not allow them on partitioned tables) and do
+not exist on SQLite, so both backends use plain archive tables.
+
+An order is left in place when:
+- it has a Draft result (that result can still be completed);
+- it changed after the turnaround rollup's watermark (the rollup runs
+  first, so no completed line leaves before it is rolled up);
+- it holds the newest order, line or result id. SQLite and MySQL before
+  8.0 hand out max(id) + 1 after a restart, so moving the newest row
+  could let a new row reuse an archived id.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, delete, func, insert, literal, select
+
+from app.models import (
+    db, LabTestOrder, LabTestOrderLine, LabTestResult, OrderSearchToken, TatRollupState,
+    LabTestOrderArchive, LabTestOrderLineArchive, LabTestResultArchive, OrderSearchTokenArchive,
+    OrderStatusEnum, ResultStatusEnum,
+)
+
+
+DEFAULT_RETENTION_DAYS = 180
+ARCHIVE_BATCH_SIZE = 500
+TERMINAL_STATUSES = (OrderStatusEnum.COMPLETED.value, OrderStatusEnum.CANCELLED.value)
+
+# (live model, archive model, column holding the order id), parents first
+ARCHIVED_TABLES = (
+    (LabTestOrder, LabTestOrderArchive, 'id'),
+    (LabTestOrderLine, LabTestOrderLineArchive, 'order_id'),
+    (LabTestResult, LabTestResultArchive, 'order_id'),
+    (OrderSearchToken, OrderSearchTokenArchive, 'order_id'),
+)
+
+
+def _cutoff(older_than_days):
+    """Archive orders last changed before this moment"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    watermark = db.session.scalar(select(TatRollupState.last_completed_at).where(TatRollupState.id == 1))
+    return min(cutoff, watermark) if watermark else cutoff
+
+
+def _pinned_order_ids():
+    """Orders holding the newest order, line and result ids"""
+    pinned = {
+        db.session.scalar(select(func.max(LabTestOrder.id))),
+        db.session.scalar(select(LabTestOrderLine.order_id).order_by(LabTestOrderLine.id.desc()).limit(1)),
+        db.session.scalar(select(LabTestResult.order_id).order_by(LabTestResult.id.desc()).limit(1)),
+    }
+    return [order_id for order_id in pinned if order_id is not None]
+
+
+def _candidates(cutoff, after_id, batch_size, pinned):
+    """The next batch of archivable order ids, by id"""
+    has_draft_result = select(LabTestResult.id).where(
+        LabTestResult.order_id == LabTestOrder.id,
+        LabTestResult.status == ResultStatusEnum.DRAFT.value,
+    ).exists()
+    stmt = (
+        select(LabTestOrder.id)
+        .where(
+            LabTestOrder.status.in_(TERMINAL_STATUSES),
+            LabTestOrder.created_at < cutoff,
+            LabTestOrder.updated_at < cutoff,
+            LabTestOrder.id > after_id,
+            LabTestOrder.patient_id.is_not(None),
+            ~has_draft_result,
+        )
+        .order_by(LabTestOrder.id)
+        .limit(batch_size)
+    )
+    if pinned:
+        stmt = stmt.where(LabTestOrder.id.not_in(pinned))
+    return list(db.session.scalars(stmt))
+
+
+def _move(order_ids, archived_at):
+    """Copy these orders' rows into the archive, then delete them (children first)"""
+    moved = {}
+    for live, archive, key in ARCHIVED_TABLES:
+        source = live.__table__
+        columns = [column.name for column in source.columns]
+        values = [source.c[name] for name in columns]
+        if archive is LabTestOrderArchive:
+            columns.append('archived_at')
+            values.append(literal(archived_at, DateTime))
+        db.session.execute(
+            insert(archive.__table__).from_select(columns, select(*values).where(source.c[key].in_(order_ids)))
+        )
+    for live, _, key in reversed(ARCHIVED_TABLES):
+        source = live.__table__
+        moved[source.name] = db.session.execute(delete(source).where(source.c[key].in_(order_ids))).rowcount
+    return moved
+
+
+def archive_orders(older_than_days=DEFAULT_RETENTION_DAYS, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None,
+                   dry_run=False):
+    """
+    Move Completed/Cancelled orders last changed more than
+    `older_than_days` ago into the archive tables, `batch_size` orders per
+    transaction, stopping after `max_batches` batches when given. With
+    dry_run nothing is written (the rollup still runs).
+    Returns {'orders', 'lines', 'results', 'batches'}.
+    """
+    if older_than_days < 1:
+        raise ValueError("Retention must be at least 1 day")
+    from app.tat import rollup
+
+    rollup()
+    cutoff = _cutoff(older_than_days)
+    pinned = _pinned_order_ids()
+    summary = {'orders': 0, 'lines': 0, 'results': 0, 'batches': 0}
+    after_id = 0
+    while max_batches is None or summary['batches'] < max_batches:
+        order_ids = _candidates(cutoff, after_id, batch_size, pinned)
+        if not order_ids:
+            break
+        after_id = order_ids[-1]
+        summary['batches'] += 1
+        if dry_run:
+            summary['orders'] += len(order_ids)
+            summary['lines'] += db.session.scalar(
+                select(func.count(LabTestOrderLine.id)).where(LabTestOrderLine.order_id.in_(order_ids))
+            )
+            summary['results'] += db.session.scalar(
+                select(func.count(LabTestResult.id)).where(LabTestResult.order_id.in_(order_ids))
+            )
+            continue
+        moved = _move(order_ids, datetime.utcnow())
+        db.session.commit()
+        summary['orders'] += moved[LabTestOrder.__tablename__]
+        summary['lines'] += moved[LabTestOrderLine.__tablename__]
+        summary['results'] += moved[LabTestResult.__tablename__]
+    db.session.rollback()
+    return summary
+
+
+def archive_status():
+    """Row counts of the live and archive order tables"""
+    return {
+        'live_orders': db.session.scalar(select(func.count(LabTestOrder.id))),
+        'archived_orders': db.session.scalar(select(func.count(LabTestOrderArchive.id))),
+        'oldest_live_order': db.session.scalar(select(func.min(LabTestOrder.created_at))),
+        'last_archived_at': db.session.scalar(select(func.max(LabTestOrderArchive.archived_at))),
+    }
@@ -0,0 +1,65 @@
+"""
+Fingerprinted static assets
+Files under app/static are also served under a content-hashed name,
+css/app.css -> /static/css/app.<sha256[:12]>.css, and templates link them
+with asset_url('css/app.css'). An edited file gets a new URL, so hashed
+URLs are cached for a year as immutable; plain names keep a short max-age
+for anything that links them directly. The manifest is built once per
+process by init_assets (restart to pick up edited assets).
+"""
+
+import hashlib
+import os
+
+from flask import abort, send_from_directory
+
+
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+PLAIN_MAX_AGE = 300
+
+
+def fingerprint(path, digest):
+    """css/app.css + digest -> css/app.<digest>.css"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def build_manifest(static_dir):
+    """{logical path: fingerprinted path} for every file under static_dir"""
+    manifest = {}
+    if not static_dir or not os.path.isdir(static_dir):
+        return manifest
+    for folder, _, filenames in os.walk(static_dir):
+        for filename in filenames:
+            full_path = os.path.join(folder, filename)
+            logical = os.path.relpath(full_path, static_dir).replace(os.sep, '/')
+            with open(full_path, 'rb') as fh:
+                digest = hashlib.sha256(fh.read()).hexdigest()
+            manifest[logical] = fingerprint(logical, digest)
+    return manifest
+
+
+def init_assets(app):
+    """Serve fingerprinted names from the static endpoint and expose asset_url() to templates"""
+    manifest = build_manifest(app.static_folder)
+    logical_by_hashed = {hashed: logical for logical, hashed in manifest.items()}
+    app.extensions['asset_manifest'] = manifest
+
+    def asset_url(path):
+        return f"{app.static_url_path}/{manifest.get(path, path)}"
+
+    def serve_static(filename):
+        logical = logical_by_hashed.get(filename)
+        if logical is None:
+            if not app.static_folder:
+                abort(404)
+            return send_from_directory(app.static_folder, filename, max_age=PLAIN_MAX_AGE)
+        response = send_from_directory(app.static_folder, logical, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.jinja_env.globals['asset_url'] = asset_url
+    if 'static' in app.view_functions:
+        app.view_functions['static'] = serve_static
@@ -0,0 +1,139 @@
+"""
+In-process cache of the pathology test catalog
+The catalog is small and changes a few times a month, but is read on every
+order form and every order creation. Each process keeps a snapshot of all
+tests plus a version stamp; after the TTL the stamp is re-probed with one
+cheap query and the snapshot is reloaded only when it changed. Writes in
+this process invalidate immediately.
+
+The stamp is led by catalog_version, a counter that every ORM flush
+touching a PathologyTest row bumps in the same transaction; max(updated_at)
+alone is not enough, as MySQL DATETIME keeps whole seconds and two edits
+within a second would share it. Row count and max(updated_at) stay in the
+stamp for edits made outside the ORM.
+"""
+
+import threading
+import time
+from datetime import datetime
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models import db, PathologyTest, CatalogVersion
+
+
+DEFAULT_TTL = 5.0
+
+_version_table = CatalogVersion.__table__
+
+
+def bump_version(session):
+    """Advance catalog_version in the session's current transaction"""
+    values = {'version': _version_table.c.version + 1, 'updated_at': datetime.utcnow()}
+    bumped = session.execute(update(_version_table).where(_version_table.c.id == 1).values(**values)).rowcount
+    if not bumped:
+        session.execute(insert(_version_table).values(id=1, version=1, updated_at=datetime.utcnow()))
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_on_catalog_write(session, flush_context, instances):
+    changed = chain(
+        session.new,
+        session.deleted,
+        (obj for obj in session.dirty if session.is_modified(obj, include_collections=False)),
+    )
+    if any(isinstance(obj, PathologyTest) for obj in changed):
+        bump_version(session)
+
+
+class TestCatalogCache:
+    """Version-stamped snapshot of PathologyTest rows, per database"""
+
+    def __init__(self, ttl_config='TEST_CATALOG_TTL'):
+        self.ttl_config = ttl_config
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.version_checks = 0
+
+    def _ttl(self):
+        return float(current_app.config.get(self.ttl_config, DEFAULT_TTL))
+
+    def _probe_version(self):
+        """One query: (catalog_version, row count, max(updated_at))"""
+        self.version_checks += 1
+        counter = select(_version_table.c.version).where(_version_table.c.id == 1).scalar_subquery()
+        return tuple(db.session.execute(
+            select(counter, func.count(PathologyTest.id), func.max(PathologyTest.updated_at))
+        ).one())
+
+    def _load(self):
+        """Load every test into detached instances, outside the request session"""
+        with Session(db.engine) as session:
+            tests = session.scalars(select(PathologyTest).order_by(PathologyTest.id)).all()
+            session.expunge_all()
+        return tests
+
+    def _snapshot(self):
+        key = str(db.engine.url)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now < entry['checked_at'] + self._ttl():
+                self.hits += 1
+                return entry
+
+            version = self._probe_version()
+            if entry and entry['version'] == version:
+                entry['checked_at'] = now
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            tests = self._load()
+            entry = {
+                'version': version,
+                'checked_at': now,
+                'tests': tests,
+                'by_id': {test.id: test for test in tests},
+            }
+            self._entries[key] = entry
+            return entry
+
+    def all(self):
+        """All tests (detached; read-only)"""
+        return list(self._snapshot()['tests'])
+
+    def active(self):
+        """Active tests (detached; read-only)"""
+        return [test for test in self._snapshot()['tests'] if test.is_active]
+
+    def get(self, test_id):
+        """A single test by ID (detached; read-only) or None"""
+        return self._snapshot()['by_id'].get(test_id)
+
+    def invalidate(self):
+        """Drop the snapshot for the current database"""
+        with self._lock:
+            self._entries.pop(str(db.engine.url), None)
+
+    def stats(self):
+        """Hit/miss counters and the current version stamp"""
+        entry = self._entries.get(str(db.engine.url))
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'version_checks': self.version_checks,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'cached_tests': len(entry['tests']) if entry else 0,
+            'version': [value.isoformat() if isinstance(value, datetime) else value for value in entry['version']]
+            if entry else None,
+        }
+
+
+test_catalog = TestCatalogCache()
@@ -0,0 +1,90 @@
+"""
+Response compression for Pathology module
+An after_request hook compresses HTML, CSS, JavaScript and JSON responses
+with brotli (when the `brotli` package is installed) or gzip, whichever
+the client's Accept-Encoding prefers; the listing pages shrink more than
+ten-fold, which matters for branch labs on slow links.
+
+Skipped: responses under COMPRESSION_MIN_SIZE bytes, non-200 responses
+(304s have no body), streamed responses (the CSV/NDJSON exports) and
+anything already encoded. Static files are buffered up to
+COMPRESSION_MAX_SIZE. ETags become weak, as the encoded bytes differ from
+the identity representation. Disable with COMPRESSION_ENABLED = False,
+e.g. behind a proxy that compresses.
+"""
+
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+
+DEFAULT_MIN_SIZE = 500
+DEFAULT_MAX_SIZE = 4 * 1024 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'image/svg+xml',
+}
+
+
+def available_encodings():
+    """Encodings this process can produce, most preferred first"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def encode(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _compressible(response, min_size, max_size):
+    if response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    length = response.content_length
+    if response.direct_passthrough:
+        # File responses (static assets) know their length; anything else streams
+        return length is not None and min_size <= length <= max_size
+    return not response.is_streamed and (length is None or length >= min_size)
+
+
+def init_compression(app):
+    """Register the compression hook unless COMPRESSION_ENABLED is False"""
+    if not app.config.get('COMPRESSION_ENABLED', True):
+        return
+
+    @app.after_request
+    def compress_response(response):
+        min_size = app.config.get('COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+        max_size = app.config.get('COMPRESSION_MAX_SIZE', DEFAULT_MAX_SIZE)
+        if not _compressible(response, min_size, max_size):
+            return response
+        # Whether or not we compress, caches must key on Accept-Encoding
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(available_encodings())
+        if encoding is None:
+            return response
+
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(encode(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,183 @@
+"""
+Environment-driven configuration for Pathology module
+Settings come from the process environment (and a .env file next to
+run.py when python-dotenv is installed), so the same code runs under the
+dev server, gunicorn and the benchmarks without edits.
+
+Database / pool settings:
+    DATABASE_URL          SQLAlchemy URI (default: local XAMPP MySQL)
+    DB_POOL_SIZE          persistent connections per worker process (5)
+    DB_MAX_OVERFLOW       extra burst connections per worker process (10)
+    DB_POOL_TIMEOUT       seconds to wait for a free connection (30)
+    DB_POOL_RECYCLE       seconds before a connection is replaced (1800);
+                          keep it below MySQL's wait_timeout
+    DB_POOL_PRE_PING      test connections on checkout (true)
+    DB_POOL_METRICS       record checkout wait times (true, see app.poolstats)
+    DB_ECHO               log SQL (false)
+    REPLICA_DATABASE_URL  read replica URI (optional, see app.routing)
+    REPLICA_STICKY_SECONDS  read from the primary this long after a write (5)
+    SCHEMA_BOOT_MODE      check / warn / create / off (check, see app.migrations);
+                          check refuses to boot on a missing or old schema
+
+Background jobs (see app.jobs):
+    JOB_MAX_ATTEMPTS      tries before a job is marked dead (5)
+    REPORT_OUTPUT_DIR     where result reports are written (instance/reports)
+    SMS_OUTBOX_PATH       SMS gateway stub output (instance/sms_outbox.jsonl)
+    LIS_PUSH_URL          POST completed results here (optional)
+
+Sizing under gunicorn: every worker process has its own pool, so the
+server sees up to workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+A sync worker serves one request at a time and needs one connection; a
+gthread worker needs about one per thread. Keep that total under MySQL's
+max_connections minus headroom for cron jobs and admin sessions, and
+raise DB_POOL_SIZE only when the checkout wait metrics show queueing.
+`flask pool-advice` does this arithmetic. If gunicorn runs with
+--preload, call db.engine.dispose(close=False) in its post_fork hook so
+workers do not share the master's connections.
+"""
+
+import os
+
+from sqlalchemy.engine import make_url
+
+from app.poolstats import TimedQueuePool
+
+
+DEFAULT_DATABASE_URI = 'mysql+pymysql://root:@localhost:3306/pathology_db'  # MySQL from XAMPP
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_TIMEOUT = 30
+DEFAULT_POOL_RECYCLE = 1800
+CONNECTION_HEADROOM = 10
+
+_TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+# (config key, parser, default) read from the environment by load_config
+_ENV_SETTINGS = (
+    ('DB_POOL_SIZE', int, DEFAULT_POOL_SIZE),
+    ('DB_MAX_OVERFLOW', int, DEFAULT_MAX_OVERFLOW),
+    ('DB_POOL_TIMEOUT', int, DEFAULT_POOL_TIMEOUT),  # Flask-SQLAlchemy's engine_from_config coerces to int
+    ('DB_POOL_RECYCLE', int, DEFAULT_POOL_RECYCLE),
+    ('DB_POOL_PRE_PING', 'bool', True),
+    ('DB_POOL_METRICS', 'bool', True),
+    ('DB_ECHO', 'bool', False),
+    ('ORDER_ID_BLOCK_SIZE', int, None),
+    ('TEST_CATALOG_TTL', float, None),
+    ('DASHBOARD_CACHE_TTL', float, None),
+    ('PAGE_CACHE_SIZE', int, None),
+    ('PAGE_CACHE_SETTLE_SECONDS', float, None),
+    ('COMPRESSION_ENABLED', 'bool', None),
+    ('COMPRESSION_MIN_SIZE', int, None),
+    ('PROFILING_ENABLED', 'bool', None),
+    ('PROFILING_N_PLUS_ONE_THRESHOLD', int, None),
+    ('REPLICA_STICKY_SECONDS', float, None),
+    ('SCHEMA_BOOT_MODE', str, None),
+    ('JOB_MAX_ATTEMPTS', int, None),
+    ('REPORT_OUTPUT_DIR', str, None),
+    ('SMS_OUTBOX_PATH', str, None),
+    ('LIS_PUSH_URL', str, None),
+)
+
+
+def _parse(value, parser):
+    if parser == 'bool':
+        return value.strip().lower() in _TRUE_VALUES
+    return parser(value)
+
+
+def load_dotenv_file():
+    """Load .env from the project root if python-dotenv is installed"""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return False
+    return load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
+
+
+def load_config(environ=None):
+    """Build the app config dict from the environment"""
+    if environ is None:
+        load_dotenv_file()
+        environ = os.environ
+
+    config = {
+        'SQLALCHEMY_DATABASE_URI': environ.get('DATABASE_URL', DEFAULT_DATABASE_URI),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SECRET_KEY': environ.get('SECRET_KEY', 'dev-secret-key-change-in-production'),
+        'JSON_SORT_KEYS': False,
+    }
+    if environ.get('REPLICA_DATABASE_URL'):
+        config['REPLICA_DATABASE_URI'] = environ['REPLICA_DATABASE_URL']
+    for key, parser, default in _ENV_SETTINGS:
+        raw = environ.get(key)
+        if raw is not None and raw.strip():
+            try:
+                config[key] = _parse(raw, parser)
+            except ValueError:
+                raise ValueError(f"Invalid value for {key}: {raw!r}")
+        elif default is not None:
+            config[key] = default
+    return config
+
+
+def engine_options(config):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for a config dict
+    Pool settings apply to server databases and file-based SQLite (both use
+    QueuePool); in-memory SQLite keeps its single-connection pool. Options
+    already present in SQLALCHEMY_ENGINE_OPTIONS win.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = {}
+    if config.get('DB_ECHO'):
+        options['echo'] = True
+
+    in_memory = url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+    if not in_memory:
+        options.update({
+            'pool_size': config.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+            'max_overflow': config.get('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW),
+            'pool_timeout': config.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT),
+            'pool_recycle': config.get('DB_POOL_RECYCLE', DEFAULT_POOL_RECYCLE),
+            'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+        })
+        if config.get('DB_POOL_METRICS', True):
+            options['poolclass'] = TimedQueuePool
+
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def replica_bind(config):
+    """SQLALCHEMY_BINDS entry for REPLICA_DATABASE_URI, pooled like the primary"""
+    uri = config['REPLICA_DATABASE_URI']
+    return {'url': uri, **engine_options({**config, 'SQLALCHEMY_DATABASE_URI': uri})}
+
+
+def pool_sizing(workers, threads=1, max_connections=151, headroom=CONNECTION_HEADROOM):
+    """
+    Per-worker pool sizes that fit `workers` gunicorn processes under a
+    server's max_connections (MySQL default 151)
+
+    Returns {'pool_size', 'max_overflow', 'per_worker', 'total'}; raises
+    ValueError when even one connection per thread does not fit.
+    """
+    if workers < 1 or threads < 1:
+        raise ValueError("Workers and threads must be at least 1")
+    budget = (max_connections - headroom) // workers
+    if budget < threads:
+        raise ValueError(
+            f"{workers} worker(s) x {threads} thread(s) need {workers * threads} connections, "
+            f"but max_connections {max_connections} leaves {max_connections - headroom}; "
+            f"reduce workers or raise max_connections"
+        )
+    pool_size = threads
+    max_overflow = min(budget - pool_size, max(threads, DEFAULT_MAX_OVERFLOW))
+    per_worker = pool_size + max_overflow
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'per_worker': per_worker,
+        'total': per_worker * workers,
+    }
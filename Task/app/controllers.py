@@ -4,17 +4,143 @@ Handles all server-side validations and state management
 """
 
 from datetime import datetime, date
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import joinedload, selectinload
 from app.models import (
-    db, PathologyTest, LabTestOrder, LabTestResult,
-    NamingSeries, OrderStatusEnum, ResultStatusEnum
+    db, PathologyTest, Patient, LabTestOrder, LabTestOrderLine, LabTestResult,
+    LabTestOrderArchive, LabTestOrderLineArchive, LabTestResultArchive,
+    OrderStatusEnum, ResultStatusEnum, VALID_ORDER_TRANSITIONS, ORDER_STATUS_TIMESTAMPS
 )
+from app.pagination import keyset_paginate, keyset_paginate_merged
+from app.sequences import order_id_allocator
+from app.catalog import test_catalog
+from app import jobs, order_stats, patients, ranges, search
+from app.routing import read_only, writes
+
+
+def _loading_profiles():
+    """
+    Named eager-loading profiles per model
+    - list: everything a list page row touches, loaded with the page itself
+    - detail: everything a detail page touches, for a single row
+    Built lazily because backref attributes only exist once mappers are configured.
+    """
+    return {
+        LabTestOrder: {
+            'list': [
+                joinedload(LabTestOrder.test),
+                selectinload(LabTestOrder.lines).joinedload(LabTestOrderLine.test),
+            ],
+            'detail': [
+                joinedload(LabTestOrder.test),
+                selectinload(LabTestOrder.lines).options(
+                    joinedload(LabTestOrderLine.test), selectinload(LabTestOrderLine.result),
+                ),
+                selectinload(LabTestOrder.test_results),
+            ],
+        },
+        LabTestResult: {
+            'list': [
+                joinedload(LabTestResult.order),
+                joinedload(LabTestResult.line).joinedload(LabTestOrderLine.test),
+            ],
+            'detail': [
+                joinedload(LabTestResult.order),
+                joinedload(LabTestResult.line).joinedload(LabTestOrderLine.test),
+            ],
+        },
+        LabTestOrderArchive: {
+            'list': [
+                joinedload(LabTestOrderArchive.test),
+                selectinload(LabTestOrderArchive.lines).joinedload(LabTestOrderLineArchive.test),
+            ],
+            'detail': [
+                joinedload(LabTestOrderArchive.test),
+                selectinload(LabTestOrderArchive.lines).options(
+                    joinedload(LabTestOrderLineArchive.test), selectinload(LabTestOrderLineArchive.result),
+                ),
+                selectinload(LabTestOrderArchive.test_results),
+            ],
+        },
+        LabTestResultArchive: {
+            'detail': [
+                joinedload(LabTestResultArchive.order),
+                joinedload(LabTestResultArchive.line).joinedload(LabTestOrderLineArchive.test),
+            ],
+        },
+    }
+
+
+MAX_BATCH_SIZE = 1000
+MAX_ORDER_LINES = 50
+
+
+def _parse_optional_float(value, label):
+    """Parse an optional numeric form field ('' or None -> None)"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"{label} must be a number")
+
+
+def _parse_batch_ids(ids):
+    """Validate a batch of integer IDs, dropping duplicates but keeping order"""
+    parsed = []
+    seen = set()
+    for raw in ids or []:
+        try:
+            value = int(raw)
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid ID: {raw}")
+        if value not in seen:
+            seen.add(value)
+            parsed.append(value)
+    if not parsed:
+        raise ValueError("No IDs selected")
+    if len(parsed) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} IDs can be processed per batch")
+    return parsed
+
+
+def _parse_test_ids(test_ids):
+    """One test ID or a list of them -> list of ints, rejecting repeats"""
+    if isinstance(test_ids, (int, str)):
+        test_ids = [test_ids]
+    parsed = []
+    for raw in test_ids or []:
+        try:
+            value = int(raw)
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid test ID: {raw}")
+        if value in parsed:
+            raise ValueError(f"Test with ID {value} is listed more than once")
+        parsed.append(value)
+    if not parsed:
+        raise ValueError("Select at least one test")
+    if len(parsed) > MAX_ORDER_LINES:
+        raise ValueError(f"An order can have at most {MAX_ORDER_LINES} tests")
+    return parsed
+
+
+def with_profile(query, model, profile):
+    """Apply a named loading profile to a query (None leaves it lazy)"""
+    if profile is None:
+        return query
+    profiles = _loading_profiles().get(model, {})
+    if profile not in profiles:
+        raise ValueError(f"Unknown loading profile '{profile}' for {model.__name__}")
+    return query.options(*profiles[profile])
 
 
 class PathologyTestController:
     """Controller for Pathology Test operations"""
 
     @staticmethod
-    def create_test(test_name, test_code, sample_type, normal_range, price, is_active=True):
+    @writes
+    def create_test(test_name, test_code, sample_type, normal_range, price, is_active=True,
+                    critical_low=None, critical_high=None):
         """
         Create a new pathology test
         Validations:
@@ -53,35 +179,67 @@ class PathologyTestController:
             sample_type=sample_type,
             normal_range=normal_range,
             price=price_float,
-            is_active=is_active
+            is_active=is_active,
+            critical_low=_parse_optional_float(critical_low, "Critical low"),
+            critical_high=_parse_optional_float(critical_high, "Critical high"),
         )
+        ranges.apply_parsed_range(test)
         db.session.add(test)
+        db.session.flush()
+        order_stats.ensure_stats_row(test.id)
         db.session.commit()
+        test_catalog.invalidate()
         return test
 
     @staticmethod
+    @read_only
     def list_active_tests():
-        """Get all active tests"""
-        return PathologyTest.query.filter_by(is_active=True).all()
+        """Get all active tests (served from the test catalog cache)"""
+        return [db.session.merge(test, load=False) for test in test_catalog.active()]
 
     @staticmethod
+    @read_only
     def list_all_tests():
         """Get all tests (active and inactive)"""
         return PathologyTest.query.all()
 
     @staticmethod
+    @read_only
     def search_tests(search_term):
-        """Search tests by name or code"""
+        """Search tests by name or code (ranked, from the test catalog cache)"""
         if not search_term:
             return PathologyTest.query.all()
         
-        search_pattern = f"%{search_term}%"
-        return PathologyTest.query.filter(
-            (PathologyTest.test_name.ilike(search_pattern)) |
-            (PathologyTest.test_code.ilike(search_pattern))
-        ).all()
+        return [db.session.merge(test, load=False)
+                for test in search.rank_tests(test_catalog.all(), search_term)]
+
+    @staticmethod
+    @read_only
+    def get_order_stats(test_ids=None):
+        """
+        Order counts and revenue per test from the test_order_stats counters
+        Returns {test_id: {'order_count', 'completed_count', 'cancelled_count', 'revenue'}}
+        """
+        return order_stats.stats_for(test_ids)
+
+    @staticmethod
+    def sort_tests(tests, stats, sort=None, descending=False):
+        """Sort tests by code, name, price, orders or revenue (stats from get_order_stats)"""
+        sort_keys = {
+            'code': lambda test: test.test_code.lower(),
+            'name': lambda test: test.test_name.lower(),
+            'price': lambda test: test.price,
+            'orders': lambda test: stats.get(test.id, order_stats.EMPTY_STATS)['order_count'],
+            'revenue': lambda test: stats.get(test.id, order_stats.EMPTY_STATS)['revenue'],
+        }
+        if not sort:
+            return list(tests)
+        if sort not in sort_keys:
+            raise ValueError(f"Invalid sort: {sort}")
+        return sorted(tests, key=sort_keys[sort], reverse=descending)
 
     @staticmethod
+    @read_only
     def get_test_by_id(test_id):
         """Get a single test by ID"""
         test = PathologyTest.query.get(test_id)
@@ -90,6 +248,20 @@ class PathologyTestController:
         return test
 
     @staticmethod
+    @read_only
+    def get_cached_test(test_id):
+        """
+        Get a read-only test snapshot by ID from the test catalog cache
+        Use for validation only; use get_test_by_id for anything that
+        modifies the test or walks its relationships.
+        """
+        test = test_catalog.get(test_id)
+        if not test:
+            raise ValueError(f"Test with ID {test_id} not found")
+        return test
+
+    @staticmethod
+    @writes
     def update_test(test_id, **kwargs):
         """
         Update test details
@@ -119,13 +291,28 @@ class PathologyTestController:
         if 'is_active' in kwargs:
             test.is_active = kwargs['is_active']
 
+        ranges_changed = False
         if 'normal_range' in kwargs:
             if not kwargs['normal_range'].strip():
                 raise ValueError("Normal range cannot be empty")
-            test.normal_range = kwargs['normal_range']
+            if kwargs['normal_range'] != test.normal_range:
+                test.normal_range = kwargs['normal_range']
+                ranges.apply_parsed_range(test)
+                ranges_changed = True
+
+        for field, label in (('critical_low', "Critical low"), ('critical_high', "Critical high")):
+            if field in kwargs:
+                value = _parse_optional_float(kwargs[field], label)
+                if value != getattr(test, field):
+                    setattr(test, field, value)
+                    ranges_changed = True
 
         test.updated_at = datetime.utcnow()
+        if ranges_changed:
+            db.session.flush()
+            ranges.reflag_results(test_id=test.id)
         db.session.commit()
+        test_catalog.invalidate()
         return test
 
 
@@ -133,30 +320,42 @@ class LabTestOrderController:
     """Controller for Lab Test Order operations"""
 
     @staticmethod
-    def _get_or_create_naming_series():
-        """Get or create the naming series for orders"""
-        series = NamingSeries.query.filter_by(series_name='LabTestOrder').first()
-        if not series:
-            series = NamingSeries(
-                series_name='LabTestOrder',
-                series_prefix='LTO-',
-                current_number=1000
-            )
-            db.session.add(series)
-            db.session.commit()
-        return series
+    def _parse_order_date(order_date, today):
+        """Parse an order date (YYYY-MM-DD or date) and reject past dates"""
+        try:
+            if isinstance(order_date, str):
+                order_date_obj = datetime.strptime(order_date.strip(), '%Y-%m-%d').date()
+            else:
+                order_date_obj = order_date
+        except (ValueError, TypeError):
+            raise ValueError("Invalid order date format (use YYYY-MM-DD)")
+
+        if not isinstance(order_date_obj, date):
+            raise ValueError("Invalid order date format (use YYYY-MM-DD)")
+        if order_date_obj < today:
+            raise ValueError("Order date cannot be in the past")
+        return order_date_obj
 
     @staticmethod
-    def create_order(patient_name, patient_phone, test_id, order_date):
+    @writes
+    def create_order(patient_name, patient_phone, test_id=None, order_date=None, test_ids=None):
         """
-        Create a new lab test order
+        Create a new lab test order for one or more tests
         
         Business Rules:
-        - Patient name and phone are required
-        - Test must exist and be active
+        - Patient name and phone are required and are kept on the order;
+          it is filed under the patient with that (normalized) phone and
+          name, created if new
+        - Every test must exist and be active, and appear once
         - Order date cannot be in the past
         - Default status is Draft
-        - Order ID is auto-generated using naming series
+        - Order ID comes from the naming series via order_id_allocator
+          (app.sequences), out of a block reserved up front
+        
+        test_ids is a list of test IDs; each becomes an order line (CBC +
+        LFT + TSH is one order with three lines). test_id is the single-test
+        form of the same argument and also accepts a list. The order and its
+        lines are written in a single transaction.
         """
         # Validate inputs
         if not patient_name or not patient_name.strip():
@@ -164,76 +363,203 @@ class LabTestOrderController:
         if not patient_phone or not patient_phone.strip():
             raise ValueError("Patient phone is required")
 
-        # Validate test exists and is active
-        try:
-            test = PathologyTestController.get_test_by_id(test_id)
-        except ValueError as e:
-            raise ValueError(f"Invalid test: {str(e)}")
+        if test_id is not None and test_ids is not None:
+            raise ValueError("Pass test_id or test_ids, not both")
 
-        if not test.is_active:
-            raise ValueError(f"Test '{test.test_name}' is not active and cannot be ordered")
+        # Validate tests exist and are active
+        tests = []
+        for test_id in _parse_test_ids(test_ids if test_ids is not None else test_id):
+            try:
+                test = PathologyTestController.get_cached_test(test_id)
+            except ValueError as e:
+                raise ValueError(f"Invalid test: {str(e)}")
+            if not test.is_active:
+                raise ValueError(f"Test '{test.test_name}' is not active and cannot be ordered")
+            tests.append(test)
 
         # Validate order date
-        try:
-            if isinstance(order_date, str):
-                order_date_obj = datetime.strptime(order_date, '%Y-%m-%d').date()
-            else:
-                order_date_obj = order_date
-        except (ValueError, TypeError):
-            raise ValueError("Invalid order date format (use YYYY-MM-DD)")
-
-        if order_date_obj < date.today():
-            raise ValueError("Order date cannot be in the past")
+        order_date_obj = LabTestOrderController._parse_order_date(order_date, date.today())
 
         # Generate order ID
-        series = LabTestOrderController._get_or_create_naming_series()
-        order_id = series.get_next_name()
+        order_id = order_id_allocator.next_name()
 
         # Create order with Draft status
         order = LabTestOrder(
             order_id=order_id,
-            patient_name=patient_name,
-            patient_phone=patient_phone,
-            test_id=test_id,
+            patient_id=patients.resolve_patient(patient_name, patient_phone),
+            patient_name=patient_name.strip(),
+            patient_phone=patient_phone.strip(),
+            test_id=tests[0].id,
             order_date=order_date_obj,
-            status=OrderStatusEnum.DRAFT.value
+            status=OrderStatusEnum.DRAFT.value,
+            lines=[
+                LabTestOrderLine(line_no=line_no, test_id=test.id, price=test.price)
+                for line_no, test in enumerate(tests, start=1)
+            ],
         )
         db.session.add(order)
+        db.session.flush()
+        search.index_orders([(order.id, order.order_id, order.patient_name, order.patient_phone)])
+        order_stats.orders_created([test.id for test in tests])
         db.session.commit()
         return order
 
     @staticmethod
-    def list_all_orders():
-        """Get all orders"""
-        return LabTestOrder.query.order_by(LabTestOrder.created_at.desc()).all()
+    @writes
+    def bulk_create_orders(rows, chunk_size=1000):
+        """
+        Create many Draft orders in one transaction (collection camps)
+
+        Each row is a dict with patient_name, patient_phone, order_date and
+        either test_code or test_id; several tests for one visit are joined
+        with '+' (e.g. "CBC+LFT+TSH") and become lines of one order. Rows
+        are validated against one preloaded test map, order IDs are reserved
+        in one batch and orders and lines are inserted with executemany in
+        chunks of `chunk_size`.
+        Invalid rows are skipped and reported; they never abort the batch.
+
+        Returns {'created': int, 'order_ids': [...], 'failed': [{'row', 'error', 'data'}]}
+        """
+        tests_by_id = {}
+        tests_by_code = {}
+        for test in test_catalog.all():
+            tests_by_id[test.id] = test
+            tests_by_code[test.test_code.upper()] = test
+
+        today = date.today()
+        valid = []
+        valid_tests = []
+        valid_patients = []
+        failed = []
+        for row_number, row in enumerate(rows, start=1):
+            try:
+                if row.get('_error'):
+                    raise ValueError(row['_error'])
+                patient_name = str(row.get('patient_name') or '').strip()
+                patient_phone = str(row.get('patient_phone') or '').strip()
+                if not patient_name:
+                    raise ValueError("Patient name is required")
+                if not patient_phone:
+                    raise ValueError("Patient phone is required")
+
+                tests = []
+                test_codes = [code.strip() for code in str(row.get('test_code') or '').split('+') if code.strip()]
+                if test_codes:
+                    for test_code in test_codes:
+                        test = tests_by_code.get(test_code.upper())
+                        if not test:
+                            raise ValueError(f"Invalid test: Test code '{test_code}' not found")
+                        tests.append(test)
+                else:
+                    raw_ids = [raw for raw in str(row.get('test_id') or '').split('+') if raw.strip()]
+                    if not raw_ids:
+                        raise ValueError("Test code or test ID is required")
+                    for test_id in _parse_test_ids(raw_ids):
+                        test = tests_by_id.get(test_id)
+                        if not test:
+                            raise ValueError(f"Invalid test: Test with ID {test_id} not found")
+                        tests.append(test)
+                if len({test.id for test in tests}) != len(tests):
+                    raise ValueError("A test is listed more than once")
+                for test in tests:
+                    if not test.is_active:
+                        raise ValueError(f"Test '{test.test_name}' is not active and cannot be ordered")
+
+                order_date_obj = LabTestOrderController._parse_order_date(row.get('order_date'), today)
+            except ValueError as e:
+                failed.append({'row': row_number, 'error': str(e), 'data': row})
+                continue
+
+            valid.append({
+                'patient_name': patient_name,
+                'patient_phone': patient_phone,
+                'test_id': tests[0].id,
+                'order_date': order_date_obj,
+            })
+            valid_tests.append(tests)
+            valid_patients.append((patient_name, patient_phone))
+
+        order_ids = order_id_allocator.next_names(len(valid)) if valid else []
+        now = datetime.utcnow()
+        for values, order_id in zip(valid, order_ids):
+            values.update(
+                order_id=order_id,
+                status=OrderStatusEnum.DRAFT.value,
+                created_at=now,
+                updated_at=now,
+            )
+
+        try:
+            insert_stmt = LabTestOrder.__table__.insert()
+            for start in range(0, len(valid), chunk_size):
+                chunk_ids = order_ids[start:start + chunk_size]
+                chunk_patients = valid_patients[start:start + chunk_size]
+                patient_ids = patients.resolve_patients(chunk_patients)
+                for values, (patient_name, patient_phone) in zip(valid[start:start + chunk_size], chunk_patients):
+                    values['patient_id'] = patient_ids[patients.patient_key(patient_name, patient_phone)]
+                db.session.execute(insert_stmt, valid[start:start + chunk_size])
+                # One lookup gives the new primary keys for both the lines and the search index
+                created = db.session.execute(
+                    select(LabTestOrder.id, LabTestOrder.order_id, LabTestOrder.patient_name, LabTestOrder.patient_phone)
+                    .where(LabTestOrder.order_id.in_(chunk_ids))
+                ).all()
+                pk_by_order_id = {row.order_id: row.id for row in created}
+                db.session.execute(insert(LabTestOrderLine.__table__), [
+                    {'order_id': pk_by_order_id[order_id], 'line_no': line_no, 'test_id': test.id,
+                     'price': test.price, 'created_at': now}
+                    for order_id, tests in zip(chunk_ids, valid_tests[start:start + chunk_size])
+                    for line_no, test in enumerate(tests, start=1)
+                ])
+                search.index_orders(created)
+            order_stats.orders_created(test.id for tests in valid_tests for test in tests)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return {'created': len(valid), 'order_ids': order_ids, 'failed': failed}
+
+    @staticmethod
+    @read_only
+    def list_all_orders(cursor=None, direction='next', per_page=None, profile='list'):
+        """Get one page of all orders, newest first"""
+        query = with_profile(LabTestOrder.query, LabTestOrder, profile)
+        return keyset_paginate(query, LabTestOrder,
+                               cursor=cursor, direction=direction, per_page=per_page)
 
     @staticmethod
-    def list_today_orders():
-        """Get all orders scheduled for today"""
+    @read_only
+    def list_today_orders(cursor=None, direction='next', per_page=None, profile='list'):
+        """Get one page of orders scheduled for today"""
         today = date.today()
-        return LabTestOrder.query.filter_by(order_date=today).order_by(
-            LabTestOrder.created_at.desc()
-        ).all()
+        query = with_profile(LabTestOrder.query, LabTestOrder, profile).filter_by(order_date=today)
+        return keyset_paginate(query, LabTestOrder,
+                               cursor=cursor, direction=direction, per_page=per_page)
 
     @staticmethod
-    def list_orders_by_status(status):
-        """Get all orders with specific status"""
+    @read_only
+    def list_orders_by_status(status, cursor=None, direction='next', per_page=None, profile='list'):
+        """Get one page of orders with specific status"""
         valid_statuses = [s.value for s in OrderStatusEnum]
         if status not in valid_statuses:
             raise ValueError(f"Invalid status: {status}")
-        return LabTestOrder.query.filter_by(status=status).order_by(
-            LabTestOrder.created_at.desc()
-        ).all()
+        query = with_profile(LabTestOrder.query, LabTestOrder, profile).filter_by(status=status)
+        return keyset_paginate(query, LabTestOrder,
+                               cursor=cursor, direction=direction, per_page=per_page)
 
     @staticmethod
-    def get_order_by_id(order_id):
-        """Get a single order by ID"""
-        order = LabTestOrder.query.get(order_id)
+    @read_only
+    def get_order_by_id(order_id, profile=None, include_archived=False):
+        """Get a single order by ID (falling back to the archive when include_archived)"""
+        order = with_profile(LabTestOrder.query, LabTestOrder, profile).get(order_id)
+        if not order and include_archived:
+            order = with_profile(LabTestOrderArchive.query, LabTestOrderArchive, profile).get(order_id)
         if not order:
             raise ValueError(f"Order with ID {order_id} not found")
         return order
 
     @staticmethod
+    @read_only
     def get_order_by_order_id(order_id_str):
         """Get a single order by order_id string (e.g., LTO-1001)"""
         order = LabTestOrder.query.filter_by(order_id=order_id_str).first()
@@ -242,6 +568,7 @@ class LabTestOrderController:
         return order
 
     @staticmethod
+    @writes
     def transition_status(order_id, new_status):
         """
         Transition order status with validation
@@ -266,40 +593,185 @@ class LabTestOrderController:
                 f"Valid transitions from {order.status}: {order.can_transition_to.__doc__}"
             )
 
-        order.status = new_status
-        order.updated_at = datetime.utcnow()
+        order.set_status(new_status)
+        order_stats.orders_moved([(line.test_id, line.price) for line in order.lines], new_status)
         db.session.commit()
         return order
 
     @staticmethod
-    def search_orders(search_term):
-        """Search orders by order_id or patient name"""
-        if not search_term:
-            return LabTestOrder.query.all()
-        
-        search_pattern = f"%{search_term}%"
-        return LabTestOrder.query.filter(
-            (LabTestOrder.order_id.ilike(search_pattern)) |
-            (LabTestOrder.patient_name.ilike(search_pattern))
-        ).order_by(LabTestOrder.created_at.desc()).all()
+    @writes
+    def batch_transition_status(order_ids, new_status):
+        """
+        Transition many orders to `new_status` in one transaction
+
+        Orders are loaded in one query and checked with can_transition_to in
+        memory; valid ones move with a single set-based UPDATE, guarded on
+        their previous status. Invalid or missing IDs are reported and skipped.
+
+        Returns {'updated': int, 'outcomes': [{'id', 'ok', 'status' | 'error'}]}
+        """
+        valid_statuses = [s.value for s in OrderStatusEnum]
+        if new_status not in valid_statuses:
+            raise ValueError(f"Invalid status: {new_status}")
+
+        order_ids = _parse_batch_ids(order_ids)
+        orders = {order.id: order for order in LabTestOrder.query.filter(LabTestOrder.id.in_(order_ids)).all()}
+
+        outcomes = {}
+        valid = []
+        for order_id in order_ids:
+            order = orders.get(order_id)
+            if not order:
+                outcomes[order_id] = {'id': order_id, 'ok': False, 'error': f"Order with ID {order_id} not found"}
+            elif not order.can_transition_to(new_status):
+                outcomes[order_id] = {
+                    'id': order_id, 'ok': False,
+                    'error': f"Cannot transition from {order.status} to {new_status}",
+                }
+            else:
+                valid.append(order_id)
+
+        if valid:
+            from_statuses = [
+                current for current, targets in VALID_ORDER_TRANSITIONS.items() if new_status in targets
+            ]
+            now = datetime.utcnow()
+            values = {'status': new_status, 'updated_at': now}
+            if new_status in ORDER_STATUS_TIMESTAMPS:
+                values[ORDER_STATUS_TIMESTAMPS[new_status]] = now
+            try:
+                updated = db.session.execute(
+                    update(LabTestOrder)
+                    .where(LabTestOrder.id.in_(valid), LabTestOrder.status.in_(from_statuses))
+                    .values(**values)
+                ).rowcount
+                if updated != len(valid):
+                    # Another request moved some of these since we loaded them
+                    raise ValueError("Some orders changed while updating the batch; please retry")
+                if new_status == OrderStatusEnum.COMPLETED.value:
+                    db.session.execute(
+                        update(LabTestOrderLine)
+                        .where(LabTestOrderLine.order_id.in_(valid), LabTestOrderLine.completed_at.is_(None))
+                        .values(completed_at=now)
+                    )
+                order_stats.orders_moved(db.session.execute(
+                    select(LabTestOrderLine.test_id, LabTestOrderLine.price).where(LabTestOrderLine.order_id.in_(valid))
+                ).all(), new_status)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            for order_id in valid:
+                outcomes[order_id] = {'id': order_id, 'ok': True, 'status': new_status}
+
+        return {
+            'updated': len(valid),
+            'outcomes': [outcomes[order_id] for order_id in order_ids],
+        }
+
+    @staticmethod
+    @read_only
+    def search_orders(search_term, cursor=None, direction='next', per_page=None, profile='list',
+                      include_archived=False):
+        """
+        Search orders by order ID, patient name or phone, one page at a time
+        Uses the trigram index (app.search); results are ranked by match
+        quality, then newest first. include_archived also searches the
+        archived orders (app.archive).
+        """
+        query = with_profile(LabTestOrder.query, LabTestOrder, profile)
+        archive_query = None
+        if include_archived:
+            archive_query = with_profile(LabTestOrderArchive.query, LabTestOrderArchive, profile)
+        if not search_term or not search_term.strip():
+            if archive_query is not None:
+                return keyset_paginate_merged([(query, LabTestOrder), (archive_query, LabTestOrderArchive)],
+                                              cursor=cursor, direction=direction, per_page=per_page)
+            return keyset_paginate(query, LabTestOrder,
+                                   cursor=cursor, direction=direction, per_page=per_page)
+        return search.search_orders(query, search_term, archive_query=archive_query,
+                                    cursor=cursor, direction=direction, per_page=per_page)
+
+
+class PatientController:
+    """Controller for Patient lookups and history"""
+
+    @staticmethod
+    @read_only
+    def get_patient_by_id(patient_id):
+        """Get a single patient by ID"""
+        patient = db.session.get(Patient, patient_id)
+        if not patient:
+            raise ValueError(f"Patient with ID {patient_id} not found")
+        return patient
+
+    @staticmethod
+    @read_only
+    def find_patients_by_phone(phone, name=None):
+        """
+        Patients filed under this phone number (any formatting), oldest
+        first - family members sharing a phone are separate patients;
+        name narrows it to the one with that (normalized) name
+        """
+        if not phone or not str(phone).strip():
+            raise ValueError("Phone is required")
+        query = Patient.query.filter_by(phone_key=patients.phone_key(phone))
+        if name and str(name).strip():
+            query = query.filter_by(name_key=patients.name_key(name))
+        return query.order_by(Patient.id).all()
+
+    @staticmethod
+    @read_only
+    def list_patient_orders(patient_id, cursor=None, direction='next', per_page=None, profile='list',
+                            include_archived=False):
+        """
+        One page of a patient's orders, newest first (ix_lab_test_order_patient_created_at);
+        include_archived merges in their archived orders
+        """
+        query = with_profile(LabTestOrder.query, LabTestOrder, profile).filter_by(patient_id=patient_id)
+        if include_archived:
+            archive_query = with_profile(LabTestOrderArchive.query, LabTestOrderArchive, profile)
+            return keyset_paginate_merged(
+                [(query, LabTestOrder), (archive_query.filter_by(patient_id=patient_id), LabTestOrderArchive)],
+                cursor=cursor, direction=direction, per_page=per_page,
+            )
+        return keyset_paginate(query, LabTestOrder,
+                               cursor=cursor, direction=direction, per_page=per_page)
+
+    @staticmethod
+    @read_only
+    def get_status_counts(patient_id, include_archived=False):
+        """{status: order count} for one patient, one grouped query per table on the patient index"""
+        counts = {status.value: 0 for status in OrderStatusEnum}
+        for model in (LabTestOrder, LabTestOrderArchive) if include_archived else (LabTestOrder,):
+            for status, count in db.session.execute(
+                select(model.status, func.count(model.id))
+                .where(model.patient_id == patient_id)
+                .group_by(model.status)
+            ):
+                counts[status] = counts.get(status, 0) + count
+        return counts
 
 
 class LabTestResultController:
     """Controller for Lab Test Result operations"""
 
     @staticmethod
-    def create_result(order_id, result_value, technician_notes=None):
+    @writes
+    def create_result(order_id, result_value, technician_notes=None, line_id=None):
         """
         Create a new lab test result
         
         Business Rules:
         - Order must exist and status must be 'Ordered'
+        - Each order line gets one result; line_id picks the line, by
+          default the first line without a result
         - Result always starts in Draft status
         - Result value cannot be empty
         """
         # Validate order exists and is in Ordered status
         try:
-            order = LabTestOrderController.get_order_by_id(order_id)
+            order = LabTestOrderController.get_order_by_id(order_id, profile='detail')
         except ValueError as e:
             raise ValueError(f"Invalid order: {str(e)}")
 
@@ -309,14 +781,20 @@ class LabTestResultController:
                 f"Current status: {order.status}"
             )
 
+        line = order.line_for_new_result(int(line_id) if line_id else None)
+
         # Validate result value
         if not result_value or not str(result_value).strip():
             raise ValueError("Result value is required")
 
-        # Create result with Draft status
+        # Create result with Draft status, flagged against the test's range
+        result_numeric = ranges.parse_result_value(result_value)
         result = LabTestResult(
             order_id=order_id,
+            line_id=line.id,
             result_value=result_value,
+            result_numeric=result_numeric,
+            flag=ranges.classify_value(result_numeric, test_catalog.get(line.test_id)),
             technician_notes=technician_notes,
             status=ResultStatusEnum.DRAFT.value
         )
@@ -325,32 +803,53 @@ class LabTestResultController:
         return result
 
     @staticmethod
-    def get_result_by_id(result_id):
-        """Get a single result by ID"""
-        result = LabTestResult.query.get(result_id)
+    @read_only
+    def get_result_by_id(result_id, profile=None, include_archived=False):
+        """Get a single result by ID (falling back to the archive when include_archived)"""
+        result = with_profile(LabTestResult.query, LabTestResult, profile).get(result_id)
+        if not result and include_archived:
+            result = with_profile(LabTestResultArchive.query, LabTestResultArchive, profile).get(result_id)
         if not result:
             raise ValueError(f"Result with ID {result_id} not found")
         return result
 
     @staticmethod
+    @read_only
     def get_result_by_order(order_id):
         """Get result(s) for a specific order"""
         order = LabTestOrderController.get_order_by_id(order_id)
         return LabTestResult.query.filter_by(order_id=order_id).all()
 
     @staticmethod
-    def list_all_results():
-        """Get all results"""
-        return LabTestResult.query.order_by(LabTestResult.created_at.desc()).all()
+    @read_only
+    def list_all_results(cursor=None, direction='next', per_page=None, profile='list'):
+        """Get one page of all results, newest first"""
+        query = with_profile(LabTestResult.query, LabTestResult, profile)
+        return keyset_paginate(query, LabTestResult,
+                               cursor=cursor, direction=direction, per_page=per_page)
 
     @staticmethod
-    def list_completed_results():
-        """Get all completed results"""
-        return LabTestResult.query.filter_by(
+    @read_only
+    def list_completed_results(cursor=None, direction='next', per_page=None, profile='list'):
+        """Get one page of completed results"""
+        query = with_profile(LabTestResult.query, LabTestResult, profile).filter_by(
             status=ResultStatusEnum.COMPLETED.value
-        ).order_by(LabTestResult.created_at.desc()).all()
+        )
+        return keyset_paginate(query, LabTestResult,
+                               cursor=cursor, direction=direction, per_page=per_page)
 
     @staticmethod
+    @read_only
+    def list_abnormal_results(cursor=None, direction='next', per_page=None, profile='list'):
+        """Get one page of results flagged low, high or critical"""
+        query = with_profile(LabTestResult.query, LabTestResult, profile).filter(
+            LabTestResult.flag.in_(ranges.ABNORMAL_FLAGS)
+        )
+        return keyset_paginate(query, LabTestResult,
+                               cursor=cursor, direction=direction, per_page=per_page)
+
+    @staticmethod
+    @writes
     def update_result(result_id, result_value=None, technician_notes=None):
         """
         Update result details (only for Draft results)
@@ -364,6 +863,8 @@ class LabTestResultController:
             if not str(result_value).strip():
                 raise ValueError("Result value cannot be empty")
             result.result_value = result_value
+            result.result_numeric = ranges.parse_result_value(result_value)
+            result.flag = ranges.classify_value(result.result_numeric, test_catalog.get(result.line.test_id if result.line else result.order.test_id))
 
         if technician_notes is not None:
             result.technician_notes = technician_notes
@@ -373,18 +874,123 @@ class LabTestResultController:
         return result
 
     @staticmethod
+    @writes
     def complete_result(result_id):
         """
         Mark result as Completed
         
         Side Effect:
-        - Automatically updates related order status to Completed
+        - Completes the result's order line, and the order once every line is complete
+        - Queues the report / SMS / LIS background jobs (app.jobs)
         """
         result = LabTestResultController.get_result_by_id(result_id)
 
         if not result.can_complete():
             raise ValueError(f"Result can only be completed from Draft status. Current status: {result.status}")
 
-        # This will also update the order status
-        result.mark_completed()
+        # This also completes the order once all of its lines are complete
+        if result.mark_completed():
+            order_stats.orders_moved(
+                [(line.test_id, line.price) for line in result.order.lines], OrderStatusEnum.COMPLETED.value
+            )
+        # Report, SMS and LIS push run in `flask run-worker` once this commits
+        jobs.enqueue_result_completed([result.id])
+        db.session.commit()
         return result
+
+    @staticmethod
+    @writes
+    def batch_complete_results(result_ids):
+        """
+        Mark many results as Completed in one transaction
+
+        All results (and their orders) are loaded in one query and checked
+        with can_complete in memory; valid ones are completed with set-based
+        UPDATEs (results, their order lines, then the orders whose lines are
+        now all complete). Invalid or missing IDs are reported and skipped.
+
+        Returns {'completed': int, 'outcomes': [{'id', 'ok', 'status' | 'error'}]}
+        """
+        result_ids = _parse_batch_ids(result_ids)
+        results = {
+            result.id: result
+            for result in with_profile(LabTestResult.query, LabTestResult, 'list')
+            .filter(LabTestResult.id.in_(result_ids)).all()
+        }
+
+        outcomes = {}
+        valid = []
+        for result_id in result_ids:
+            result = results.get(result_id)
+            if not result:
+                outcomes[result_id] = {'id': result_id, 'ok': False, 'error': f"Result with ID {result_id} not found"}
+            elif not result.can_complete():
+                outcomes[result_id] = {
+                    'id': result_id, 'ok': False,
+                    'error': f"Result can only be completed from Draft status. Current status: {result.status}",
+                }
+            else:
+                valid.append(result_id)
+
+        if valid:
+            now = datetime.utcnow()
+            completed = ResultStatusEnum.COMPLETED.value
+            try:
+                updated = db.session.execute(
+                    update(LabTestResult)
+                    .where(LabTestResult.id.in_(valid), LabTestResult.status == ResultStatusEnum.DRAFT.value)
+                    .values(status=completed, updated_at=now, completed_at=now)
+                ).rowcount
+                if updated != len(valid):
+                    # Another request completed some of these since we loaded them
+                    raise ValueError("Some results changed while completing the batch; please retry")
+                line_ids = [results[result_id].line_id for result_id in valid if results[result_id].line_id]
+                if line_ids:
+                    db.session.execute(
+                        update(LabTestOrderLine)
+                        .where(LabTestOrderLine.id.in_(line_ids), LabTestOrderLine.completed_at.is_(None))
+                        .values(completed_at=now)
+                    )
+                order_ids = {results[result_id].order_id for result_id in valid}
+                # An order completes once none of its lines is still open
+                still_open = set(db.session.execute(
+                    select(LabTestOrderLine.order_id)
+                    .where(LabTestOrderLine.order_id.in_(order_ids), LabTestOrderLine.completed_at.is_(None))
+                    .distinct()
+                ).scalars())
+                done = [
+                    results[result_id].order for result_id in valid
+                    if results[result_id].order_id not in still_open
+                ]
+                # Read before the UPDATE, which also refreshes these objects in the session
+                newly_completed = sorted({
+                    order.id for order in done if order.status != OrderStatusEnum.COMPLETED.value
+                })
+                if newly_completed:
+                    db.session.execute(
+                        update(LabTestOrder)
+                        .where(LabTestOrder.id.in_(newly_completed))
+                        .values(
+                            status=OrderStatusEnum.COMPLETED.value, updated_at=now,
+                            completed_at=func.coalesce(LabTestOrder.completed_at, now),
+                        )
+                    )
+                    order_stats.orders_moved(
+                        db.session.execute(
+                            select(LabTestOrderLine.test_id, LabTestOrderLine.price)
+                            .where(LabTestOrderLine.order_id.in_(newly_completed))
+                        ).all(),
+                        OrderStatusEnum.COMPLETED.value,
+                    )
+                jobs.enqueue_result_completed(valid)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            for result_id in valid:
+                outcomes[result_id] = {'id': result_id, 'ok': True, 'status': completed}
+
+        return {
+            'completed': len(valid),
+            'outcomes': [outcomes[result_id] for result_id in result_ids],
+        }
@@ -0,0 +1,143 @@
+"""
+Dashboard statistics for Pathology module
+All dashboard numbers come from one SELECT of scalar COUNT subqueries,
+each an index range scan (orders per status, today's orders, results per
+status, today's completed results), cached per process for a few seconds
+so many open terminals cost one query per interval. Totals are the sums of
+the per-status counts, so no subquery reads whole tables.
+"""
+
+import threading
+import time
+from datetime import date, datetime, time as dt_time
+
+from flask import current_app
+from sqlalchemy import func, select, text
+
+from app.models import db, PathologyTest, LabTestOrder, LabTestResult, OrderStatusEnum, ResultStatusEnum
+from app.routing import read_only
+from app.tat import tat_started_at
+
+
+DEFAULT_TTL = 5.0
+
+
+def seconds_between(start, end):
+    """Dialect-aware (end - start) in seconds as a SQL expression"""
+    if db.engine.dialect.name == 'sqlite':
+        return (func.julianday(end) - func.julianday(start)) * 86400.0
+    return func.timestampdiff(text('SECOND'), start, end)
+
+
+def local_midnight_utc():
+    """Start of today's local date, expressed in UTC like the stored timestamps"""
+    utc_offset = datetime.now().astimezone().utcoffset()
+    return datetime.combine(date.today(), dt_time.min) - utc_offset
+
+
+def _count(model, *criteria):
+    return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+
+def dashboard_counts():
+    """
+    The dashboard's COUNT subqueries by result column, each a range scan
+    on one index (check_index_usage EXPLAINs them one at a time)
+    """
+    return {
+        # ix_lab_test_order_order_date_created_at
+        'today_orders': _count(LabTestOrder, LabTestOrder.order_date == date.today()),
+        # ix_lab_test_order_status_created_at, one range per status
+        **{f'orders_{status.name.lower()}': _count(LabTestOrder, LabTestOrder.status == status.value)
+           for status in OrderStatusEnum},
+        # ix_lab_test_result_status_created_at (or _status_completed_at, equally good)
+        **{f'results_{status.name.lower()}': _count(LabTestResult, LabTestResult.status == status.value)
+           for status in ResultStatusEnum},
+    }
+
+
+def tat_today_query():
+    """Count, average and maximum turnaround of the results completed today"""
+    # ix_lab_test_result_status_completed_at: only today's completions are read
+    tat_seconds = seconds_between(tat_started_at(), LabTestResult.completed_at)
+    return (
+        select(
+            func.count(LabTestResult.id).label('tat_completed_today'),
+            func.avg(tat_seconds).label('tat_avg_seconds'),
+            func.max(tat_seconds).label('tat_max_seconds'),
+        )
+        .join(LabTestOrder, LabTestResult.order_id == LabTestOrder.id)
+        .where(LabTestResult.completed_at >= local_midnight_utc(),
+               LabTestResult.status == ResultStatusEnum.COMPLETED.value)
+    )
+
+
+def dashboard_query():
+    """Build the single dashboard SELECT"""
+    tat_today = tat_today_query().subquery('tat_today')
+    return select(
+        select(func.count(PathologyTest.id)).scalar_subquery().label('test_count'),
+        *[count.label(name) for name, count in dashboard_counts().items()],
+        # An aggregate without GROUP BY: always exactly one row
+        *tat_today.c,
+    ).select_from(tat_today)
+
+
+@read_only
+def compute_dashboard_stats():
+    """Run the dashboard query and return a plain dict"""
+    row = db.session.execute(dashboard_query()).one()._asdict()
+    status_counts = {status.value: row[f'orders_{status.name.lower()}'] for status in OrderStatusEnum}
+    stats = {
+        'test_count': row['test_count'],
+        'order_count': sum(status_counts.values()),
+        'result_count': sum(row[f'results_{status.name.lower()}'] for status in ResultStatusEnum),
+        'today_orders': row['today_orders'],
+        'status_counts': status_counts,
+        'tat_today': {
+            'completed': row['tat_completed_today'] or 0,
+            'avg_minutes': round(float(row['tat_avg_seconds']) / 60, 1) if row['tat_avg_seconds'] is not None else None,
+            'max_minutes': round(float(row['tat_max_seconds']) / 60, 1) if row['tat_max_seconds'] is not None else None,
+        },
+    }
+    return stats
+
+
+class DashboardCache:
+    """Per-process, per-database TTL cache of dashboard stats"""
+
+    def __init__(self, ttl_config='DASHBOARD_CACHE_TTL'):
+        self.ttl_config = ttl_config
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        ttl = float(current_app.config.get(self.ttl_config, DEFAULT_TTL))
+        key = str(db.engine.url)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now < entry[0] + ttl:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            stats = compute_dashboard_stats()
+            self._entries[key] = (now, stats)
+            return stats
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.pop(str(db.engine.url), None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+dashboard_cache = DashboardCache()
@@ -0,0 +1,175 @@
+"""
+Streaming exports of orders and results for billing and NABL audits
+Rows are read with a server-side cursor (yield_per) and written out in
+small chunks, so memory stays flat whatever the date range. Archived
+orders (app.archive) are left out unless include_archived is set.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select, union_all
+
+from app.models import (
+    db, PathologyTest, LabTestOrder, LabTestOrderLine, LabTestResult,
+    LabTestOrderArchive, LabTestOrderLineArchive, LabTestResultArchive, OrderStatusEnum, ResultStatusEnum,
+)
+
+
+YIELD_PER = 1000
+ROWS_PER_CHUNK = 500
+
+ORDER_STATUSES = [s.value for s in OrderStatusEnum]
+RESULT_STATUSES = [s.value for s in ResultStatusEnum]
+
+ORDER_EXPORT_COLUMNS = (
+    'order_id', 'patient_name', 'patient_phone', 'test_code', 'test_name', 'price',
+    'order_date', 'status', 'created_at', 'result_value', 'result_status', 'result_updated_at',
+)
+
+RESULT_EXPORT_COLUMNS = (
+    'result_id', 'order_id', 'patient_name', 'patient_phone', 'test_code', 'test_name',
+    'order_date', 'result_value', 'technician_notes', 'status', 'created_at', 'updated_at',
+)
+
+
+def parse_export_filters(date_from=None, date_to=None, status=None, test_code=None, statuses=None,
+                         include_archived=False):
+    """
+    Validate export filters
+    Dates are YYYY-MM-DD strings (inclusive, on order_date); status must be
+    one of `statuses`. include_archived adds the archive tables.
+    """
+    filters = {}
+    for key, value in (('date_from', date_from), ('date_to', date_to)):
+        if value:
+            try:
+                filters[key] = datetime.strptime(value.strip(), '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError(f"Invalid {key} format (use YYYY-MM-DD)")
+    if filters.get('date_from') and filters.get('date_to') and filters['date_from'] > filters['date_to']:
+        raise ValueError("date_from cannot be after date_to")
+    if status:
+        if statuses is not None and status not in statuses:
+            raise ValueError(f"Invalid status: {status}")
+        filters['status'] = status
+    if test_code:
+        filters['test_code'] = test_code.strip().upper()
+    if include_archived:
+        filters['include_archived'] = True
+    return filters
+
+
+def _sources(filters):
+    """(order, line, result) models to read: the live tables, plus the archive when asked"""
+    sources = [(LabTestOrder, LabTestOrderLine, LabTestResult)]
+    if filters.get('include_archived'):
+        sources.append((LabTestOrderArchive, LabTestOrderLineArchive, LabTestResultArchive))
+    return sources
+
+
+def _stream(statements, sort_keys):
+    """
+    Execute the per-source statements as one id-ordered stream; each ends
+    with the `sort_keys` columns, which are dropped from the rows
+    """
+    stmt = statements[0] if len(statements) == 1 else union_all(*statements)
+    stmt = stmt.order_by(*sort_keys).execution_options(yield_per=YIELD_PER)
+    for row in db.session.execute(stmt):
+        yield tuple(row)[:-len(sort_keys)]
+
+
+def _apply_filters(stmt, filters, order, status_column):
+    if filters.get('date_from'):
+        stmt = stmt.where(order.order_date >= filters['date_from'])
+    if filters.get('date_to'):
+        stmt = stmt.where(order.order_date <= filters['date_to'])
+    if filters.get('status'):
+        stmt = stmt.where(status_column == filters['status'])
+    if filters.get('test_code'):
+        stmt = stmt.where(PathologyTest.test_code == filters['test_code'])
+    return stmt
+
+
+def iter_order_rows(filters):
+    """Stream order rows (one per order line, with its result) as tuples"""
+    statements = []
+    for order, line, result in _sources(filters):
+        stmt = (
+            select(
+                order.order_id, order.patient_name, order.patient_phone,
+                PathologyTest.test_code, PathologyTest.test_name, line.price,
+                order.order_date, order.status, order.created_at,
+                result.result_value, result.status, result.updated_at,
+                order.id.label('sort_order_id'), line.line_no.label('sort_line_no'),
+            )
+            .join(line, line.order_id == order.id)
+            .join(PathologyTest, line.test_id == PathologyTest.id)
+            .outerjoin(result, result.line_id == line.id)
+        )
+        statements.append(_apply_filters(stmt, filters, order, order.status))
+    yield from _stream(statements, ('sort_order_id', 'sort_line_no'))
+
+
+def iter_result_rows(filters):
+    """Stream result rows joined with their order and test as tuples"""
+    statements = []
+    for order, line, result in _sources(filters):
+        stmt = (
+            select(
+                result.id, order.order_id, order.patient_name, order.patient_phone,
+                PathologyTest.test_code, PathologyTest.test_name, order.order_date,
+                result.result_value, result.technician_notes, result.status,
+                result.created_at, result.updated_at,
+                result.id.label('sort_result_id'),
+            )
+            .join(order, result.order_id == order.id)
+            .join(line, result.line_id == line.id)
+            .join(PathologyTest, line.test_id == PathologyTest.id)
+        )
+        statements.append(_apply_filters(stmt, filters, order, result.status))
+    yield from _stream(statements, ('sort_result_id',))
+
+
+def _plain(value):
+    """Convert dates/decimals to CSV/JSON friendly values"""
+    if value is None:
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def stream_orders_csv(filters):
+    """Yield the orders export as CSV text chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ORDER_EXPORT_COLUMNS)
+    pending = 0
+    for row in iter_order_rows(filters):
+        writer.writerow([_plain(value) for value in row])
+        pending += 1
+        if pending >= ROWS_PER_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def stream_results_ndjson(filters):
+    """Yield the results export as newline-delimited JSON chunks"""
+    lines = []
+    for row in iter_result_rows(filters):
+        record = {column: _plain(value) for column, value in zip(RESULT_EXPORT_COLUMNS, row)}
+        lines.append(json.dumps(record))
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
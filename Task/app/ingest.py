@@ -0,0 +1,68 @@
+"""
+Bulk order file parsing for Pathology module
+Turns CSV or JSON-lines input into row dicts for
+LabTestOrderController.bulk_create_orders
+"""
+
+import csv
+import json
+
+
+ORDER_FIELDS = ('patient_name', 'patient_phone', 'test_code', 'test_id', 'order_date')
+
+CSV_CONTENT_TYPES = ('text/csv', 'application/csv')
+JSONL_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+
+
+def detect_format(filename=None, content_type=None, sample=''):
+    """Guess 'csv' or 'jsonl' from a filename, content type or the first bytes"""
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+
+    mimetype = (content_type or '').split(';')[0].strip().lower()
+    if mimetype in CSV_CONTENT_TYPES:
+        return 'csv'
+    if mimetype in JSONL_CONTENT_TYPES:
+        return 'jsonl'
+
+    return 'jsonl' if sample.lstrip().startswith('{') else 'csv'
+
+
+def _iter_csv(lines):
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames:
+        return
+    for record in reader:
+        yield {key.strip(): value for key, value in record.items() if key and key.strip() in ORDER_FIELDS}
+
+
+def _iter_jsonl(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            # Pass the problem through as a row so it shows up in the report
+            yield {'_error': f"Invalid JSON: {e.msg}", '_raw': line[:200]}
+            continue
+        if not isinstance(record, dict):
+            yield {'_error': "Each JSON line must be an object", '_raw': line[:200]}
+            continue
+        yield {key: record[key] for key in ORDER_FIELDS if key in record}
+
+
+def parse_order_rows(lines, fmt):
+    """
+    Iterate order rows from an iterable of text lines
+    fmt is 'csv' (header row required) or 'jsonl' (one JSON object per line).
+    """
+    if fmt == 'csv':
+        return _iter_csv(lines)
+    if fmt in ('jsonl', 'ndjson'):
+        return _iter_jsonl(lines)
+    raise ValueError(f"Unsupported import format: {fmt}")
@@ -0,0 +1,390 @@
+"""
+Background job queue for Pathology module
+Slow follow-up work (result reports, patient SMS, LIS push) is written to
+the background_job table and run by `flask run-worker`, so the request
+that triggered it returns as soon as its own transaction commits.
+
+Jobs are enqueued inside the caller's transaction (an outbox): they
+become visible to workers exactly when the triggering write commits and
+disappear with it on rollback. Each job carries an idempotency key;
+enqueueing a key that already exists is a no-op, and handlers receive
+the key so downstream systems can de-duplicate the at-least-once runs.
+
+Workers claim due jobs with a guarded UPDATE (status = 'queued'), so any
+number of worker processes can share the table. Failures are retried
+with exponential backoff and jitter until max_attempts, then the job is
+marked dead for `flask jobs-retry`. Jobs left running by a crashed
+worker are requeued after STALE_AFTER_SECONDS.
+
+Result reports are rendered as standalone printable HTML rather than
+PDF: there is no PDF renderer among the dependencies, and the report
+page prints to PDF from any browser. Reports, like the SMS outbox, hold
+patient details and live in the instance folder, outside version control.
+"""
+
+import json
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from flask import current_app, render_template
+from sqlalchemy import delete, func, insert, select, update
+
+from app.models import db, BackgroundJob, JobStatusEnum
+from app.routing import writes
+
+
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 3600
+STALE_AFTER_SECONDS = 600
+LIS_PUSH_TIMEOUT = 10
+
+QUEUED = JobStatusEnum.QUEUED.value
+RUNNING = JobStatusEnum.RUNNING.value
+DONE = JobStatusEnum.DONE.value
+DEAD = JobStatusEnum.DEAD.value
+
+_job_table = BackgroundJob.__table__
+
+# kind -> handler(job); filled by @job_handler
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register a function as the handler for jobs of `kind`"""
+    def decorator(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def backoff_seconds(attempts):
+    """Delay before retry number `attempts` (1-based): exponential, capped, with jitter"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+# ===== ENQUEUE =====
+
+def enqueue_many(jobs, run_after=None, max_attempts=None):
+    """
+    Add (kind, idempotency_key, payload) jobs to the current transaction
+    Keys that already exist are skipped. One SELECT and one INSERT however
+    many jobs; the caller commits. Returns the number of jobs added.
+    """
+    jobs = {key: (kind, payload) for kind, key, payload in jobs}
+    if not jobs:
+        return 0
+    unknown = {kind for kind, _ in jobs.values() if kind not in JOB_HANDLERS}
+    if unknown:
+        raise ValueError(f"Unknown job kind(s): {', '.join(sorted(unknown))}")
+
+    existing = set(db.session.scalars(
+        select(BackgroundJob.idempotency_key).where(BackgroundJob.idempotency_key.in_(list(jobs)))
+    ))
+    now = datetime.utcnow()
+    if max_attempts is None:
+        max_attempts = current_app.config.get('JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    rows = [
+        {
+            'kind': kind,
+            'idempotency_key': key,
+            'payload': payload,
+            'status': QUEUED,
+            'attempts': 0,
+            'max_attempts': max_attempts,
+            'run_after': run_after or now,
+            'created_at': now,
+            'updated_at': now,
+        }
+        for key, (kind, payload) in jobs.items() if key not in existing
+    ]
+    if rows:
+        db.session.execute(insert(_job_table), rows)
+    return len(rows)
+
+
+def enqueue(kind, idempotency_key, payload, run_after=None, max_attempts=None):
+    """Add one job to the current transaction; returns False if its key already exists"""
+    return enqueue_many([(kind, idempotency_key, payload)], run_after, max_attempts) == 1
+
+
+def enqueue_result_completed(result_ids):
+    """Queue the follow-up work for newly completed results (caller commits)"""
+    kinds = ['result.report', 'patient.sms']
+    if current_app.config.get('LIS_PUSH_URL'):
+        kinds.append('lis.push')
+    return enqueue_many(
+        (kind, f"{kind}:{result_id}", {'result_id': result_id})
+        for result_id in result_ids for kind in kinds
+    )
+
+
+# ===== WORKER =====
+
+def claim_jobs(worker_name, limit, kinds=None):
+    """Mark up to `limit` due jobs as running for this worker and return their IDs"""
+    now = datetime.utcnow()
+    stmt = (
+        select(_job_table.c.id)
+        .where(_job_table.c.status == QUEUED, _job_table.c.run_after <= now)
+        .order_by(_job_table.c.run_after, _job_table.c.id)
+        .limit(limit * 2)  # some may be taken by another worker meanwhile
+    )
+    if kinds:
+        stmt = stmt.where(_job_table.c.kind.in_(kinds))
+
+    claimed = []
+    for job_id in db.session.scalars(stmt).all():
+        if len(claimed) == limit:
+            break
+        taken = db.session.execute(
+            update(_job_table)
+            .where(_job_table.c.id == job_id, _job_table.c.status == QUEUED)
+            .values(status=RUNNING, locked_by=worker_name, locked_at=now,
+                    attempts=_job_table.c.attempts + 1, updated_at=now)
+        ).rowcount
+        if taken:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def run_job(job_id):
+    """
+    Run one claimed job and record the outcome (needs an app context)
+    Returns the job's new status.
+    """
+    job = db.session.get(BackgroundJob, job_id)
+    try:
+        handler = JOB_HANDLERS.get(job.kind)
+        if handler is None:
+            raise LookupError(f"No handler for job kind {job.kind!r}")
+        # Handlers read what the triggering request just wrote: keep them on the primary
+        writes(handler)(job)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(BackgroundJob, job_id)
+        now = datetime.utcnow()
+        job.last_error = f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}"[:4000]
+        if job.attempts >= job.max_attempts:
+            job.status = DEAD
+            job.finished_at = now
+        else:
+            job.status = QUEUED
+            job.run_after = now + timedelta(seconds=backoff_seconds(job.attempts))
+        job.locked_by = job.locked_at = None
+    else:
+        job.status = DONE
+        job.finished_at = datetime.utcnow()
+        job.locked_by = job.locked_at = None
+    db.session.commit()
+    return job.status
+
+
+def requeue_stale(stale_after=STALE_AFTER_SECONDS):
+    """Return jobs stuck in running (their worker died) to the queue, or mark them dead"""
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+    stale = (_job_table.c.status == RUNNING) & (_job_table.c.locked_at < cutoff)
+    now = datetime.utcnow()
+    dead = db.session.execute(
+        update(_job_table)
+        .where(stale, _job_table.c.attempts >= _job_table.c.max_attempts)
+        .values(status=DEAD, finished_at=now, locked_by=None, locked_at=None,
+                last_error='Worker stopped while running the job', updated_at=now)
+    ).rowcount
+    requeued = db.session.execute(
+        update(_job_table)
+        .where(stale)
+        .values(status=QUEUED, run_after=now, locked_by=None, locked_at=None, updated_at=now)
+    ).rowcount
+    db.session.commit()
+    return requeued, dead
+
+
+class Worker:
+    """
+    Polls the queue and runs jobs on a thread pool
+    Each thread works in its own app context (and so its own session and
+    pooled connection); keep concurrency within DB_POOL_SIZE + DB_MAX_OVERFLOW.
+    """
+
+    def __init__(self, app, concurrency=4, poll_interval=1.0, kinds=None, name=None):
+        self.app = app
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.kinds = kinds or None
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.counts = {DONE: 0, QUEUED: 0, DEAD: 0}
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def stop(self):
+        """Stop claiming new jobs; running ones finish"""
+        self._stop.set()
+
+    def _execute(self, job_id):
+        with self.app.app_context():
+            status = run_job(job_id)
+        with self._lock:
+            self.counts[status] += 1
+        return status
+
+    def run(self, burst=False):
+        """Work until stop() (or, with burst, until no job is due). Returns outcome counts."""
+        last_stale_check = None
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job') as pool:
+            running = set()
+            while not self._stop.is_set():
+                running = {future for future in running if not future.done()}
+                claimed = []
+                free = self.concurrency - len(running)
+                if free:
+                    with self.app.app_context():
+                        if last_stale_check is None or time.monotonic() - last_stale_check > STALE_AFTER_SECONDS / 10:
+                            requeue_stale()
+                            last_stale_check = time.monotonic()
+                        claimed = claim_jobs(self.name, free, self.kinds)
+                    for job_id in claimed:
+                        running.add(pool.submit(self._execute, job_id))
+                if claimed:
+                    continue
+                if burst and not running:
+                    break
+                if running:
+                    wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    self._stop.wait(self.poll_interval)
+        return dict(self.counts)
+
+
+# ===== INSPECTION =====
+
+def queue_stats():
+    """{'counts': {(kind, status): n}, 'oldest_due_seconds': float | None}"""
+    counts = {
+        (kind, status): count
+        for kind, status, count in db.session.execute(
+            select(_job_table.c.kind, _job_table.c.status, func.count())
+            .group_by(_job_table.c.kind, _job_table.c.status)
+        )
+    }
+    now = datetime.utcnow()
+    oldest = db.session.execute(
+        select(func.min(_job_table.c.run_after))
+        .where(_job_table.c.status == QUEUED, _job_table.c.run_after <= now)
+    ).scalar()
+    return {
+        'counts': counts,
+        'oldest_due_seconds': (now - oldest).total_seconds() if oldest else None,
+    }
+
+
+def failed_jobs(limit=20):
+    """Dead jobs and queued jobs waiting to retry, most recently updated first"""
+    return (
+        BackgroundJob.query
+        .filter(BackgroundJob.last_error.is_not(None), BackgroundJob.status.in_([QUEUED, DEAD]))
+        .order_by(BackgroundJob.updated_at.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def retry_jobs(job_ids=None):
+    """Requeue dead jobs (all of them, or the given IDs) with a fresh attempt budget"""
+    now = datetime.utcnow()
+    stmt = update(_job_table).where(_job_table.c.status == DEAD)
+    if job_ids:
+        stmt = stmt.where(_job_table.c.id.in_(list(job_ids)))
+    retried = db.session.execute(
+        stmt.values(status=QUEUED, attempts=0, run_after=now, finished_at=None, updated_at=now)
+    ).rowcount
+    db.session.commit()
+    return retried
+
+
+def purge_jobs(older_than_days=7):
+    """Delete done jobs finished more than `older_than_days` ago"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    purged = db.session.execute(
+        delete(_job_table).where(_job_table.c.status == DONE, _job_table.c.finished_at < cutoff)
+    ).rowcount
+    db.session.commit()
+    return purged
+
+
+# ===== HANDLERS =====
+
+def _completed_result(job):
+    from app.controllers import LabTestResultController
+
+    # The order may have been archived since the job was queued
+    return LabTestResultController.get_result_by_id(job.payload['result_id'], profile='detail', include_archived=True)
+
+
+def _configured_path(config_key, default_name):
+    """A path from the config, defaulting to the app's instance folder"""
+    return current_app.config.get(config_key) or os.path.join(current_app.instance_path, default_name)
+
+
+@job_handler('result.report')
+def generate_result_report(job):
+    """Render a completed result's patient report (HTML) to REPORT_OUTPUT_DIR/<order id>-<line no>.html"""
+    result = _completed_result(job)
+    html = render_template('results/report.html', result=result, order=result.order,
+                           test=result.test, generated_at=datetime.utcnow())
+    directory = _configured_path('REPORT_OUTPUT_DIR', 'reports')
+    os.makedirs(directory, exist_ok=True)
+    line_no = result.line.line_no if result.line else 1
+    path = os.path.join(directory, f"{result.order.order_id}-{line_no}.html")
+    # Write-then-rename, so a retried job replaces the report instead of appending to it
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(html)
+    os.replace(path + '.tmp', path)
+
+
+def send_sms(phone, message, idempotency_key):
+    """
+    Local SMS gateway stub: appends the message to SMS_OUTBOX_PATH as JSON
+    lines. A real gateway would take idempotency_key as its dedupe ID.
+    """
+    path = _configured_path('SMS_OUTBOX_PATH', 'sms_outbox.jsonl')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    record = {'to': phone, 'message': message, 'key': idempotency_key, 'sent_at': datetime.utcnow().isoformat()}
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+@job_handler('patient.sms')
+def notify_patient_sms(job):
+    """Tell the patient their result is ready"""
+    result = _completed_result(job)
+    order = result.order
+    send_sms(order.patient_phone,
+             f"Dear {order.patient_name}, your {result.test.test_name} result for order "
+             f"{order.order_id} is ready.",
+             job.idempotency_key)
+
+
+@job_handler('lis.push')
+def push_result_to_lis(job):
+    """POST the completed result to LIS_PUSH_URL (non-2xx responses raise and are retried)"""
+    url = current_app.config.get('LIS_PUSH_URL')
+    if not url:
+        return
+    result = _completed_result(job)
+    body = json.dumps({'order': result.order.to_dict(), 'result': result.to_dict()}).encode('utf-8')
+    request = urllib.request.Request(
+        url, data=body, method='POST',
+        headers={'Content-Type': 'application/json', 'Idempotency-Key': job.idempotency_key},
+    )
+    with urllib.request.urlopen(request, timeout=LIS_PUSH_TIMEOUT) as response:
+        response.read()
@@ -0,0 +1,319 @@
+"""
+Schema creation and upgrade path for Pathology databases
+db.create_all() only creates missing tables, so anything added to an
+existing table (indexes, columns) is applied here, idempotently.
+
+All DDL runs from `flask init-db` / `flask upgrade-db`, which stamp
+SCHEMA_VERSION into the schema_version table; create_app only reads that
+row (check_schema_version) so worker boots do no reflection or DDL.
+Bump SCHEMA_VERSION whenever the models change.
+"""
+
+from sqlalchemy import Column, event, exc, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+
+from app.models import (
+    db, PathologyTest, Patient, LabTestOrder, LabTestOrderLine, LabTestResult, BackgroundJob, SchemaVersion,
+    TatRollupState, OrderStatusEnum, ResultStatusEnum,
+)
+
+# NOT NULL columns that upgrade-db adds as nullable, fills from existing
+# rows, then tightens (_require_not_null): (table, column)
+BACKFILLED_COLUMNS = (
+    ('lab_test_order', 'patient_id'),  # backfill_patients
+)
+
+
+SCHEMA_VERSION = 9
+
+# create_app behaviour: 'check' reads the version row and refuses to boot on
+# a missing or outdated schema, 'warn' only logs it, 'create' runs
+# upgrade_schema() (throwaway SQLite databases), 'off' touches nothing
+SCHEMA_BOOT_MODES = ('check', 'warn', 'create', 'off')
+
+
+def _create_missing_indexes(model):
+    """Create any index declared on the model that the database lacks"""
+    existing = {ix['name'] for ix in inspect(db.engine).get_indexes(model.__tablename__)}
+    created = []
+    for index in model.__table__.indexes:
+        if index.name not in existing:
+            index.create(bind=db.engine)
+            created.append(index.name)
+    return created
+
+
+def _add_missing_columns(model):
+    """
+    ALTER TABLE ... ADD COLUMN for nullable model columns the table lacks
+    BACKFILLED_COLUMNS are added as nullable too, for _require_not_null.
+    """
+    existing = {col['name'] for col in inspect(db.engine).get_columns(model.__tablename__)}
+    added = []
+    for column in model.__table__.columns:
+        if column.name in existing:
+            continue
+        if (model.__tablename__, column.name) in BACKFILLED_COLUMNS:
+            column = Column(column.name, column.type, nullable=True)
+        elif not column.nullable:
+            raise ValueError(f"Cannot add NOT NULL column {model.__tablename__}.{column.name} automatically")
+        column_ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+        with db.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {model.__tablename__} ADD COLUMN {column_ddl}"))
+        added.append(column.name)
+    return added
+
+
+def _require_not_null(table_name, column_name):
+    """
+    Tighten a BACKFILLED_COLUMNS column to NOT NULL once no row lacks it
+    Returns True if it was altered. SQLite cannot alter a column in place,
+    so there it stays nullable (the model still never writes NULL).
+    """
+    nullable = next(col['nullable'] for col in inspect(db.engine).get_columns(table_name) if col['name'] == column_name)
+    if not nullable or db.engine.dialect.name == 'sqlite':
+        return False
+    column = db.metadata.tables[table_name].c[column_name]
+    if db.session.execute(select(column).where(column.is_(None)).limit(1)).first() is not None:
+        raise ValueError(f"Cannot make {table_name}.{column_name} NOT NULL: some rows were not backfilled")
+    column_ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+    with db.engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table_name} MODIFY {column_ddl}"))
+    return True
+
+
+def upgrade_schema():
+    """
+    Bring an existing database up to the current models
+    Returns a list of human-readable steps that were applied.
+    """
+    tables_before = set(inspect(db.engine).get_table_names())
+    if 'tat_rollup_state' in tables_before and 'last_line_id' not in {
+        col['name'] for col in inspect(db.engine).get_columns('tat_rollup_state')
+    }:
+        # The rollup watermark moved from orders to order lines; the state
+        # row is recreated and the rollups rebuilt below
+        TatRollupState.__table__.drop(bind=db.engine)
+        tables_before.discard('tat_rollup_state')
+    db.create_all()
+    applied = [
+        f"created table {name}"
+        for name in sorted(set(inspect(db.engine).get_table_names()) - tables_before)
+    ]
+    if 'catalog_version' not in tables_before:
+        from app.catalog import bump_version
+
+        bump_version(db.session)
+        db.session.commit()
+    for model in (PathologyTest, LabTestOrder, LabTestResult):
+        for name in _add_missing_columns(model):
+            applied.append(f"added column {model.__tablename__}.{name}")
+    for model in (Patient, LabTestOrder, LabTestOrderLine, LabTestResult, BackgroundJob):
+        for name in _create_missing_indexes(model):
+            applied.append(f"created index {name} on {model.__tablename__}")
+
+    if 'added column lab_test_order.completed_at' in applied:
+        from app.tat import backfill_lifecycle
+
+        orders = backfill_lifecycle()
+        db.session.commit()
+        applied.append(f"backfilled lifecycle timestamps for {orders} order(s)")
+
+    # Patients before anything that reads them (patient history)
+    if db.session.query(LabTestOrder.id).filter(LabTestOrder.patient_id.is_(None)).first() is not None:
+        from app.patients import backfill_patients
+
+        orders, patients = backfill_patients()
+        applied.append(f"linked {orders} order(s) to {patients} patient(s)")
+    for table_name, column_name in BACKFILLED_COLUMNS:
+        if _require_not_null(table_name, column_name):
+            applied.append(f"made {table_name}.{column_name} NOT NULL")
+
+    # Lines before anything that reads them (flags, counters, rollups)
+    if 'lab_test_order_line' not in tables_before:
+        from app.order_lines import backfill_order_lines
+
+        lines = backfill_order_lines()
+        db.session.commit()
+        applied.append(f"created {lines} order line(s) for existing orders")
+
+    if any(step.startswith(('added column pathology_test.range_', 'added column lab_test_result.flag'))
+           for step in applied):
+        from app.ranges import backfill_ranges
+
+        tests, results = backfill_ranges()
+        applied.append(f"parsed reference ranges for {tests} test(s), flagged {results} result(s)")
+
+    if 'order_search_token' not in tables_before:
+        from app.search import reindex_all_orders
+
+        applied.append(f"indexed {reindex_all_orders()} order(s) for search")
+
+    if 'test_order_stats' not in tables_before:
+        from app.order_stats import rebuild_stats
+
+        tests = rebuild_stats()
+        db.session.commit()
+        applied.append(f"computed order counters for {tests} test(s)")
+
+    if ('tat_daily_stats' not in tables_before or 'tat_rollup_state' not in tables_before
+            or 'added column lab_test_order.completed_at' in applied):
+        from app.tat import rebuild_rollups
+
+        applied.append(f"rolled up turnaround times for {rebuild_rollups()} order line(s)")
+
+    if stamp_schema_version():
+        applied.append(f"stamped schema version {SCHEMA_VERSION}")
+    return applied
+
+
+def schema_version():
+    """Version recorded in schema_version, or None if it was never stamped"""
+    # Core table select: an ORM select would configure every mapper at boot
+    table = SchemaVersion.__table__
+    try:
+        with db.engine.connect() as conn:
+            return conn.execute(select(table.c.version).where(table.c.id == 1)).scalar()
+    except exc.ProgrammingError:
+        return None  # MySQL: table does not exist yet
+    except exc.OperationalError as e:
+        if 'no such table' in str(e):
+            return None  # SQLite: table does not exist yet
+        raise
+
+
+def stamp_schema_version(version=SCHEMA_VERSION):
+    """Record `version` as applied; returns True if the row changed"""
+    row = db.session.get(SchemaVersion, 1)
+    if row is not None and row.version == version:
+        return False
+    if row is None:
+        db.session.add(SchemaVersion(id=1, version=version))
+    else:
+        row.version = version
+    db.session.commit()
+    return True
+
+
+def check_schema_version(logger, strict=True):
+    """
+    Boot-time fast path: one primary-key SELECT instead of create_all()
+    Raises ValueError on an unreadable, missing or outdated schema; with
+    strict=False (SCHEMA_BOOT_MODE 'warn') it only logs, so that
+    `flask init-db` itself can still start.
+    """
+    def fail(message, *args):
+        if strict:
+            raise ValueError(message % args)
+        logger.warning(message, *args)
+
+    try:
+        version = schema_version()
+    except exc.SQLAlchemyError as e:
+        fail("Could not read schema version: %s", e)
+        return None
+    if version is None:
+        fail("Database schema is not initialized; run `flask init-db`")
+    elif version < SCHEMA_VERSION:
+        fail("Database schema is at version %s, code expects %s; run `flask upgrade-db`",
+             version, SCHEMA_VERSION)
+    elif version > SCHEMA_VERSION:
+        # Expected while a rolling deploy still has old workers running
+        logger.warning("Database schema version %s is newer than this code (%s)", version, SCHEMA_VERSION)
+    return version
+
+
+def _index_checks():
+    """
+    (label, expected index, callable issuing the query) for each hot path;
+    a tuple of indexes means the planner may pick any of them
+    """
+    from app.controllers import LabTestOrderController, LabTestResultController, PatientController
+    from app.dashboard import dashboard_counts, tat_today_query
+
+    # The dashboard is one SELECT of many COUNT subqueries; each is checked
+    # on its own, so one count's index cannot stand in for another's
+    counts = dashboard_counts()
+
+    def dashboard_count(name):
+        return lambda: db.session.execute(select(counts[name])).scalar()
+
+    return [
+        ('list_all_orders', 'ix_lab_test_order_created_at_id',
+         LabTestOrderController.list_all_orders),
+        ('list_today_orders', 'ix_lab_test_order_order_date_created_at',
+         LabTestOrderController.list_today_orders),
+        ('list_orders_by_status', 'ix_lab_test_order_status_created_at',
+         lambda: LabTestOrderController.list_orders_by_status('Ordered')),
+        ('search_orders', 'ix_order_search_token_token_order',
+         lambda: LabTestOrderController.search_orders('patient')),
+        ('list_patient_orders', 'ix_lab_test_order_patient_created_at',
+         lambda: PatientController.list_patient_orders(0)),
+        ('list_patient_orders archived', 'ix_lab_test_order_archive_patient_created_at',
+         lambda: PatientController.list_patient_orders(0, include_archived=True)),
+        ('search_orders archived', 'ix_order_search_token_archive_token_order',
+         lambda: LabTestOrderController.search_orders('patient', include_archived=True)),
+        ('find_patients_by_phone', 'ix_patient_phone_key_name_key',
+         lambda: PatientController.find_patients_by_phone('9000000000')),
+        ('dashboard today orders', 'ix_lab_test_order_order_date_created_at', dashboard_count('today_orders')),
+        *[(f'dashboard {status.value} orders', 'ix_lab_test_order_status_created_at',
+           dashboard_count(f'orders_{status.name.lower()}')) for status in OrderStatusEnum],
+        # Both lead with status and cover a COUNT; SQLite breaks the tie by
+        # index creation order
+        *[(f'dashboard {status.value} results',
+           ('ix_lab_test_result_status_created_at', 'ix_lab_test_result_status_completed_at'),
+           dashboard_count(f'results_{status.name.lower()}')) for status in ResultStatusEnum],
+        ('dashboard turnaround today', 'ix_lab_test_result_status_completed_at',
+         lambda: db.session.execute(tat_today_query()).one()),
+        ('list_all_results', 'ix_lab_test_result_created_at_id',
+         LabTestResultController.list_all_results),
+        ('list_completed_results', 'ix_lab_test_result_status_created_at',
+         LabTestResultController.list_completed_results),
+        ('list_abnormal_results', 'ix_lab_test_result_flag_created_at',
+         LabTestResultController.list_abnormal_results),
+        ('get_result_by_order', 'ix_lab_test_result_order_id',
+         lambda: LabTestResult.query.filter_by(order_id=0).all()),
+    ]
+
+
+def _capture_statements(fn):
+    """Run fn and return the (statement, parameters) pairs it sent"""
+    captured = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    # Read-only controller methods may run on the replica bind
+    engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _record)
+    try:
+        fn()
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', _record)
+    return captured
+
+
+def check_index_usage():
+    """
+    EXPLAIN every controller hot-path query and check it uses its index
+
+    Returns a list of (label, expected index, used, plan text) tuples.
+    Note that on a nearly empty MySQL table the optimizer may prefer a
+    full scan; run this against realistic volumes.
+    """
+    explain_prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    report = []
+    for label, index_names, fn in _index_checks():
+        if isinstance(index_names, str):
+            index_names = (index_names,)
+        statements = _capture_statements(fn)
+        plan_lines = []
+        with db.engine.connect() as conn:
+            for statement, parameters in statements:
+                rows = conn.exec_driver_sql(explain_prefix + statement, parameters).fetchall()
+                plan_lines.extend(' | '.join(str(col) for col in row) for row in rows)
+        plan = '\n'.join(plan_lines)
+        report.append((label, ' or '.join(index_names), any(name in plan for name in index_names), plan))
+    return report
@@ -4,10 +4,14 @@ Using SQLAlchemy ORM with MariaDB/MySQL backend
 """
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import mysql
 from datetime import datetime
 from enum import Enum as PyEnum
 
-db = SQLAlchemy()
+from app.routing import RoutingSession
+
+# RoutingSession can serve read-only controller queries from a replica bind
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 class OrderStatusEnum(PyEnum):
@@ -24,6 +28,22 @@ class ResultStatusEnum(PyEnum):
     COMPLETED = "Completed"
 
 
+# Allowed order status transitions: current status -> statuses it may move to
+VALID_ORDER_TRANSITIONS = {
+    OrderStatusEnum.DRAFT.value: [OrderStatusEnum.ORDERED.value, OrderStatusEnum.CANCELLED.value],
+    OrderStatusEnum.ORDERED.value: [OrderStatusEnum.COMPLETED.value, OrderStatusEnum.CANCELLED.value],
+    OrderStatusEnum.COMPLETED.value: [],  # Cannot transition from Completed
+    OrderStatusEnum.CANCELLED.value: [],  # Cannot transition from Cancelled
+}
+
+# Lifecycle timestamp column set when an order enters each status (Draft is created_at)
+ORDER_STATUS_TIMESTAMPS = {
+    OrderStatusEnum.ORDERED.value: 'ordered_at',
+    OrderStatusEnum.COMPLETED.value: 'completed_at',
+    OrderStatusEnum.CANCELLED.value: 'cancelled_at',
+}
+
+
 class PathologyTest(db.Model):
     """
     Test Master - Pathology tests available in the lab
@@ -35,6 +55,13 @@ class PathologyTest(db.Model):
     test_code = db.Column(db.String(20), nullable=False, unique=True)
     sample_type = db.Column(db.String(50), nullable=False)  # e.g., Blood, Urine, etc.
     normal_range = db.Column(db.String(100), nullable=False)  # e.g., 4.5-11.0 (10^9/L)
+    # Structured form of normal_range, filled by app.ranges.parse_normal_range
+    range_low = db.Column(db.Float, nullable=True)
+    range_high = db.Column(db.Float, nullable=True)
+    range_unit = db.Column(db.String(30), nullable=True)
+    range_comparator = db.Column(db.String(7), nullable=True)  # between, <, <=, >, >=
+    critical_low = db.Column(db.Float, nullable=True)
+    critical_high = db.Column(db.Float, nullable=True)
     price = db.Column(db.Numeric(10, 2), nullable=False)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -46,17 +73,125 @@ class PathologyTest(db.Model):
     def __repr__(self):
         return f"<PathologyTest {self.test_code}: {self.test_name}>"
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'test_name': self.test_name,
-            'test_code': self.test_code,
-            'sample_type': self.sample_type,
-            'normal_range': self.normal_range,
-            'price': float(self.price),
-            'is_active': self.is_active,
-            'created_at': self.created_at.isoformat(),
+    def to_dict(self, fields=None):
+        getters = {
+            'id': lambda: self.id,
+            'test_name': lambda: self.test_name,
+            'test_code': lambda: self.test_code,
+            'sample_type': lambda: self.sample_type,
+            'normal_range': lambda: self.normal_range,
+            'price': lambda: float(self.price),
+            'is_active': lambda: self.is_active,
+            'created_at': lambda: self.created_at.isoformat(),
         }
+        return {field: getters[field]() for field in fields or getters}
+
+
+class TestOrderStats(db.Model):
+    """
+    Per-test order counters and revenue, maintained by the order
+    controllers (see app.order_stats)
+    """
+    __tablename__ = 'test_order_stats'
+
+    test_id = db.Column(db.Integer, db.ForeignKey('pathology_test.id', ondelete='CASCADE'), primary_key=True)
+    order_count = db.Column(db.Integer, default=0, nullable=False)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    cancelled_count = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Numeric(14, 2), default=0, nullable=False)  # booked on completion
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<TestOrderStats {self.test_id}: {self.order_count} orders>"
+
+
+class TatDailyStats(db.Model):
+    """
+    Turnaround-time totals per completion day and test, rolled up
+    incrementally from lab_test_order_line by app.tat
+    """
+    __tablename__ = 'tat_daily_stats'
+
+    day = db.Column(db.Date, primary_key=True)  # UTC date the order line was completed
+    test_id = db.Column(db.Integer, db.ForeignKey('pathology_test.id', ondelete='CASCADE'), primary_key=True)
+    completed = db.Column(db.Integer, default=0, nullable=False)
+    total_seconds = db.Column(db.Float, default=0, nullable=False)
+    min_seconds = db.Column(db.Float, nullable=True)
+    max_seconds = db.Column(db.Float, nullable=True)
+
+    def __repr__(self):
+        return f"<TatDailyStats {self.day} test {self.test_id}: {self.completed}>"
+
+
+class TatDailyBucket(db.Model):
+    """
+    Turnaround-time histogram per completion day and test: `count` order
+    lines fell into log-scaled bucket `bucket` (see app.tat.bucket_of)
+    """
+    __tablename__ = 'tat_daily_bucket'
+
+    day = db.Column(db.Date, primary_key=True)
+    test_id = db.Column(db.Integer, db.ForeignKey('pathology_test.id', ondelete='CASCADE'), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<TatDailyBucket {self.day} test {self.test_id} bucket {self.bucket}: {self.count}>"
+
+
+class TatRollupState(db.Model):
+    """
+    Single-row watermark of the turnaround-time rollup: the last
+    (completed_at, id) of lab_test_order_line already counted
+    """
+    __tablename__ = 'tat_rollup_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    last_completed_at = db.Column(db.DateTime, nullable=True)
+    last_line_id = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<TatRollupState {self.last_completed_at} #{self.last_line_id}>"
+
+
+class JobStatusEnum(PyEnum):
+    """Background job lifecycle (see app.jobs)"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    DEAD = "dead"  # gave up after max_attempts
+
+
+class BackgroundJob(db.Model):
+    """
+    Background job queue - post-commit work (reports, SMS, LIS push) run
+    by `flask run-worker` instead of the request thread
+    """
+    __tablename__ = 'background_job'
+    __table_args__ = (
+        # Workers claim the oldest due queued jobs
+        db.Index('ix_background_job_status_run_after', 'status', 'run_after', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    # Enqueueing the same key twice is a no-op, so retried requests do not duplicate work
+    idempotency_key = db.Column(db.String(120), unique=True, nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(10), default=JobStatusEnum.QUEUED.value, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<BackgroundJob {self.id} {self.kind}: {self.status}>"
 
 
 class NamingSeries(db.Model):
@@ -72,49 +207,126 @@ class NamingSeries(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def get_next_name(self):
-        """Generate and return the next series name"""
-        self.current_number += 1
-        db.session.commit()
-        return f"{self.series_prefix}{self.current_number}"
+        """
+        Reserve and return the next series name
+        Uses an atomic UPDATE in its own short transaction instead of a
+        read-increment-commit, so concurrent callers never get the same name.
+        Order creation uses app.sequences.order_id_allocator instead, which
+        reserves whole blocks at a time.
+        """
+        from app.sequences import reserve_block
+
+        prefix, numbers = reserve_block(self.series_name, self.series_prefix, 1)
+        db.session.refresh(self)
+        return f"{prefix}{numbers[0]}"
 
     def __repr__(self):
         return f"<NamingSeries {self.series_name}: {self.series_prefix}{self.current_number}>"
 
 
+class Patient(db.Model):
+    """
+    Patient master - one row per patient, keyed by normalized phone and name
+    Family members sharing a phone are separate patients. A patient's
+    history is an indexed lookup on lab_test_order.patient_id.
+    """
+    __tablename__ = 'patient'
+    __table_args__ = (
+        # The dedup key; its phone_key prefix also serves lookups by phone
+        db.Index('ix_patient_phone_key_name_key', 'phone_key', 'name_key', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # As first entered
+    phone = db.Column(db.String(15), nullable=False)
+    # Digits only, national number (see app.patients.phone_key)
+    phone_key = db.Column(db.String(15), nullable=False)
+    name_key = db.Column(db.String(100), nullable=False)  # See app.patients.name_key
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    orders = db.relationship('LabTestOrder', backref='patient', lazy=True)
+
+    def __repr__(self):
+        return f"<Patient {self.id}: {self.name} ({self.phone})>"
+
+    def to_dict(self, fields=None):
+        getters = {
+            'id': lambda: self.id,
+            'name': lambda: self.name,
+            'phone': lambda: self.phone,
+            'created_at': lambda: self.created_at.isoformat(),
+        }
+        return {field: getters[field]() for field in fields or getters}
+
+
 class LabTestOrder(db.Model):
     """
     Lab Test Order - Orders placed for pathology tests
     """
     __tablename__ = 'lab_test_order'
+    __table_args__ = (
+        # Keyset pagination of /orders (newest first)
+        db.Index('ix_lab_test_order_created_at_id', 'created_at', 'id'),
+        # /orders?filter=<status>
+        db.Index('ix_lab_test_order_status_created_at', 'status', 'created_at', 'id'),
+        # /orders?filter=today and the dashboard's today count
+        db.Index('ix_lab_test_order_order_date_created_at', 'order_date', 'created_at', 'id'),
+        # Completed orders by completion time
+        db.Index('ix_lab_test_order_completed_at_id', 'completed_at', 'id'),
+        # A patient's history (newest first)
+        db.Index('ix_lab_test_order_patient_created_at', 'patient_id', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.String(20), unique=True, nullable=False, index=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    # Name and phone as entered on this order, shown on its pages and reports
+    # (the patient row keeps the ones first entered)
     patient_name = db.Column(db.String(100), nullable=False)
     patient_phone = db.Column(db.String(15), nullable=False)
+    # First line's test; the order's tests are its lines (LabTestOrderLine)
     test_id = db.Column(db.Integer, db.ForeignKey('pathology_test.id'), nullable=False)
     order_date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(20), default=OrderStatusEnum.DRAFT.value, nullable=False)
+    # Lifecycle timestamps, written once when the order enters each status
+    # (updated_at is overwritten by every change)
+    ordered_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    cancelled_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    archived = False  # see LabTestOrderArchive
+
     # Relationships
+    lines = db.relationship('LabTestOrderLine', backref='order', lazy=True, cascade='all, delete-orphan',
+                            order_by='LabTestOrderLine.line_no')
     test_results = db.relationship('LabTestResult', backref='order', lazy=True, cascade='all, delete-orphan')
 
     def __repr__(self):
-        return f"<LabTestOrder {self.order_id}: {self.patient_name} - {self.status}>"
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'order_id': self.order_id,
-            'patient_name': self.patient_name,
-            'patient_phone': self.patient_phone,
-            'test_id': self.test_id,
-            'test_name': self.test.test_name if self.test else None,
-            'order_date': self.order_date.isoformat(),
-            'status': self.status,
-            'created_at': self.created_at.isoformat(),
+        return f"<LabTestOrder {self.order_id}: patient {self.patient_id} - {self.status}>"
+
+    def to_dict(self, fields=None):
+        """Plain dict of `fields` (all by default); relationships only load for the fields that read them"""
+        getters = {
+            'id': lambda: self.id,
+            'order_id': lambda: self.order_id,
+            'patient_id': lambda: self.patient_id,
+            'patient_name': lambda: self.patient_name,
+            'patient_phone': lambda: self.patient_phone,
+            'test_id': lambda: self.test_id,
+            'test_name': lambda: self.test.test_name if self.test else None,
+            'lines': lambda: [line.to_dict() for line in self.lines],
+            'order_date': lambda: self.order_date.isoformat(),
+            'status': lambda: self.status,
+            'ordered_at': lambda: self.ordered_at.isoformat() if self.ordered_at else None,
+            'completed_at': lambda: self.completed_at.isoformat() if self.completed_at else None,
+            'cancelled_at': lambda: self.cancelled_at.isoformat() if self.cancelled_at else None,
+            'created_at': lambda: self.created_at.isoformat(),
+            'archived': lambda: self.archived,
         }
+        return {field: getters[field]() for field in fields or getters}
 
     def can_create_result(self):
         """Check if result can be created for this order"""
@@ -122,14 +334,131 @@ class LabTestOrder(db.Model):
 
     def can_transition_to(self, new_status):
         """Validate status transition"""
-        current = self.status
-        valid_transitions = {
-            OrderStatusEnum.DRAFT.value: [OrderStatusEnum.ORDERED.value, OrderStatusEnum.CANCELLED.value],
-            OrderStatusEnum.ORDERED.value: [OrderStatusEnum.COMPLETED.value, OrderStatusEnum.CANCELLED.value],
-            OrderStatusEnum.COMPLETED.value: [],  # Cannot transition from Completed
-            OrderStatusEnum.CANCELLED.value: [],  # Cannot transition from Cancelled
+        return new_status in VALID_ORDER_TRANSITIONS.get(self.status, [])
+
+    def set_status(self, new_status, when=None):
+        """Move to new_status and record its lifecycle timestamp (the caller validates)"""
+        when = when or datetime.utcnow()
+        self.status = new_status
+        self.updated_at = when
+        column = ORDER_STATUS_TIMESTAMPS.get(new_status)
+        if column and getattr(self, column) is None:
+            setattr(self, column, when)
+        if new_status == OrderStatusEnum.COMPLETED.value:
+            # Completing an order by hand completes any line still waiting for a result
+            for line in self.lines:
+                if line.completed_at is None:
+                    line.completed_at = when
+
+    @property
+    def test_ids(self):
+        return [line.test_id for line in self.lines]
+
+    def line_for_new_result(self, line_id=None):
+        """The line a new result belongs to: `line_id`, or the first line without a result"""
+        if line_id is None:
+            for line in self.lines:
+                if line.result is None:
+                    return line
+            raise ValueError("Every test on this order already has a result")
+        for line in self.lines:
+            if line.id == line_id:
+                if line.result is not None:
+                    raise ValueError(f"{line.test.test_code} on this order already has a result")
+                return line
+        raise ValueError(f"Line {line_id} does not belong to order {self.order_id}")
+
+
+class LabTestOrderLine(db.Model):
+    """
+    Lab Test Order Line - One test on an order, with its own result
+    A patient visit for CBC + LFT + TSH is one order with three lines.
+    """
+    __tablename__ = 'lab_test_order_line'
+    __table_args__ = (
+        db.UniqueConstraint('order_id', 'line_no', name='uq_lab_test_order_line_order_line_no'),
+        # Per-test counters (app.order_stats) and reflagging
+        db.Index('ix_lab_test_order_line_test_id', 'test_id'),
+        # Incremental turnaround-time rollup (app.tat) scans newly completed lines
+        db.Index('ix_lab_test_order_line_completed_at_id', 'completed_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('lab_test_order.id', ondelete='CASCADE'), nullable=False)
+    line_no = db.Column(db.Integer, nullable=False)  # 1-based position on the order
+    test_id = db.Column(db.Integer, db.ForeignKey('pathology_test.id'), nullable=False)
+    price = db.Column(db.Numeric(10, 2), nullable=False)  # test price when ordered
+    completed_at = db.Column(db.DateTime, nullable=True)  # result completed (or order completed by hand)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    test = db.relationship('PathologyTest')
+
+    def __repr__(self):
+        return f"<LabTestOrderLine {self.order_id}/{self.line_no}: test {self.test_id}>"
+
+    def to_dict(self, fields=None):
+        getters = {
+            'id': lambda: self.id,
+            'line_no': lambda: self.line_no,
+            'test_id': lambda: self.test_id,
+            'test_code': lambda: self.test.test_code if self.test else None,
+            'test_name': lambda: self.test.test_name if self.test else None,
+            'price': lambda: float(self.price),
+            'completed_at': lambda: self.completed_at.isoformat() if self.completed_at else None,
         }
-        return new_status in valid_transitions.get(current, [])
+        return {field: getters[field]() for field in fields or getters}
+
+
+class CatalogVersion(db.Model):
+    """
+    Single-row counter bumped in the same transaction as every test catalog
+    write (see app.catalog); processes compare it to their cached snapshot
+    """
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CatalogVersion {self.version}>"
+
+
+class SchemaVersion(db.Model):
+    """
+    Single-row record of the schema version applied by `flask init-db`
+    create_app reads this one row at boot instead of running DDL.
+    """
+    __tablename__ = 'schema_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SchemaVersion {self.version}>"
+
+
+class OrderSearchToken(db.Model):
+    """
+    Trigram search index for orders
+    One row per distinct trigram of an order's normalized order ID,
+    patient name and phone digits (see app.search)
+    """
+    __tablename__ = 'order_search_token'
+    __table_args__ = (
+        db.Index('ix_order_search_token_token_order', 'token', 'order_id'),
+    )
+
+    order_id = db.Column(db.Integer, db.ForeignKey('lab_test_order.id', ondelete='CASCADE'), primary_key=True)
+    # Binary collation so distinct trigrams never collide under MySQL's case/accent folding
+    token = db.Column(
+        db.String(3).with_variant(mysql.VARCHAR(3, collation='utf8mb4_bin'), 'mysql'),
+        primary_key=True,
+    )
+
+    def __repr__(self):
+        return f"<OrderSearchToken {self.order_id}: {self.token}>"
 
 
 class LabTestResult(db.Model):
@@ -137,44 +466,209 @@ class LabTestResult(db.Model):
     Lab Test Result - Results entered for completed tests
     """
     __tablename__ = 'lab_test_result'
+    __table_args__ = (
+        # Result lookup for an order (view_order, get_result_by_order)
+        db.Index('ix_lab_test_result_order_id', 'order_id'),
+        # One result per order line
+        db.Index('ix_lab_test_result_line_id', 'line_id', unique=True),
+        # Keyset pagination of /results (newest first)
+        db.Index('ix_lab_test_result_created_at_id', 'created_at', 'id'),
+        # /results?filter=completed
+        db.Index('ix_lab_test_result_status_created_at', 'status', 'created_at', 'id'),
+        # /results?filter=abnormal
+        db.Index('ix_lab_test_result_flag_created_at', 'flag', 'created_at', 'id'),
+        # Dashboard turnaround for results completed today
+        db.Index('ix_lab_test_result_status_completed_at', 'status', 'completed_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('lab_test_order.id'), nullable=False)
+    # Nullable only for rows written before order lines existed (upgrade-db links them)
+    line_id = db.Column(db.Integer, db.ForeignKey('lab_test_order_line.id'), nullable=True)
     result_value = db.Column(db.String(100), nullable=False)
+    result_numeric = db.Column(db.Float, nullable=True)  # parsed from result_value
+    flag = db.Column(db.String(10), nullable=True)  # normal, low, high, critical (see app.ranges)
     technician_notes = db.Column(db.Text, nullable=True)
     status = db.Column(db.String(20), default=ResultStatusEnum.DRAFT.value, nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)  # set once by mark_completed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    archived = False  # see LabTestResultArchive
+
+    line = db.relationship('LabTestOrderLine', backref=db.backref('result', uselist=False))
+
     def __repr__(self):
         return f"<LabTestResult Order:{self.order_id} - {self.status}>"
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'order_id': self.order_id,
-            'result_value': self.result_value,
-            'technician_notes': self.technician_notes,
-            'status': self.status,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
+    def to_dict(self, fields=None):
+        getters = {
+            'id': lambda: self.id,
+            'order_id': lambda: self.order_id,
+            'line_id': lambda: self.line_id,
+            'result_value': lambda: self.result_value,
+            'technician_notes': lambda: self.technician_notes,
+            'status': lambda: self.status,
+            'created_at': lambda: self.created_at.isoformat(),
+            'updated_at': lambda: self.updated_at.isoformat(),
         }
+        return {field: getters[field]() for field in fields or getters}
+
+    @property
+    def test(self):
+        """The test this result is for (results from before order lines fall back to the order's test)"""
+        return self.line.test if self.line else self.order.test
 
     def can_complete(self):
         """Check if result can be marked as completed"""
         return self.status == ResultStatusEnum.DRAFT.value
 
     def mark_completed(self):
-        """Mark result as completed and update related order"""
+        """
+        Mark result as completed and complete its order line; the order
+        moves to Completed once every line is complete.
+        The caller commits (see LabTestResultController.complete_result).
+        Returns True if this completed the order.
+        """
         if not self.can_complete():
             raise ValueError("Result can only be completed from Draft status")
         
+        now = datetime.utcnow()
         self.status = ResultStatusEnum.COMPLETED.value
-        self.updated_at = datetime.utcnow()
-        
-        # Update order status to Completed
-        if self.order:
-            self.order.status = OrderStatusEnum.COMPLETED.value
-            self.order.updated_at = datetime.utcnow()
+        self.updated_at = now
+        self.completed_at = now
+        if self.line and self.line.completed_at is None:
+            self.line.completed_at = now
         
-        db.session.commit()
+        # Update order status to Completed when this was its last open line
+        order = self.order
+        if not order or order.status == OrderStatusEnum.COMPLETED.value:
+            return False
+        if all(line.completed_at is not None for line in order.lines):
+            order.set_status(OrderStatusEnum.COMPLETED.value, now)
+            return True
+        return False
+
+
+# ===== ARCHIVE =====
+# Completed/Cancelled orders older than the retention window are moved here
+# by app.archive, with their lines, results and search tokens. Rows keep
+# their ids, so links and job payloads stay valid; the columns mirror the
+# live tables. Archived rows are read-only.
+
+class LabTestOrderArchive(db.Model):
+    """Archived lab test order (same id and columns as lab_test_order)"""
+    __tablename__ = 'lab_test_order_archive'
+    __table_args__ = (
+        # Merged newest-first listings and patient history with the live table
+        db.Index('ix_lab_test_order_archive_created_at_id', 'created_at', 'id'),
+        db.Index('ix_lab_test_order_archive_patient_created_at', 'patient_id', 'created_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.String(20), unique=True, nullable=False, index=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    patient_name = db.Column(db.String(100), nullable=False)
+    patient_phone = db.Column(db.String(15), nullable=False)
+    test_id = db.Column(db.Integer, db.ForeignKey('pathology_test.id'), nullable=False)
+    order_date = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    ordered_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    cancelled_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    archived = True
+
+    patient = db.relationship('Patient')
+    test = db.relationship('PathologyTest')
+    lines = db.relationship('LabTestOrderLineArchive', backref='order', lazy=True,
+                            order_by='LabTestOrderLineArchive.line_no')
+    test_results = db.relationship('LabTestResultArchive', backref='order', lazy=True)
+
+    test_ids = LabTestOrder.test_ids
+    to_dict = LabTestOrder.to_dict
+
+    def __repr__(self):
+        return f"<LabTestOrderArchive {self.order_id}: patient {self.patient_id} - {self.status}>"
+
+    def can_create_result(self):
+        return False
+
+    def can_transition_to(self, new_status):
+        return False
+
+
+class LabTestOrderLineArchive(db.Model):
+    """Archived order line (same id and columns as lab_test_order_line)"""
+    __tablename__ = 'lab_test_order_line_archive'
+    __table_args__ = (
+        db.Index('ix_lab_test_order_line_archive_order_id', 'order_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('lab_test_order_archive.id'), nullable=False)
+    line_no = db.Column(db.Integer, nullable=False)
+    test_id = db.Column(db.Integer, db.ForeignKey('pathology_test.id'), nullable=False)
+    price = db.Column(db.Numeric(10, 2), nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime)
+
+    test = db.relationship('PathologyTest')
+
+    to_dict = LabTestOrderLine.to_dict
+
+    def __repr__(self):
+        return f"<LabTestOrderLineArchive {self.order_id}/{self.line_no}: test {self.test_id}>"
+
+
+class LabTestResultArchive(db.Model):
+    """Archived lab test result (same id and columns as lab_test_result)"""
+    __tablename__ = 'lab_test_result_archive'
+    __table_args__ = (
+        db.Index('ix_lab_test_result_archive_order_id', 'order_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('lab_test_order_archive.id'), nullable=False)
+    line_id = db.Column(db.Integer, db.ForeignKey('lab_test_order_line_archive.id'), nullable=True)
+    result_value = db.Column(db.String(100), nullable=False)
+    result_numeric = db.Column(db.Float, nullable=True)
+    flag = db.Column(db.String(10), nullable=True)
+    technician_notes = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+
+    archived = True
+
+    line = db.relationship('LabTestOrderLineArchive', backref=db.backref('result', uselist=False))
+
+    test = LabTestResult.test
+    to_dict = LabTestResult.to_dict
+
+    def __repr__(self):
+        return f"<LabTestResultArchive Order:{self.order_id} - {self.status}>"
+
+    def can_complete(self):
+        return False
+
+
+class OrderSearchTokenArchive(db.Model):
+    """Search tokens of archived orders (see OrderSearchToken)"""
+    __tablename__ = 'order_search_token_archive'
+    __table_args__ = (
+        db.Index('ix_order_search_token_archive_token_order', 'token', 'order_id'),
+    )
+
+    order_id = db.Column(db.Integer, db.ForeignKey('lab_test_order_archive.id', ondelete='CASCADE'), primary_key=True)
+    token = db.Column(
+        db.String(3).with_variant(mysql.VARCHAR(3, collation='utf8mb4_bin'), 'mysql'),
+        primary_key=True,
+    )
+
+    def __repr__(self):
+        return f"<OrderSearchTokenArchive {self.order_id}: {self.token}>"
@@ -0,0 +1,200 @@
+"""
+Order lines (panels): backfill and visit merging
+A patient visit for several tests is one lab_test_order with one
+lab_test_order_line per test; each line gets its own result. Orders
+written before lines existed get a single line 1 for their test
+(backfill_order_lines, run by upgrade-db).
+
+Before panels, a visit for three tests was booked as three orders.
+merge_visits folds such same-visit orders (same patient, date and status)
+into the earliest one as extra lines; it is opt-in (`flask merge-visits`)
+because it retires order IDs.
+Retired order IDs stay searchable: their trigrams are added to the
+surviving order's search tokens.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, delete, func, insert, select, tuple_, update
+from sqlalchemy.orm import aliased
+
+from app.models import db, PathologyTest, LabTestOrder, LabTestOrderLine, LabTestResult, OrderSearchToken
+from app.search import normalize, trigrams
+
+
+MERGE_BATCH_SIZE = 500
+MERGE_WINDOW_MINUTES = 120
+
+_line_table = LabTestOrderLine.__table__
+_token_table = OrderSearchToken.__table__
+
+
+# ===== BACKFILL =====
+
+def backfill_order_lines():
+    """
+    Give every order without lines a line 1 for its test (price from the
+    catalog, completion from the order) and link the order's latest result
+    without a line to it, in two set-based statements.
+    Returns the number of lines created; the caller commits.
+    """
+    has_lines = select(LabTestOrderLine.id).where(LabTestOrderLine.order_id == LabTestOrder.id).exists()
+    created = db.session.execute(
+        insert(_line_table).from_select(
+            ['order_id', 'line_no', 'test_id', 'price', 'completed_at', 'created_at'],
+            select(
+                LabTestOrder.id, 1, LabTestOrder.test_id, PathologyTest.price,
+                LabTestOrder.completed_at, LabTestOrder.created_at,
+            )
+            .join(PathologyTest, LabTestOrder.test_id == PathologyTest.id)
+            .where(~has_lines),
+        )
+    ).rowcount
+
+    # Latest result per order that has no linked result yet; the derived
+    # table keeps MySQL from rejecting a subquery on the UPDATE's own table
+    linked = aliased(LabTestResult)
+    latest = (
+        select(func.max(LabTestResult.id).label('result_id'))
+        .where(~select(linked.id).where(
+            linked.order_id == LabTestResult.order_id, linked.line_id.isnot(None)
+        ).exists())
+        .group_by(LabTestResult.order_id)
+        .subquery()
+    )
+    first_line = (
+        select(LabTestOrderLine.id)
+        .where(LabTestOrderLine.order_id == LabTestResult.order_id, LabTestOrderLine.line_no == 1)
+        .scalar_subquery()
+    )
+    db.session.execute(
+        update(LabTestResult)
+        .where(LabTestResult.line_id.is_(None), LabTestResult.id.in_(select(latest.c.result_id)))
+        .values(line_id=first_line)
+        .execution_options(synchronize_session=False)
+    )
+    return created
+
+
+# ===== VISIT MERGING =====
+
+def _visits(orders, window):
+    """
+    Split one (patient, date, status) group into visits: each order
+    created within `window` of the visit's first.
+    """
+    orders = sorted(orders, key=lambda order: (order.created_at, order.id))
+    visits = []
+    current = [orders[0]]
+    for order in orders[1:]:
+        if order.created_at - current[0].created_at <= window:
+            current.append(order)
+        else:
+            visits.append(current)
+            current = [order]
+    visits.append(current)
+    return [visit for visit in visits if len(visit) > 1]
+
+
+def _merge_visit(visit, next_line_no):
+    """Fold visit[1:] into visit[0]; returns the retired order IDs"""
+    survivor, merged = visit[0], visit[1:]
+    merged_ids = [order.id for order in merged]
+
+    line_rows = db.session.execute(
+        select(LabTestOrderLine.id)
+        .where(LabTestOrderLine.order_id.in_(merged_ids))
+        .order_by(LabTestOrderLine.order_id, LabTestOrderLine.line_no)
+    ).scalars().all()
+    if line_rows:
+        db.session.execute(
+            update(_line_table)
+            .where(_line_table.c.id == bindparam('b_id'))
+            .values(order_id=survivor.id, line_no=bindparam('b_line_no')),
+            [{'b_id': line_id, 'b_line_no': next_line_no + i} for i, line_id in enumerate(line_rows)],
+        )
+    db.session.execute(
+        update(LabTestResult)
+        .where(LabTestResult.order_id.in_(merged_ids))
+        .values(order_id=survivor.id)
+        .execution_options(synchronize_session=False)
+    )
+
+    # The visit was ordered when its first test was, and finished with its last
+    stamps = {}
+    for column, pick in (('ordered_at', min), ('completed_at', max), ('cancelled_at', max)):
+        values = [getattr(order, column) for order in visit if getattr(order, column)]
+        if values:
+            stamps[column] = pick(values)
+    db.session.execute(
+        update(LabTestOrder)
+        .where(LabTestOrder.id == survivor.id)
+        .values(updated_at=datetime.utcnow(), **stamps)
+        .execution_options(synchronize_session=False)
+    )
+
+    retired = [order.order_id for order in merged]
+    existing = set(db.session.execute(
+        select(_token_table.c.token).where(_token_table.c.order_id == survivor.id)
+    ).scalars())
+    extra = set().union(*(trigrams(normalize(order_id)) for order_id in retired)) - existing
+    db.session.execute(delete(_token_table).where(_token_table.c.order_id.in_(merged_ids)))
+    if extra:
+        db.session.execute(insert(_token_table), [{'order_id': survivor.id, 'token': token} for token in extra])
+    db.session.execute(
+        delete(LabTestOrder).where(LabTestOrder.id.in_(merged_ids)).execution_options(synchronize_session=False)
+    )
+    return retired
+
+
+def merge_visits(window_minutes=MERGE_WINDOW_MINUTES, batch_size=MERGE_BATCH_SIZE, dry_run=False):
+    """
+    Merge single-test orders from the same visit (same patient, order date
+    and status, created within `window_minutes` of each other) into the
+    visit's earliest order. Candidate groups are paged in
+    (order_date, patient, status) order, `batch_size` groups per
+    transaction. With dry_run nothing is written.
+    Returns {'visits': int, 'orders_merged': int, 'examples': [(survivor, [retired])]}
+    """
+    window = timedelta(minutes=window_minutes)
+    key = (LabTestOrder.order_date, LabTestOrder.patient_id, LabTestOrder.status)
+    summary = {'visits': 0, 'orders_merged': 0, 'examples': []}
+    last_key = None
+    while True:
+        stmt = select(*key).group_by(*key).having(func.count(LabTestOrder.id) > 1).order_by(*key)
+        if last_key is not None:
+            stmt = stmt.where(tuple_(*key) > tuple_(*last_key))
+        keys = db.session.execute(stmt.limit(batch_size)).all()
+        if not keys:
+            break
+        last_key = tuple(keys[-1])
+
+        groups = defaultdict(list)
+        for order in LabTestOrder.query.filter(tuple_(*key).in_([tuple(k) for k in keys])).all():
+            groups[(order.order_date, order.patient_id, order.status)].append(order)
+        visits = [visit for orders in groups.values() for visit in _visits(orders, window)]
+        if not visits:
+            continue
+
+        survivors = [visit[0].id for visit in visits]
+        next_line_no = dict(db.session.execute(
+            select(LabTestOrderLine.order_id, func.max(LabTestOrderLine.line_no))
+            .where(LabTestOrderLine.order_id.in_(survivors))
+            .group_by(LabTestOrderLine.order_id)
+        ).all())
+        for visit in visits:
+            survivor = visit[0]
+            retired = [order.order_id for order in visit[1:]]
+            if not dry_run:
+                retired = _merge_visit(visit, next_line_no.get(survivor.id, 0) + 1)
+            summary['visits'] += 1
+            summary['orders_merged'] += len(retired)
+            if len(summary['examples']) < 10:
+                summary['examples'].append((survivor.order_id, retired))
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+        db.session.expunge_all()
+    return summary
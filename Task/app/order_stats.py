@@ -0,0 +1,126 @@
+"""
+Per-test order counters
+test_order_stats holds one row per test with its order, completed and
+cancelled counts and its revenue. Counts are per order line: a panel
+order for three tests counts once against each of them. The order controllers keep the row up
+to date with relative UPDATEs (count = count + n) in the same transaction
+as the write, so the test pages read one row per test instead of loading
+or counting every order.
+
+Revenue is booked when an order reaches Completed, at the prices stored on
+its lines (the test's price when the order was placed), so a later price
+change never rewrites it; Completed is terminal, so revenue is never
+reversed.
+"""
+
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import case, delete, func, insert, select, union_all, update
+
+from app.models import (
+    db, PathologyTest, LabTestOrder, LabTestOrderLine, TestOrderStats, LabTestOrderArchive, LabTestOrderLineArchive,
+    OrderStatusEnum,
+)
+
+
+_stats_table = TestOrderStats.__table__
+
+# Counter bumped when an order moves into each status
+_STATUS_COUNTERS = {
+    OrderStatusEnum.COMPLETED.value: 'completed_count',
+    OrderStatusEnum.CANCELLED.value: 'cancelled_count',
+}
+
+EMPTY_STATS = {'order_count': 0, 'completed_count': 0, 'cancelled_count': 0, 'revenue': 0}
+
+
+def _bump(test_counts, counter, revenue=None):
+    """Add test_counts[test_id] to `counter` (and revenue[test_id] to revenue) for each test (caller commits)"""
+    now = datetime.utcnow()
+    for test_id, count in Counter(test_counts).items():
+        values = {counter: getattr(_stats_table.c, counter) + count, 'updated_at': now}
+        if revenue is not None:
+            values['revenue'] = _stats_table.c.revenue + revenue.get(test_id, 0)
+        updated = db.session.execute(
+            update(_stats_table).where(_stats_table.c.test_id == test_id).values(**values)
+        ).rowcount
+        if not updated:
+            # Tests created before the counters existed get their row lazily
+            ensure_stats_row(test_id)
+            db.session.execute(
+                update(_stats_table).where(_stats_table.c.test_id == test_id).values(**values)
+            )
+
+
+def ensure_stats_row(test_id):
+    """Insert an all-zero counter row for a test"""
+    db.session.execute(insert(_stats_table).values(test_id=test_id, updated_at=datetime.utcnow(), **EMPTY_STATS))
+
+
+def orders_created(test_ids):
+    """Count new orders; test_ids is one entry per order (or a {test_id: n} mapping)"""
+    _bump(test_ids, 'order_count')
+
+
+def orders_moved(lines, new_status):
+    """
+    Count orders moving into new_status (only terminal statuses are
+    tracked); `lines` is one (test_id, price) pair per order line.
+    Completion books the line prices as revenue.
+    """
+    counter = _STATUS_COUNTERS.get(new_status)
+    if not counter:
+        return
+    counts = Counter()
+    revenue = Counter()
+    for test_id, price in lines:
+        counts[test_id] += 1
+        revenue[test_id] += price
+    _bump(counts, counter, revenue if counter == 'completed_count' else None)
+
+
+def stats_for(test_ids=None):
+    """{test_id: {'order_count', 'completed_count', 'cancelled_count', 'revenue'}}, one query"""
+    stmt = select(_stats_table)
+    if test_ids is not None:
+        stmt = stmt.where(_stats_table.c.test_id.in_(list(test_ids)))
+    return {
+        row.test_id: {key: getattr(row, key) for key in EMPTY_STATS}
+        for row in db.session.execute(stmt)
+    }
+
+
+def rebuild_stats():
+    """
+    Recompute every counter row from the order lines, live and archived,
+    with one grouped query (e.g. after the table is first created).
+    Revenue sums the line prices. Returns the number of tests with stats;
+    the caller commits.
+    """
+    lines = union_all(
+        select(LabTestOrderLine.test_id, LabTestOrderLine.price, LabTestOrder.status)
+        .join(LabTestOrder, LabTestOrder.id == LabTestOrderLine.order_id),
+        select(LabTestOrderLineArchive.test_id, LabTestOrderLineArchive.price, LabTestOrderArchive.status)
+        .join(LabTestOrderArchive, LabTestOrderArchive.id == LabTestOrderLineArchive.order_id),
+    ).subquery('lines')
+    completed = lines.c.status == OrderStatusEnum.COMPLETED.value
+    cancelled = lines.c.status == OrderStatusEnum.CANCELLED.value
+    aggregate = (
+        select(
+            PathologyTest.id.label('test_id'),
+            func.count(lines.c.test_id).label('order_count'),
+            func.coalesce(func.sum(case((completed, 1), else_=0)), 0).label('completed_count'),
+            func.coalesce(func.sum(case((cancelled, 1), else_=0)), 0).label('cancelled_count'),
+            func.coalesce(func.sum(case((completed, lines.c.price), else_=0)), 0).label('revenue'),
+        )
+        .select_from(PathologyTest)
+        .outerjoin(lines, lines.c.test_id == PathologyTest.id)
+        .group_by(PathologyTest.id)
+    )
+    now = datetime.utcnow()
+    rows = [dict(row._mapping, updated_at=now) for row in db.session.execute(aggregate)]
+    db.session.execute(delete(_stats_table))
+    if rows:
+        db.session.execute(insert(_stats_table), rows)
+    return len(rows)
@@ -0,0 +1,201 @@
+"""
+Rendered page cache for the order, result and test detail pages
+Each page is cached per process, per database and per entity id, together
+with a version stamp: one cheap probe SELECT of the updated_at columns (and
+statuses / counts) of every row the page shows. A hit re-runs only the
+probe; a changed stamp re-renders and replaces the entry. Entries are
+evicted least recently used beyond PAGE_CACHE_SIZE (0 disables caching).
+
+Responses carry an ETag (hash of the page) and Last-Modified (newest
+stamp) with `Cache-Control: private, no-cache`, so a browser reopening a
+finished report revalidates and gets a 304 for the cost of the probe.
+
+Pages are rendered fresh, without validators, while flash messages are
+pending (they are part of the page) and while the newest stamp is younger
+than PAGE_CACHE_SETTLE_SECONDS: MySQL DATETIME keeps whole seconds, so two
+changes within one second would otherwise share a stamp.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app, make_response, request, session
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from app.models import (
+    db, PathologyTest, TestOrderStats, Patient, LabTestOrder, LabTestOrderLine, LabTestResult,
+    LabTestOrderArchive, LabTestOrderLineArchive, LabTestResultArchive,
+)
+from app.routing import read_only
+
+
+DEFAULT_SIZE = 512
+DEFAULT_SETTLE_SECONDS = 2.0
+
+
+# ===== VERSION PROBES =====
+# Each returns a tuple that changes whenever the page would, or None when
+# the entity does not exist (the route then reports it as usual).
+
+def _order_version(order_model, line_model, result_model, order_id):
+    results = select(result_model).where(result_model.order_id == order_id)
+    lines = (
+        select(line_model)
+        .join(PathologyTest, line_model.test_id == PathologyTest.id)
+        .where(line_model.order_id == order_id)
+    )
+    row = db.session.execute(
+        select(
+            order_model.status,
+            order_model.updated_at,
+            Patient.updated_at,
+            results.with_only_columns(func.count(result_model.id)).scalar_subquery(),
+            results.with_only_columns(func.max(result_model.updated_at)).scalar_subquery(),
+            lines.with_only_columns(func.count(line_model.id)).scalar_subquery(),
+            lines.with_only_columns(func.max(PathologyTest.updated_at)).scalar_subquery(),
+        )
+        .join(Patient, order_model.patient_id == Patient.id)
+        .where(order_model.id == order_id)
+    ).first()
+    return (order_model.__tablename__,) + tuple(row) if row else None
+
+
+@read_only
+def order_version(order_id):
+    """Order, patient, lines' tests and results behind /orders/<id> (live, else archived)"""
+    return (_order_version(LabTestOrder, LabTestOrderLine, LabTestResult, order_id)
+            or _order_version(LabTestOrderArchive, LabTestOrderLineArchive, LabTestResultArchive, order_id))
+
+
+def _result_version(result_model, order_model, line_model, result_id):
+    line_test = aliased(PathologyTest)
+    order_test = aliased(PathologyTest)
+    row = db.session.execute(
+        select(
+            result_model.status,
+            result_model.updated_at,
+            order_model.updated_at,
+            Patient.updated_at,
+            line_test.updated_at,
+            order_test.updated_at,
+        )
+        .join(order_model, result_model.order_id == order_model.id)
+        .join(Patient, order_model.patient_id == Patient.id)
+        .outerjoin(line_model, result_model.line_id == line_model.id)
+        .outerjoin(line_test, line_model.test_id == line_test.id)
+        .outerjoin(order_test, order_model.test_id == order_test.id)
+        .where(result_model.id == result_id)
+    ).first()
+    return (result_model.__tablename__,) + tuple(row) if row else None
+
+
+@read_only
+def result_version(result_id):
+    """Result, its order, patient and test behind /results/<id> (live, else archived)"""
+    return (_result_version(LabTestResult, LabTestOrder, LabTestOrderLine, result_id)
+            or _result_version(LabTestResultArchive, LabTestOrderArchive, LabTestOrderLineArchive, result_id))
+
+
+@read_only
+def test_version(test_id):
+    """Test and its order counters behind /tests/<id>/view"""
+    row = db.session.execute(
+        select(
+            PathologyTest.updated_at,
+            TestOrderStats.updated_at,
+            TestOrderStats.order_count,
+            TestOrderStats.completed_count,
+            TestOrderStats.cancelled_count,
+        )
+        .outerjoin(TestOrderStats, TestOrderStats.test_id == PathologyTest.id)
+        .where(PathologyTest.id == test_id)
+    ).first()
+    return tuple(row) if row else None
+
+
+# ===== CACHE =====
+
+class PageCache:
+    """Per-process LRU of rendered pages, keyed on (database, kind, id)"""
+
+    def __init__(self, size_config='PAGE_CACHE_SIZE', settle_config='PAGE_CACHE_SETTLE_SECONDS'):
+        self.size_config = size_config
+        self.settle_config = settle_config
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.not_modified = 0
+
+    def _size(self):
+        return int(current_app.config.get(self.size_config, DEFAULT_SIZE))
+
+    def _settled(self, last_modified):
+        settle = float(current_app.config.get(self.settle_config, DEFAULT_SETTLE_SECONDS))
+        return last_modified is None or datetime.utcnow() - last_modified >= timedelta(seconds=settle)
+
+    def _lookup(self, key, version, render):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['version'] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        # Render outside the lock; a concurrent miss on the same page renders twice
+        html = render()
+        entry = {'version': version, 'html': html, 'etag': hashlib.sha1(html.encode('utf-8')).hexdigest()}
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._size():
+                self._entries.popitem(last=False)
+        return entry
+
+    def respond(self, kind, entity_id, version, render):
+        """
+        The response for one detail page: `version` comes from the matching
+        probe above and `render` returns the page HTML. Answers 304 when
+        the request's validators match.
+        """
+        if version is None or self._size() <= 0 or session.get('_flashes'):
+            self.bypassed += 1
+            return render()
+        last_modified = max((value for value in version if isinstance(value, datetime)), default=None)
+        if not self._settled(last_modified):
+            self.bypassed += 1
+            return render()
+
+        entry = self._lookup((str(db.engine.url), kind, entity_id), version, render)
+        response = make_response(entry['html'])
+        response.set_etag(entry['etag'])
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            self.not_modified += 1
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'bypassed': self.bypassed,
+            'not_modified': self.not_modified,
+        }
+
+
+page_cache = PageCache()
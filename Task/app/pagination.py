@@ -0,0 +1,173 @@
+"""
+Keyset (cursor) pagination helpers for Pathology module
+Pages are keyed on (created_at, id) so deep pages cost the same as the first
+"""
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+def encode_cursor(created_at, row_id):
+    """Encode a (created_at, id) key into an opaque URL-safe cursor"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor back into a (created_at, id) key"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_at_str, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at_str), int(row_id)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Invalid pagination cursor")
+
+
+def encode_rank_cursor(score, row_id):
+    """Encode a (score, id) key for ranked result pages"""
+    raw = f"{score}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_rank_cursor(cursor):
+    """Decode a ranked-page cursor back into a (score, id) key"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        score, row_id = raw.split('|', 1)
+        return int(score), int(row_id)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Invalid pagination cursor")
+
+
+def clamp_per_page(per_page):
+    """Normalize a requested page size into the allowed range"""
+    if not per_page:
+        return DEFAULT_PER_PAGE
+    return max(1, min(int(per_page), MAX_PER_PAGE))
+
+
+class KeysetPage:
+    """
+    One page of rows plus the cursors needed to move forwards/backwards
+
+    Iterating the page yields its rows, so templates can treat it like the
+    plain list the listing methods used to return.
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def __repr__(self):
+        return f"<KeysetPage {len(self.items)} rows next={self.has_next} prev={self.has_prev}>"
+
+
+def keyset_paginate(query, model, cursor=None, direction='next', per_page=None):
+    """
+    Paginate a query newest-first on (model.created_at, model.id)
+
+    - direction='next' returns rows strictly older than the cursor
+    - direction='prev' returns rows strictly newer than the cursor
+    The query must not already carry an ORDER BY.
+    """
+    if direction not in ('next', 'prev'):
+        raise ValueError(f"Invalid pagination direction: {direction}")
+
+    per_page = clamp_per_page(per_page)
+    created_col, id_col = model.created_at, model.id
+
+    if cursor:
+        cursor_created, cursor_id = decode_cursor(cursor)
+        if direction == 'next':
+            query = query.filter(or_(
+                created_col < cursor_created,
+                and_(created_col == cursor_created, id_col < cursor_id),
+            ))
+        else:
+            query = query.filter(or_(
+                created_col > cursor_created,
+                and_(created_col == cursor_created, id_col > cursor_id),
+            ))
+
+    if direction == 'next':
+        query = query.order_by(created_col.desc(), id_col.desc())
+    else:
+        query = query.order_by(created_col.asc(), id_col.asc())
+
+    # Fetch one extra row to learn whether another page exists
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if direction == 'prev':
+        rows.reverse()
+        has_next = cursor is not None
+        has_prev = has_more
+    else:
+        has_next = has_more
+        has_prev = cursor is not None
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_next:
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+        if has_prev:
+            prev_cursor = encode_cursor(rows[0].created_at, rows[0].id)
+
+    return KeysetPage(rows, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def keyset_paginate_merged(sources, cursor=None, direction='next', per_page=None):
+    """
+    keyset_paginate over several (query, model) sources with disjoint ids,
+    e.g. live and archived orders, merged into one newest-first page
+
+    Each source is paged on its own (created_at, id) index with the same
+    cursor; the merged page keeps the per_page rows nearest the cursor.
+    """
+    per_page = clamp_per_page(per_page)
+    pages = [keyset_paginate(query, model, cursor=cursor, direction=direction, per_page=per_page)
+             for query, model in sources]
+    rows = sorted((row for page in pages for row in page), key=lambda row: (row.created_at, row.id), reverse=True)
+    has_more = len(rows) > per_page or any(page.has_prev if direction == 'prev' else page.has_next
+                                           for page in pages)
+    if direction == 'prev':
+        rows = rows[-per_page:]
+        has_next, has_prev = cursor is not None, has_more
+    else:
+        rows = rows[:per_page]
+        has_next, has_prev = has_more, cursor is not None
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_next:
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+        if has_prev:
+            prev_cursor = encode_cursor(rows[0].created_at, rows[0].id)
+    return KeysetPage(rows, next_cursor=next_cursor, prev_cursor=prev_cursor)
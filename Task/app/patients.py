@@ -0,0 +1,202 @@
+"""
+Patient master: phone and name keys, resolution and deduplication
+Every order points at a patient row (lab_test_order.patient_id); the
+patient is identified by a normalized phone key plus a normalized name
+key, with a unique index on the pair, so "+91 98987 45612", "098987 45612"
+and "9898745612" are one patient, while family members sharing a phone
+stay separate patients. A known patient's row is never rewritten from a
+later order: each order keeps the name and phone entered on it
+(lab_test_order.patient_name/patient_phone), which is what its pages,
+reports, exports and search index use.
+
+Orders written before the patient table existed only carry that snapshot;
+backfill_patients links them to patients in id-ordered batches (run by
+upgrade-db). dedupe_patients re-keys existing patients and merges any that
+now share a key, e.g. after the normalization rules change.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, LabTestOrder, LabTestOrderArchive, Patient
+from app.search import normalize
+
+
+# National numbers are 10 digits; this country code / trunk prefix is dropped
+COUNTRY_CODE = '91'
+NATIONAL_LENGTH = 10
+BACKFILL_BATCH_SIZE = 5000
+
+_patient_table = Patient.__table__
+_order_table = LabTestOrder.__table__
+_archived_order_table = LabTestOrderArchive.__table__
+
+
+def phone_key(phone):
+    """Digits of the national number"""
+    text = str(phone or '').strip()
+    digits = ''.join(ch for ch in text if ch.isdigit())
+    if len(digits) == NATIONAL_LENGTH + len(COUNTRY_CODE) and digits.startswith(COUNTRY_CODE):
+        digits = digits[len(COUNTRY_CODE):]
+    elif len(digits) == NATIONAL_LENGTH + 1 and digits.startswith('0'):
+        digits = digits[1:]
+    # A "phone" with no digits at all still needs a stable key of its own
+    return digits or text.lower()[:15]
+
+
+def name_key(name):
+    """The name lowercased, accents stripped, letters and digits only ("Mr. Patel" == "mr patel")"""
+    return normalize(name)[:100]
+
+
+def patient_key(name, phone):
+    """(phone_key, name_key), the patient dedup key"""
+    return phone_key(phone), name_key(name)
+
+
+# ===== RESOLUTION =====
+
+def _insert_patients(rows):
+    """
+    Insert new patients, tolerating ones a concurrent request just created
+    Returns {patient key: id} when a single row went in, else None (the
+    caller looks the ids up).
+    """
+    try:
+        with db.session.begin_nested():
+            if len(rows) == 1:
+                result = db.session.execute(insert(_patient_table).values(**rows[0]))
+                return {(rows[0]['phone_key'], rows[0]['name_key']): result.inserted_primary_key[0]}
+            db.session.execute(insert(_patient_table), rows)
+    except IntegrityError:
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(_patient_table), [row])
+            except IntegrityError:
+                pass
+    return None
+
+
+def _patient_ids(keys):
+    """{patient key: id} for the patients on file among `keys`"""
+    rows = db.session.execute(
+        select(_patient_table.c.id, _patient_table.c.phone_key, _patient_table.c.name_key)
+        .where(_patient_table.c.phone_key.in_({phone for phone, _ in keys}))
+    )
+    return {(row.phone_key, row.name_key): row.id for row in rows if (row.phone_key, row.name_key) in keys}
+
+
+def resolve_patients(pairs):
+    """
+    Find or create the patient for each (name, phone) pair, in the current
+    transaction: one SELECT for the known keys, one INSERT for new ones.
+    A new patient takes the first name/phone given; known patients are
+    left as they are (orders keep their own snapshot).
+    Returns {patient key: patient_id}; the caller commits.
+    """
+    entered = {}
+    for name, phone in pairs:
+        name, phone = str(name).strip(), str(phone).strip()
+        entered.setdefault(patient_key(name, phone), (name, phone))
+    if not entered:
+        return {}
+
+    ids = _patient_ids(entered)
+    now = datetime.utcnow()
+    new_rows = [
+        {'name': name, 'phone': phone, 'phone_key': key[0], 'name_key': key[1],
+         'created_at': now, 'updated_at': now}
+        for key, (name, phone) in entered.items() if key not in ids
+    ]
+    if new_rows:
+        inserted = _insert_patients(new_rows)
+        ids.update(inserted if inserted is not None else _patient_ids(entered))
+    return ids
+
+
+def resolve_patient(name, phone):
+    """The patient id for one (name, phone); the caller commits"""
+    return resolve_patients([(name, phone)])[patient_key(name, phone)]
+
+
+# ===== BACKFILL & DEDUP =====
+
+def backfill_patients(batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Link every order without a patient to one, from the name and phone
+    entered on the order: orders are read in id order, `batch_size` per
+    transaction, and deduplicated by patient key. Resumable: only unlinked
+    orders are read.
+    Returns (orders linked, patients now on file).
+    """
+    linked = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(_order_table.c.id, _order_table.c.patient_name, _order_table.c.patient_phone)
+            .where(_order_table.c.patient_id.is_(None), _order_table.c.id > last_id)
+            .order_by(_order_table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        ids = resolve_patients((row.patient_name, row.patient_phone) for row in rows)
+        db.session.execute(
+            update(_order_table)
+            .where(_order_table.c.id == bindparam('b_id'))
+            .values(patient_id=bindparam('b_patient_id')),
+            [{'b_id': row.id, 'b_patient_id': ids[patient_key(row.patient_name, row.patient_phone)]}
+             for row in rows],
+        )
+        db.session.commit()
+        linked += len(rows)
+        last_id = rows[-1].id
+    return linked, db.session.query(Patient).count()
+
+
+def dedupe_patients(batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Recompute every patient's phone and name keys in id-ordered batches; a
+    patient whose new key is already taken is merged into the key's owner
+    (live and archived orders re-pointed, duplicate row deleted; the
+    orders keep their own name and phone). Idempotent.
+    Returns (patients re-keyed, patients merged).
+    """
+    rekeyed = merged = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(_patient_table.c.id, _patient_table.c.name, _patient_table.c.phone,
+                   _patient_table.c.phone_key, _patient_table.c.name_key)
+            .where(_patient_table.c.id > last_id)
+            .order_by(_patient_table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            key = patient_key(row.name, row.phone)
+            if key == (row.phone_key, row.name_key):
+                continue
+            owner = db.session.execute(
+                select(_patient_table.c.id, _patient_table.c.name, _patient_table.c.phone)
+                .where(_patient_table.c.phone_key == key[0], _patient_table.c.name_key == key[1])
+            ).first()
+            if owner is None:
+                db.session.execute(
+                    update(_patient_table).where(_patient_table.c.id == row.id)
+                    .values(phone_key=key[0], name_key=key[1])
+                )
+                rekeyed += 1
+            elif patient_key(owner.name, owner.phone) == key:
+                for table in (_order_table, _archived_order_table):
+                    db.session.execute(update(table).where(table.c.patient_id == row.id).values(patient_id=owner.id))
+                db.session.execute(delete(_patient_table).where(_patient_table.c.id == row.id))
+                merged += 1
+            # else the key's holder is itself about to be re-keyed; the next run merges this one
+        db.session.commit()
+        last_id = rows[-1].id
+    return rekeyed, merged
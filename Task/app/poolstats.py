@@ -0,0 +1,134 @@
+"""
+Connection pool checkout metrics
+TimedQueuePool is a QueuePool that records how long each checkout waited
+for a connection (including opening a new overflow connection) and how
+many checkouts timed out, so pool_size / max_overflow can be sized from
+measured wait times instead of guesswork.
+"""
+
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+# Histogram bucket upper bounds, in seconds
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class PoolMetrics:
+    """Thread-safe checkout wait counters and histogram"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_seconds_total = 0.0
+            self.max_wait_seconds = 0.0
+            self.bucket_counts = [0] * len(WAIT_BUCKETS)
+
+    def record(self, wait, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if wait <= bound:
+                    self.bucket_counts[i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            observed = self.checkouts + self.timeouts
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': self.wait_seconds_total,
+                'avg_wait_ms': round(self.wait_seconds_total / observed * 1000, 3) if observed else 0.0,
+                'max_wait_ms': round(self.max_wait_seconds * 1000, 3),
+                'wait_buckets': dict(zip(WAIT_BUCKETS, self.bucket_counts)),
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that times every checkout into a PoolMetrics"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        self._timing = threading.local()
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool; keep the counters running
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        # QueuePool._do_get retries by calling itself; only time the outermost call
+        if getattr(self._timing, 'active', False):
+            return super()._do_get()
+        self._timing.active = True
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record(time.perf_counter() - started, timed_out=True)
+            raise
+        finally:
+            self._timing.active = False
+        self.metrics.record(time.perf_counter() - started)
+        return record
+
+
+def pool_stats(engine):
+    """Checkout metrics plus current pool gauges, or None if the pool is not timed"""
+    pool = engine.pool
+    if not isinstance(pool, TimedQueuePool):
+        return None
+    stats = pool.metrics.snapshot()
+    stats.update({
+        'pool_size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': max(0, pool.overflow()),  # QueuePool counts up from -pool_size
+        'max_overflow': pool._max_overflow,
+        'timeout_seconds': pool.timeout(),
+    })
+    return stats
+
+
+def render_pool_prometheus(stats):
+    """Format pool_stats() in the Prometheus text exposition format"""
+    if not stats:
+        return ''
+    lines = [
+        "# HELP pathology_db_pool_checkout_wait_seconds Time spent waiting for a pooled connection",
+        "# TYPE pathology_db_pool_checkout_wait_seconds histogram",
+    ]
+    cumulative = 0
+    for bound, count in stats['wait_buckets'].items():
+        cumulative += count
+        lines.append(f'pathology_db_pool_checkout_wait_seconds_bucket{{le="{bound:g}"}} {cumulative}')
+    observed = stats['checkouts'] + stats['timeouts']
+    lines.append(f'pathology_db_pool_checkout_wait_seconds_bucket{{le="+Inf"}} {observed}')
+    lines.append(f"pathology_db_pool_checkout_wait_seconds_sum {stats['wait_seconds_total']:g}")
+    lines.append(f"pathology_db_pool_checkout_wait_seconds_count {observed}")
+    for name, metric_type, key, help_text in (
+        ('pathology_db_pool_checkout_timeouts_total', 'counter', 'timeouts', 'Checkouts that hit pool_timeout'),
+        ('pathology_db_pool_size', 'gauge', 'pool_size', 'Configured pool size'),
+        ('pathology_db_pool_checked_out', 'gauge', 'checked_out', 'Connections currently in use'),
+        ('pathology_db_pool_overflow', 'gauge', 'overflow', 'Overflow connections currently open'),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"{name} {stats[key]}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,168 @@
+"""
+Opt-in request profiling for Pathology module
+Enable with PROFILING_ENABLED = True. For every request it records wall
+time, SQL statement count, SQL time and template render time per Flask
+endpoint, adds a Server-Timing header, flags likely N+1 requests and
+exposes totals (plus DB pool checkout metrics) in Prometheus text format
+at /metrics.
+Metrics are per process; scrape each gunicorn worker or aggregate upstream.
+"""
+
+import threading
+import time
+
+from flask import Response, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+from app.models import db
+from app.poolstats import pool_stats, render_pool_prometheus
+
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 20
+
+
+class RequestMetrics:
+    """Thread-safe per-endpoint counters"""
+
+    FIELDS = ('requests', 'wall_seconds', 'sql_statements', 'sql_seconds',
+              'template_seconds', 'n_plus_one_suspected')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_endpoint = {}
+
+    def record(self, endpoint, wall, sql_count, sql_time, template_time, suspected):
+        with self._lock:
+            stats = self._by_endpoint.setdefault(endpoint, dict.fromkeys(self.FIELDS, 0))
+            stats['requests'] += 1
+            stats['wall_seconds'] += wall
+            stats['sql_statements'] += sql_count
+            stats['sql_seconds'] += sql_time
+            stats['template_seconds'] += template_time
+            stats['n_plus_one_suspected'] += int(suspected)
+            stats['max_wall_seconds'] = max(stats.get('max_wall_seconds', 0), wall)
+            stats['max_sql_statements'] = max(stats.get('max_sql_statements', 0), sql_count)
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(stats) for endpoint, stats in self._by_endpoint.items()}
+
+    def reset(self):
+        with self._lock:
+            self._by_endpoint.clear()
+
+
+_PROMETHEUS_SERIES = (
+    ('pathology_requests_total', 'counter', 'requests', 'Requests handled'),
+    ('pathology_request_seconds_total', 'counter', 'wall_seconds', 'Wall time spent handling requests'),
+    ('pathology_request_seconds_max', 'gauge', 'max_wall_seconds', 'Slowest request seen'),
+    ('pathology_sql_statements_total', 'counter', 'sql_statements', 'SQL statements executed'),
+    ('pathology_sql_statements_max', 'gauge', 'max_sql_statements', 'Most SQL statements in one request'),
+    ('pathology_sql_seconds_total', 'counter', 'sql_seconds', 'Time spent executing SQL'),
+    ('pathology_template_seconds_total', 'counter', 'template_seconds', 'Time spent rendering templates'),
+    ('pathology_n_plus_one_suspected_total', 'counter', 'n_plus_one_suspected',
+     'Requests over the SQL statement threshold'),
+)
+
+
+def render_prometheus(snapshot):
+    """Format a metrics snapshot in the Prometheus text exposition format"""
+    lines = []
+    for name, metric_type, field, help_text in _PROMETHEUS_SERIES:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for endpoint in sorted(snapshot):
+            value = snapshot[endpoint].get(field, 0)
+            lines.append(f'{name}{{endpoint="{endpoint}"}} {value:g}' if isinstance(value, float)
+                         else f'{name}{{endpoint="{endpoint}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def init_profiling(app):
+    """Attach the profiling hooks and /metrics endpoint to an app"""
+    metrics = RequestMetrics()
+    app.extensions['request_metrics'] = metrics
+    threshold = int(app.config.get('PROFILING_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD))
+
+    def _profile():
+        if has_request_context():
+            return g.get('_profile')
+        return None
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _profile() is not None:
+            conn.info.setdefault('_profile_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _profile()
+        starts = conn.info.get('_profile_query_start')
+        if profile is None or not starts:
+            return
+        profile['sql_count'] += 1
+        profile['sql_time'] += time.perf_counter() - starts.pop()
+
+    # Read-only controller methods may run on the replica bind, so count its queries too
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def _before_render(sender, template, context, **extra):
+        profile = _profile()
+        if profile is not None:
+            profile['render_started'].append(time.perf_counter())
+
+    def _after_render(sender, template, context, **extra):
+        profile = _profile()
+        if profile is not None and profile['render_started']:
+            elapsed = time.perf_counter() - profile['render_started'].pop()
+            # Only count outermost renders so nested templates are not double counted
+            if not profile['render_started']:
+                profile['template_time'] += elapsed
+
+    before_render_template.connect(_before_render, app, weak=False)
+    template_rendered.connect(_after_render, app, weak=False)
+
+    @app.before_request
+    def _start_profile():
+        g._profile = {
+            'started': time.perf_counter(),
+            'sql_count': 0,
+            'sql_time': 0.0,
+            'template_time': 0.0,
+            'render_started': [],
+        }
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return response
+
+        wall = time.perf_counter() - profile['started']
+        endpoint = request.endpoint or 'unmatched'
+        suspected = profile['sql_count'] > threshold
+        if endpoint != 'metrics':
+            metrics.record(endpoint, wall, profile['sql_count'], profile['sql_time'],
+                           profile['template_time'], suspected)
+        if suspected:
+            app.logger.warning(
+                "Likely N+1: %s issued %d SQL statements (threshold %d)",
+                endpoint, profile['sql_count'], threshold,
+            )
+
+        response.headers['Server-Timing'] = ', '.join([
+            f"app;dur={wall * 1000:.1f}",
+            f'db;dur={profile["sql_time"] * 1000:.1f};desc="{profile["sql_count"]} queries"',
+            f"tpl;dur={profile['template_time'] * 1000:.1f}",
+        ])
+        response.headers['X-Query-Count'] = str(profile['sql_count'])
+        return response
+
+    @app.route('/metrics', endpoint='metrics')
+    def prometheus_metrics():
+        """Per-endpoint request metrics in Prometheus text format"""
+        body = render_prometheus(metrics.snapshot()) + render_pool_prometheus(pool_stats(db.engine))
+        return Response(body, mimetype='text/plain; version=0.0.4')
+
+    return metrics
@@ -0,0 +1,177 @@
+"""
+Structured reference ranges and abnormal-value flagging
+PathologyTest.normal_range stays free text for display; its parsed form
+(low/high/unit/comparator) lives in columns so results can be flagged
+normal / low / high / critical once, at write time or in one set-based
+UPDATE, instead of re-parsing on every render.
+"""
+
+import re
+from collections import namedtuple
+
+from sqlalchemy import and_, bindparam, case, or_, select, update
+
+from app.models import db, PathologyTest, LabTestOrderLine, LabTestResult
+
+
+FLAG_NORMAL = 'normal'
+FLAG_LOW = 'low'
+FLAG_HIGH = 'high'
+FLAG_CRITICAL = 'critical'
+ABNORMAL_FLAGS = (FLAG_LOW, FLAG_HIGH, FLAG_CRITICAL)
+
+BACKFILL_BATCH_SIZE = 1000
+
+ParsedRange = namedtuple('ParsedRange', 'low high unit comparator')
+
+_NUMBER = r'[-+]?\d+(?:\.\d+)?'
+_BETWEEN_RE = re.compile(rf'({_NUMBER})\s*(?:-|–|to)\s*({_NUMBER})\s*(.*)$', re.IGNORECASE)
+_COMPARATOR_RE = re.compile(rf'(<=|>=|≤|≥|<|>)\s*({_NUMBER})\s*(.*)$')
+_RESULT_RE = re.compile(rf'^\s*(?:<=|>=|<|>)?\s*({_NUMBER})')
+_COMPARATOR_ALIASES = {'≤': '<=', '≥': '>='}
+
+
+def _clean_unit(text):
+    unit = text.strip().strip('()').strip()
+    return unit[:30] or None
+
+
+def parse_normal_range(text):
+    """
+    Parse free-text ranges such as "4.5-11.0 (10^9/L)", "Total: <200 mg/dL"
+    or "SGPT: 7-56 U/L" into a ParsedRange; returns None if unrecognised.
+    A leading "Label:" is ignored.
+    """
+    if not text:
+        return None
+    body = text.split(':', 1)[1] if ':' in text else text
+    body = body.strip()
+
+    match = _BETWEEN_RE.match(body)
+    if match:
+        low, high = float(match.group(1)), float(match.group(2))
+        if low > high:
+            low, high = high, low
+        return ParsedRange(low, high, _clean_unit(match.group(3)), 'between')
+
+    match = _COMPARATOR_RE.match(body)
+    if match:
+        comparator = _COMPARATOR_ALIASES.get(match.group(1), match.group(1))
+        value = float(match.group(2))
+        unit = _clean_unit(match.group(3))
+        if comparator.startswith('<'):
+            return ParsedRange(None, value, unit, comparator)
+        return ParsedRange(value, None, unit, comparator)
+
+    return None
+
+
+def parse_result_value(text):
+    """Leading numeric value of a result ("5.2", "5.2 mg/dL", "<0.1"), else None"""
+    if text is None:
+        return None
+    match = _RESULT_RE.match(str(text))
+    return float(match.group(1)) if match else None
+
+
+def apply_parsed_range(test):
+    """Copy the parse of test.normal_range into the structured columns"""
+    parsed = parse_normal_range(test.normal_range)
+    test.range_low = parsed.low if parsed else None
+    test.range_high = parsed.high if parsed else None
+    test.range_unit = parsed.unit if parsed else None
+    test.range_comparator = parsed.comparator if parsed else None
+    return parsed
+
+
+def classify_value(value, test):
+    """
+    Flag one numeric value against a test's structured range
+    Mirrors flag_expression() so single-row and set-based flagging agree.
+    """
+    if value is None or test is None:
+        return None
+    if test.critical_low is not None and value <= test.critical_low:
+        return FLAG_CRITICAL
+    if test.critical_high is not None and value >= test.critical_high:
+        return FLAG_CRITICAL
+    if test.range_low is None and test.range_high is None:
+        return None
+    if test.range_low is not None:
+        if (value <= test.range_low) if test.range_comparator == '>' else (value < test.range_low):
+            return FLAG_LOW
+    if test.range_high is not None:
+        if (value >= test.range_high) if test.range_comparator == '<' else (value > test.range_high):
+            return FLAG_HIGH
+    return FLAG_NORMAL
+
+
+def flag_expression(value, test):
+    """SQL CASE equivalent of classify_value over columns `value` and `test`"""
+    low_breach = or_(
+        and_(test.range_comparator == '>', value <= test.range_low),
+        and_(or_(test.range_comparator.is_(None), test.range_comparator != '>'), value < test.range_low),
+    )
+    high_breach = or_(
+        and_(test.range_comparator == '<', value >= test.range_high),
+        and_(or_(test.range_comparator.is_(None), test.range_comparator != '<'), value > test.range_high),
+    )
+    return case(
+        (value.is_(None), None),
+        (and_(test.critical_low.isnot(None), value <= test.critical_low), FLAG_CRITICAL),
+        (and_(test.critical_high.isnot(None), value >= test.critical_high), FLAG_CRITICAL),
+        (and_(test.range_low.is_(None), test.range_high.is_(None)), None),
+        (and_(test.range_low.isnot(None), low_breach), FLAG_LOW),
+        (and_(test.range_high.isnot(None), high_breach), FLAG_HIGH),
+        else_=FLAG_NORMAL,
+    )
+
+
+def reflag_results(test_id=None):
+    """
+    Recompute LabTestResult.flag for every result (or one test's results)
+    in a single multi-table UPDATE (UPDATE ... JOIN on MySQL, UPDATE ... FROM
+    on SQLite 3.33+); the caller commits. Returns rows updated.
+    """
+    stmt = (
+        update(LabTestResult)
+        .where(LabTestResult.line_id == LabTestOrderLine.id, LabTestOrderLine.test_id == PathologyTest.id)
+        .values(flag=flag_expression(LabTestResult.result_numeric, PathologyTest))
+    )
+    if test_id is not None:
+        stmt = stmt.where(PathologyTest.id == test_id)
+    return db.session.execute(stmt.execution_options(synchronize_session=False)).rowcount
+
+
+def backfill_ranges(batch_size=BACKFILL_BATCH_SIZE):
+    """
+    One-time backfill: parse every test's normal_range, parse every result's
+    numeric value (in id-ordered batches) and flag all results.
+    Returns (tests parsed, results flagged).
+    """
+    tests = PathologyTest.query.all()
+    for test in tests:
+        apply_parsed_range(test)
+    db.session.commit()
+
+    last_id = 0
+    table = LabTestResult.__table__
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.result_value)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('row_id')).values(result_numeric=bindparam('numeric')),
+            [{'row_id': row.id, 'numeric': parse_result_value(row.result_value)} for row in rows],
+        )
+        db.session.commit()
+        last_id = rows[-1].id
+
+    flagged = reflag_results()
+    db.session.commit()
+    return len(tests), flagged
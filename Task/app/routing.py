@@ -0,0 +1,110 @@
+"""
+Read-replica routing for the Pathology module
+When REPLICA_DATABASE_URI is configured it becomes the 'replica' bind and
+RoutingSession sends SELECTs issued inside @read_only controller methods
+(listings, searches, lookups, the dashboard) to it. Everything else, and
+every read inside a @writes method, stays on the primary.
+
+Read-your-writes: once a session has flushed or executed a write, the rest
+of that request reads from the primary. The request also marks the user's
+cookie session so their next requests (the redirect after a POST) keep
+reading from the primary for REPLICA_STICKY_SECONDS while the replica
+catches up.
+"""
+
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import g, has_request_context, session as cookie_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select, CompoundSelect
+
+
+REPLICA_BIND = 'replica'
+DEFAULT_STICKY_SECONDS = 5
+
+ROUTE_REPLICA = 'replica'
+ROUTE_PRIMARY = 'primary'
+
+_route = ContextVar('db_route', default=None)
+_STICKY_KEY = '_read_primary_until'
+
+
+def _routed(route):
+    """Decorator running a function under `route` unless an outer call already chose one"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _route.get() is not None:
+                return fn(*args, **kwargs)
+            token = _route.set(route)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _route.reset(token)
+        return wrapper
+    return decorator
+
+
+# Reads may be served by the replica; a @read_only call nested in a @writes
+# call (e.g. get_order_by_id inside transition_status) stays on the primary.
+read_only = _routed(ROUTE_REPLICA)
+writes = _routed(ROUTE_PRIMARY)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that can serve read-only SELECTs from the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause):
+        if _route.get() != ROUTE_REPLICA or self._flushing or self.info.get('wrote'):
+            return False
+        if not isinstance(clause, (Select, CompoundSelect)):
+            return False
+        return not (has_request_context() and g.get('_read_primary'))
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_statement(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['wrote'] = True
+
+
+def current_route():
+    """'replica', 'primary' or None outside any routed controller call"""
+    return _route.get()
+
+
+def init_replica_routing(app, db):
+    """Keep a user on the primary for a few seconds after each request that wrote"""
+    sticky_seconds = float(app.config.get('REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS))
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}) or sticky_seconds <= 0:
+        return
+
+    @app.before_request
+    def _check_sticky_primary():
+        until = cookie_session.get(_STICKY_KEY)
+        if until is not None:
+            if until > time.time():
+                g._read_primary = True
+            else:
+                cookie_session.pop(_STICKY_KEY, None)
+
+    @app.after_request
+    def _set_sticky_primary(response):
+        if db.session.registry.has() and db.session.info.get('wrote'):
+            cookie_session[_STICKY_KEY] = time.time() + sticky_seconds
+        return response
@@ -0,0 +1,256 @@
+"""
+Trigram search for orders and tests
+Orders are indexed in order_search_token (one row per distinct trigram of
+the order ID, patient name and phone digits), so a partial name or phone
+lookup is an indexed IN() on tokens plus a GROUP BY, instead of a
+'%term%' scan. Works the same on MySQL and SQLite. Archived orders keep
+their tokens in order_search_token_archive and are searched only when
+asked (include_archived).
+
+The test catalog is small and already cached in memory (app.catalog), so
+test search ranks the cached rows in Python without touching the DB.
+"""
+
+import unicodedata
+
+from sqlalchemy import and_, case, delete, func, insert, or_, select, union_all
+
+from app.models import db, LabTestOrder, LabTestOrderArchive, OrderSearchToken, OrderSearchTokenArchive
+from app.pagination import KeysetPage, clamp_per_page, decode_rank_cursor, encode_rank_cursor
+
+
+MIN_TERM_LENGTH = 3
+REINDEX_BATCH_SIZE = 1000
+
+_token_table = OrderSearchToken.__table__
+_archived_token_table = OrderSearchTokenArchive.__table__
+
+
+def normalize(text):
+    """Lowercase, strip accents and keep only letters and digits"""
+    if not text:
+        return ''
+    folded = unicodedata.normalize('NFKD', str(text))
+    return ''.join(ch for ch in folded.lower() if ch.isalnum())
+
+
+def trigrams(text):
+    """Distinct trigrams of already-normalized text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def order_tokens(order_id, patient_name, patient_phone):
+    """All search tokens for one order"""
+    tokens = set()
+    for value in (order_id, patient_name, patient_phone):
+        tokens |= trigrams(normalize(value))
+    return tokens
+
+
+def index_orders(rows):
+    """
+    (Re)index orders in the current session transaction
+    rows: iterable of (id, order_id, patient_name, patient_phone)
+    Existing tokens for these orders are replaced, so this is also the
+    update path when patient details change.
+    """
+    ids = []
+    token_rows = []
+    for row_id, order_id, patient_name, patient_phone in rows:
+        ids.append(row_id)
+        token_rows.extend(
+            {'order_id': row_id, 'token': token}
+            for token in order_tokens(order_id, patient_name, patient_phone)
+        )
+    if not ids:
+        return 0
+    db.session.execute(delete(_token_table).where(_token_table.c.order_id.in_(ids)))
+    if token_rows:
+        db.session.execute(insert(_token_table), token_rows)
+    return len(ids)
+
+
+def _indexed_columns():
+    """(id, order_id, patient name, patient phone) rows for index_orders"""
+    return select(LabTestOrder.id, LabTestOrder.order_id, LabTestOrder.patient_name, LabTestOrder.patient_phone)
+
+
+def index_orders_by_order_id(order_ids):
+    """Index freshly bulk-inserted orders, looked up by their order_id strings"""
+    rows = db.session.execute(_indexed_columns().where(LabTestOrder.order_id.in_(order_ids))).all()
+    return index_orders(rows)
+
+
+def reindex_all_orders(batch_size=REINDEX_BATCH_SIZE):
+    """Rebuild the whole order index in bounded batches; returns orders indexed"""
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.session.execute(
+            _indexed_columns()
+            .where(LabTestOrder.id > last_id)
+            .order_by(LabTestOrder.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        total += index_orders(rows)
+        db.session.commit()
+        last_id = rows[-1][0]
+    return total
+
+
+def _required_matches(token_count):
+    """Allow roughly one typo per four trigrams on longer terms"""
+    return token_count - token_count // 4 if token_count > 3 else token_count
+
+
+def _token_matches(grams, include_archived):
+    """(order_id, token) rows matching any of the trigrams"""
+    tables = (_token_table, _archived_token_table) if include_archived else (_token_table,)
+    # Filter each table on its own token index before combining them
+    branches = [select(table.c.order_id, table.c.token).where(table.c.token.in_(grams)) for table in tables]
+    if len(branches) == 1:
+        return branches[0].subquery('tokens')
+    return union_all(*branches).subquery('tokens')
+
+
+def _exact_order_id(term, include_archived):
+    """Primary key of the order whose order ID is exactly `term`, if any (unique index lookups)"""
+    models = (LabTestOrder, LabTestOrderArchive) if include_archived else (LabTestOrder,)
+    for model in models:
+        row_id = db.session.scalar(select(model.id).where(model.order_id == term.strip().upper()))
+        if row_id is not None:
+            return row_id
+    return None
+
+
+def search_order_ids(term, cursor=None, direction='next', per_page=None, include_archived=False):
+    """
+    Ranked order ids for a search term, one page at a time
+
+    Score is the number of the term's trigrams an order matches; ties are
+    broken newest-first by id. An order whose order ID is exactly the term
+    scores above every other match, so it leads the first page and, like
+    any other row, appears on one page only. Returns (ids in rank order,
+    next cursor, prev cursor), or None when the term is too short for the
+    index.
+    """
+    if direction not in ('next', 'prev'):
+        raise ValueError(f"Invalid pagination direction: {direction}")
+
+    grams = trigrams(normalize(term))
+    if len(normalize(term)) < MIN_TERM_LENGTH or not grams:
+        return None
+
+    per_page = clamp_per_page(per_page)
+    tokens = _token_matches(sorted(grams), include_archived)
+    score = func.count(tokens.c.token)
+    exact_id = _exact_order_id(term, include_archived)
+    if exact_id is not None:
+        score = score + case((tokens.c.order_id == exact_id, len(grams)), else_=0)
+    stmt = (
+        select(tokens.c.order_id, score.label('score'))
+        .group_by(tokens.c.order_id)
+        .having(score >= _required_matches(len(grams)))
+    )
+
+    if cursor:
+        cursor_score, cursor_id = decode_rank_cursor(cursor)
+        if direction == 'next':
+            stmt = stmt.having(or_(
+                score < cursor_score,
+                and_(score == cursor_score, tokens.c.order_id < cursor_id),
+            ))
+        else:
+            stmt = stmt.having(or_(
+                score > cursor_score,
+                and_(score == cursor_score, tokens.c.order_id > cursor_id),
+            ))
+
+    if direction == 'next':
+        stmt = stmt.order_by(score.desc(), tokens.c.order_id.desc())
+    else:
+        stmt = stmt.order_by(score.asc(), tokens.c.order_id.asc())
+
+    rows = db.session.execute(stmt.limit(per_page + 1)).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+        has_next, has_prev = cursor is not None, has_more
+    else:
+        has_next, has_prev = has_more, cursor is not None
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_next:
+            next_cursor = encode_rank_cursor(rows[-1].score, rows[-1].order_id)
+        if has_prev:
+            prev_cursor = encode_rank_cursor(rows[0].score, rows[0].order_id)
+    return [row.order_id for row in rows], next_cursor, prev_cursor
+
+
+def search_orders(query, term, cursor=None, direction='next', per_page=None, archive_query=None):
+    """
+    Run an order search and return a KeysetPage of LabTestOrder
+    `query` is the base LabTestOrder query (carrying any loading profile);
+    pass a LabTestOrderArchive query as `archive_query` to include
+    archived orders. Terms shorter than MIN_TERM_LENGTH are too short for
+    the index and fall back to a (non-indexed, single page) match: order_id
+    prefix, or a substring of the patient name or phone.
+    """
+    sources = [(query, LabTestOrder)]
+    if archive_query is not None:
+        sources.append((archive_query, LabTestOrderArchive))
+
+    ranked = search_order_ids(term, cursor=cursor, direction=direction, per_page=per_page,
+                              include_archived=archive_query is not None)
+    if ranked is None:
+        limit = clamp_per_page(per_page)
+        # LIKE wildcards in the term match literally
+        needle = term.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        matches = []
+        for source, model in sources:
+            fallback = source.filter(or_(
+                model.order_id.ilike(f"{needle}%", escape='\\'),
+                model.patient_name.ilike(f"%{needle}%", escape='\\'),
+                model.patient_phone.ilike(f"%{needle}%", escape='\\'),
+            ))
+            matches.extend(fallback.order_by(model.id.desc()).limit(limit).all())
+        return KeysetPage(sorted(matches, key=lambda order: order.id, reverse=True)[:limit])
+
+    ids, next_cursor, prev_cursor = ranked
+    by_id = {}
+    for source, model in sources:
+        missing = [order_id for order_id in ids if order_id not in by_id]
+        if missing:
+            by_id.update((order.id, order) for order in source.filter(model.id.in_(missing)).all())
+    items = [by_id[order_id] for order_id in ids if order_id in by_id]
+    return KeysetPage(items, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def rank_tests(tests, term):
+    """
+    Rank catalog tests against a term: exact code, then code/name prefix,
+    then substring of the normalized code or name
+    """
+    needle = normalize(term)
+    if not needle:
+        return list(tests)
+
+    ranked = []
+    for test in tests:
+        code = normalize(test.test_code)
+        name = normalize(test.test_name)
+        if code == needle:
+            rank = 0
+        elif code.startswith(needle) or name.startswith(needle):
+            rank = 1
+        elif needle in code or needle in name:
+            rank = 2
+        else:
+            continue
+        ranked.append((rank, test.test_name.lower(), test))
+    ranked.sort(key=lambda item: (item[0], item[1]))
+    return [test for _, _, test in ranked]
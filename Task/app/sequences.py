@@ -0,0 +1,119 @@
+"""
+Concurrency-safe naming series allocation for Pathology module
+Numbers are reserved from naming_series in blocks with one atomic UPDATE
+and then handed out from memory, so order creation never has to commit
+the naming series in its own transaction.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, NamingSeries
+
+
+DEFAULT_BLOCK_SIZE = 20
+
+_series_table = NamingSeries.__table__
+
+
+def _ensure_series(series_name, prefix, start):
+    """Insert the naming series row if missing (a concurrent insert is fine)"""
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(insert(_series_table).values(
+                series_name=series_name,
+                series_prefix=prefix,
+                current_number=start,
+                created_at=datetime.utcnow(),
+            ))
+    except IntegrityError:
+        pass
+
+
+def reserve_block(series_name, prefix, size, start=1000):
+    """
+    Atomically reserve `size` consecutive numbers from a naming series
+
+    The UPDATE takes the row lock (MySQL) or the write lock (SQLite) before
+    the new value is read back in the same short transaction, so two
+    workers can never receive overlapping blocks.
+    Returns (prefix, range of reserved numbers).
+    """
+    if size < 1:
+        raise ValueError("Block size must be at least 1")
+
+    for _ in range(2):
+        with db.engine.begin() as conn:
+            updated = conn.execute(
+                update(_series_table)
+                .where(_series_table.c.series_name == series_name)
+                .values(current_number=_series_table.c.current_number + size)
+            ).rowcount
+            if updated:
+                row = conn.execute(
+                    select(_series_table.c.current_number, _series_table.c.series_prefix)
+                    .where(_series_table.c.series_name == series_name)
+                ).one()
+                return row.series_prefix, range(row.current_number - size + 1, row.current_number + 1)
+        _ensure_series(series_name, prefix, start)
+
+    raise ValueError(f"Could not reserve numbers from naming series '{series_name}'")
+
+
+class SequenceAllocator:
+    """
+    Per-process allocator handing out names from reserved blocks
+
+    Blocks are keyed by process id and database URL, so a forked gunicorn
+    worker never reuses its parent's block. Numbers left in a block when a
+    worker exits are skipped; names are unique but not gap-free and, across
+    workers, not strictly in creation order.
+    """
+
+    def __init__(self, series_name, prefix, start=1000, block_size_config='ORDER_ID_BLOCK_SIZE'):
+        self.series_name = series_name
+        self.prefix = prefix
+        self.start = start
+        self.block_size_config = block_size_config
+        self._lock = threading.Lock()
+        self._blocks = {}
+
+    def _block_size(self):
+        return int(current_app.config.get(self.block_size_config, DEFAULT_BLOCK_SIZE))
+
+    def _key(self):
+        return os.getpid(), str(db.engine.url)
+
+    def next_name(self):
+        """Return the next unused name, reserving a new block when needed"""
+        return self.next_names(1)[0]
+
+    def next_names(self, count):
+        """Return `count` unused names, reserving as many blocks as needed"""
+        names = []
+        with self._lock:
+            key = self._key()
+            prefix, numbers = self._blocks.get(key, (self.prefix, iter(())))
+            while len(names) < count:
+                number = next(numbers, None)
+                if number is None:
+                    size = max(self._block_size(), count - len(names))
+                    prefix, block = reserve_block(self.series_name, self.prefix, size, self.start)
+                    numbers = iter(block)
+                    continue
+                names.append(f"{prefix}{number}")
+            self._blocks[key] = (prefix, numbers)
+        return names
+
+    def reset(self):
+        """Forget all in-memory blocks (e.g. after the series is changed by hand)"""
+        with self._lock:
+            self._blocks.clear()
+
+
+order_id_allocator = SequenceAllocator('LabTestOrder', 'LTO-', start=1000)
@@ -0,0 +1,391 @@
+"""
+Turnaround-time (TAT) analytics for Pathology module
+TAT runs from an order being placed (ordered_at; created_at for orders
+that never passed through Ordered) to the completion of each of its lines
+(lab_test_order_line.completed_at), so every test on a multi-test order
+has its own turnaround.
+
+rollup() folds newly completed order lines into two tables keyed on
+completion day and test: tat_daily_stats (count, sum, min, max) and tat_daily_bucket
+(a log-scaled histogram). Histograms add up across days and tests, so
+p50/p90/p99 for any date range are read from summed buckets and reports
+never touch the order tables. Percentiles are accurate to within half a
+bucket (about 2.5%).
+
+The rollup is incremental: tat_rollup_state keeps a (completed_at, id)
+watermark and each run reads only the lines past it, through
+ix_lab_test_order_line_completed_at_id. Lines completed in the last
+ROLLUP_LAG_SECONDS are left for the next run so a transaction that
+commits late is not skipped. Run `flask rollup-tat` every few minutes.
+"""
+
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, case, delete, func, insert, or_, select, update
+
+from app.models import (
+    db, PathologyTest, LabTestOrder, LabTestOrderLine, LabTestResult, TatDailyStats, TatDailyBucket, TatRollupState,
+    LabTestOrderArchive, LabTestOrderLineArchive, OrderStatusEnum, ResultStatusEnum,
+)
+from app.routing import read_only
+
+
+PERCENTILES = (50, 90, 99)
+BUCKET_GROWTH = 1.05  # each histogram bucket is 5% wider than the last
+ROLLUP_LAG_SECONDS = 60
+DEFAULT_BATCH_SIZE = 5000
+
+_stats_table = TatDailyStats.__table__
+_bucket_table = TatDailyBucket.__table__
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+
+def tat_started_at(order=LabTestOrder):
+    """SQL expression for when an order's turnaround clock starts"""
+    return func.coalesce(order.ordered_at, order.created_at)
+
+
+def bucket_of(seconds):
+    """Histogram bucket of a TAT: 0 below one second, else 1 + floor(log_1.05(seconds))"""
+    if seconds < 1:
+        return 0
+    return 1 + int(math.log(seconds) / _LOG_GROWTH)
+
+
+def bucket_value(bucket):
+    """Representative TAT of a bucket (its geometric midpoint), in seconds"""
+    if bucket <= 0:
+        return 0.0
+    return BUCKET_GROWTH ** (bucket - 0.5)
+
+
+def percentiles_from_buckets(buckets, percentiles=PERCENTILES, low=None, high=None):
+    """
+    {p: seconds} for a {bucket: count} histogram (nearest rank), clamped
+    to the observed [low, high] when known
+    """
+    total = sum(buckets.values())
+    if not total:
+        return {p: None for p in percentiles}
+    ordered = sorted(buckets.items())
+    values = {}
+    for p in percentiles:
+        rank = max(1, math.ceil(p / 100 * total))
+        seen = 0
+        for bucket, count in ordered:
+            seen += count
+            if seen >= rank:
+                break
+        value = bucket_value(bucket)
+        if low is not None:
+            value = max(value, low)
+        if high is not None:
+            value = min(value, high)
+        values[p] = value
+    return values
+
+
+def format_duration(seconds):
+    """Compact human form of a TAT, e.g. 45s, 12m, 3h05m, 2d04h"""
+    if seconds is None:
+        return '-'
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes = seconds // 60
+    if minutes < 60:
+        return f"{minutes}m"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours}h{minutes:02d}m"
+    days, hours = divmod(hours, 24)
+    return f"{days}d{hours:02d}h"
+
+
+# ===== ROLLUP =====
+
+def _locked_state():
+    """The watermark row, locked so concurrent rollups run one after another"""
+    state = db.session.execute(
+        select(TatRollupState).where(TatRollupState.id == 1).with_for_update()
+    ).scalar_one_or_none()
+    if state is None:
+        state = TatRollupState(id=1, last_line_id=0)
+        db.session.add(state)
+        db.session.flush()
+    return state
+
+
+def _pending_lines(state, cutoff, batch_size):
+    """Next batch of completed order lines past the watermark, oldest first"""
+    completed_at = LabTestOrderLine.completed_at
+    stmt = (
+        select(LabTestOrderLine.id, LabTestOrderLine.test_id, completed_at, tat_started_at().label('started_at'))
+        .join(LabTestOrder, LabTestOrderLine.order_id == LabTestOrder.id)
+        .where(completed_at.is_not(None), completed_at < cutoff)
+        .order_by(completed_at, LabTestOrderLine.id)
+        .limit(batch_size)
+    )
+    if state.last_completed_at is not None:
+        stmt = stmt.where(or_(
+            completed_at > state.last_completed_at,
+            and_(completed_at == state.last_completed_at, LabTestOrderLine.id > state.last_line_id),
+        ))
+    return db.session.execute(stmt).all()
+
+
+def _fold(rows):
+    """Add a batch of (id, test_id, completed_at, started_at) rows to the daily tables"""
+    stats = {}
+    buckets = Counter()
+    for row in rows:
+        seconds = max(0.0, (row.completed_at - row.started_at).total_seconds())
+        key = (row.completed_at.date(), row.test_id)
+        entry = stats.setdefault(key, {'completed': 0, 'total_seconds': 0.0, 'min_seconds': seconds,
+                                       'max_seconds': seconds})
+        entry['completed'] += 1
+        entry['total_seconds'] += seconds
+        entry['min_seconds'] = min(entry['min_seconds'], seconds)
+        entry['max_seconds'] = max(entry['max_seconds'], seconds)
+        buckets[key + (bucket_of(seconds),)] += 1
+
+    days = {day for day, _ in stats}
+    test_ids = {test_id for _, test_id in stats}
+    existing_stats = {
+        (row.day, row.test_id)
+        for row in db.session.execute(
+            select(_stats_table.c.day, _stats_table.c.test_id)
+            .where(_stats_table.c.day.in_(days), _stats_table.c.test_id.in_(test_ids))
+        )
+    }
+    existing_buckets = {
+        tuple(row)
+        for row in db.session.execute(
+            select(_bucket_table.c.day, _bucket_table.c.test_id, _bucket_table.c.bucket)
+            .where(_bucket_table.c.day.in_(days), _bucket_table.c.test_id.in_(test_ids))
+        )
+    }
+
+    c = _stats_table.c
+    stat_updates = [
+        {'b_day': day, 'b_test_id': test_id, **{f'b_{name}': value for name, value in entry.items()}}
+        for (day, test_id), entry in stats.items() if (day, test_id) in existing_stats
+    ]
+    if stat_updates:
+        low, high = bindparam('b_min_seconds'), bindparam('b_max_seconds')
+        db.session.execute(
+            update(_stats_table)
+            .where(c.day == bindparam('b_day'), c.test_id == bindparam('b_test_id'))
+            .values(
+                completed=c.completed + bindparam('b_completed'),
+                total_seconds=c.total_seconds + bindparam('b_total_seconds'),
+                min_seconds=case((c.min_seconds.is_(None), low), (c.min_seconds > low, low), else_=c.min_seconds),
+                max_seconds=case((c.max_seconds.is_(None), high), (c.max_seconds < high, high), else_=c.max_seconds),
+            ),
+            stat_updates,
+        )
+    stat_inserts = [
+        {'day': day, 'test_id': test_id, **entry}
+        for (day, test_id), entry in stats.items() if (day, test_id) not in existing_stats
+    ]
+    if stat_inserts:
+        db.session.execute(insert(_stats_table), stat_inserts)
+
+    bucket_updates = [
+        {'b_day': day, 'b_test_id': test_id, 'b_bucket': bucket, 'b_count': count}
+        for (day, test_id, bucket), count in buckets.items() if (day, test_id, bucket) in existing_buckets
+    ]
+    if bucket_updates:
+        c = _bucket_table.c
+        db.session.execute(
+            update(_bucket_table)
+            .where(c.day == bindparam('b_day'), c.test_id == bindparam('b_test_id'), c.bucket == bindparam('b_bucket'))
+            .values(count=c['count'] + bindparam('b_count')),
+            bucket_updates,
+        )
+    bucket_inserts = [
+        {'day': day, 'test_id': test_id, 'bucket': bucket, 'count': count}
+        for (day, test_id, bucket), count in buckets.items() if (day, test_id, bucket) not in existing_buckets
+    ]
+    if bucket_inserts:
+        db.session.execute(insert(_bucket_table), bucket_inserts)
+
+
+def rollup(batch_size=DEFAULT_BATCH_SIZE, lag_seconds=ROLLUP_LAG_SECONDS):
+    """
+    Fold order lines completed since the last run into the daily tables
+    Commits after each batch together with the advanced watermark, so an
+    interrupted run resumes where it stopped. Returns the number of lines.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=lag_seconds)
+    total = 0
+    while True:
+        state = _locked_state()
+        rows = _pending_lines(state, cutoff, batch_size)
+        if not rows:
+            db.session.commit()
+            return total
+        _fold(rows)
+        state.last_completed_at = rows[-1].completed_at
+        state.last_line_id = rows[-1].id
+        db.session.commit()
+        total += len(rows)
+
+
+def _fold_archived(batch_size):
+    """Fold every completed archived order line into the daily tables, by id"""
+    line = LabTestOrderLineArchive
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(line.id, line.test_id, line.completed_at, tat_started_at(LabTestOrderArchive).label('started_at'))
+            .join(LabTestOrderArchive, LabTestOrderArchive.id == line.order_id)
+            .where(line.completed_at.is_not(None), line.id > last_id)
+            .order_by(line.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return total
+        _fold(rows)
+        db.session.commit()
+        last_id = rows[-1].id
+        total += len(rows)
+
+
+def rebuild_rollups(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Empty the daily tables and roll up every completed order line again,
+    archived lines first (they are past any watermark), then the live ones
+    """
+    _locked_state()
+    db.session.execute(delete(_bucket_table))
+    db.session.execute(delete(_stats_table))
+    db.session.execute(delete(TatRollupState.__table__))
+    db.session.commit()
+    archived = _fold_archived(batch_size)
+    return archived + rollup(batch_size=batch_size)
+
+
+def backfill_lifecycle():
+    """
+    Best-effort lifecycle timestamps for orders and results written before
+    they were recorded: completion from the completed result (else the
+    order's last update), cancellation from the last update. ordered_at
+    stays empty, so TAT for those orders starts at created_at.
+    Returns the number of orders stamped; the caller commits.
+    """
+    completed = OrderStatusEnum.COMPLETED.value
+    db.session.execute(
+        update(LabTestResult)
+        .where(LabTestResult.status == ResultStatusEnum.COMPLETED.value, LabTestResult.completed_at.is_(None))
+        .values(completed_at=LabTestResult.updated_at)
+    )
+    result_completed_at = (
+        select(func.max(LabTestResult.completed_at))
+        .where(LabTestResult.order_id == LabTestOrder.id, LabTestResult.status == ResultStatusEnum.COMPLETED.value)
+        .scalar_subquery()
+    )
+    stamped = db.session.execute(
+        update(LabTestOrder)
+        .where(LabTestOrder.status == completed, LabTestOrder.completed_at.is_(None))
+        .values(completed_at=func.coalesce(result_completed_at, LabTestOrder.updated_at))
+    ).rowcount
+    stamped += db.session.execute(
+        update(LabTestOrder)
+        .where(LabTestOrder.status == OrderStatusEnum.CANCELLED.value, LabTestOrder.cancelled_at.is_(None))
+        .values(cancelled_at=LabTestOrder.updated_at)
+    ).rowcount
+    return stamped
+
+
+def rollup_status():
+    """Watermark and lag of the rollup, for the CLI"""
+    state = db.session.get(TatRollupState, 1)
+    return {
+        'last_completed_at': state.last_completed_at if state else None,
+        'last_line_id': state.last_line_id if state else 0,
+        'updated_at': state.updated_at if state else None,
+    }
+
+
+# ===== REPORTS =====
+
+def _report(group_column, date_from=None, date_to=None, test_ids=None, percentiles=PERCENTILES):
+    """Rows of TAT figures grouped by `group_column` ('day' or 'test_id'), read from the rollups only"""
+    def narrowed(stmt, table):
+        if date_from is not None:
+            stmt = stmt.where(table.c.day >= date_from)
+        if date_to is not None:
+            stmt = stmt.where(table.c.day <= date_to)
+        if test_ids is not None:
+            stmt = stmt.where(table.c.test_id.in_(list(test_ids)))
+        return stmt
+
+    group = _stats_table.c[group_column]
+    totals = db.session.execute(narrowed(
+        select(
+            group.label('key'),
+            func.sum(_stats_table.c.completed).label('completed'),
+            func.sum(_stats_table.c.total_seconds).label('total_seconds'),
+            func.min(_stats_table.c.min_seconds).label('min_seconds'),
+            func.max(_stats_table.c.max_seconds).label('max_seconds'),
+        ).group_by(group),
+        _stats_table,
+    )).all()
+
+    bucket_group = _bucket_table.c[group_column]
+    histograms = defaultdict(dict)
+    for key, bucket, count in db.session.execute(narrowed(
+        select(bucket_group, _bucket_table.c.bucket, func.sum(_bucket_table.c['count']))
+        .group_by(bucket_group, _bucket_table.c.bucket),
+        _bucket_table,
+    )):
+        histograms[key][bucket] = int(count)
+
+    rows = []
+    for row in totals:
+        completed = int(row.completed or 0)
+        entry = {
+            group_column: row.key,
+            'completed': completed,
+            'avg_seconds': row.total_seconds / completed if completed else None,
+            'min_seconds': row.min_seconds,
+            'max_seconds': row.max_seconds,
+        }
+        values = percentiles_from_buckets(histograms[row.key], percentiles, row.min_seconds, row.max_seconds)
+        entry.update({f'p{p}_seconds': value for p, value in values.items()})
+        rows.append(entry)
+    return rows
+
+
+def _test_ids_for(test_code):
+    test = PathologyTest.query.filter_by(test_code=test_code).first()
+    if not test:
+        raise ValueError(f"Test '{test_code}' not found")
+    return [test.id]
+
+
+@read_only
+def tat_by_test(date_from=None, date_to=None, percentiles=PERCENTILES):
+    """TAT per test code over completion days [date_from, date_to], sorted by test code"""
+    rows = _report('test_id', date_from, date_to, percentiles=percentiles)
+    tests = {
+        test.id: test
+        for test in PathologyTest.query.filter(PathologyTest.id.in_([row['test_id'] for row in rows]))
+    }
+    for row in rows:
+        test = tests.get(row['test_id'])
+        row['test_code'] = test.test_code if test else None
+        row['test_name'] = test.test_name if test else None
+    return sorted(rows, key=lambda row: row['test_code'] or '')
+
+
+@read_only
+def tat_by_day(date_from=None, date_to=None, test_code=None, percentiles=PERCENTILES):
+    """TAT per completion day, optionally for one test code, oldest day first"""
+    test_ids = _test_ids_for(test_code) if test_code else None
+    rows = _report('day', date_from, date_to, test_ids, percentiles)
+    return sorted(rows, key=lambda row: row['day'])
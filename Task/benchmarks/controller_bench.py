@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for controller hot paths and page renders
+Generates synthetic datasets (benchmarks/datagen.py) of growing size and,
+at each size, times every PathologyTestController, LabTestOrderController
+and LabTestResultController method plus full page renders through the
+Flask test client. Each case reports latency percentiles and the number
+of SQL statements it issued. Results are written as JSON; pass --compare
+with an earlier run to flag regressions between commits.
+
+Sizes are cumulative: the same database grows from one size to the next.
+
+Usage:
+    python benchmarks/controller_bench.py --sizes 1e3,1e4,1e5 -o bench.json
+    python benchmarks/controller_bench.py --sizes 1e4 --compare bench.json
+    python benchmarks/controller_bench.py --db mysql+pymysql://root:@localhost:3306/pathology_bench --sizes 1e6
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+import sqlalchemy
+from sqlalchemy import event, func, select
+
+from app import create_app, db
+from app.models import PathologyTest, LabTestOrder, LabTestResult, OrderStatusEnum, ResultStatusEnum
+from app.controllers import PathologyTestController, LabTestOrderController, LabTestResultController, PatientController
+from benchmarks.datagen import generate, make_config
+
+
+DEFAULT_SIZES = '1e3,1e4'
+DEFAULT_REPEAT = 20
+WARMUP = 2
+BATCH_SIZE = 50
+BULK_ROWS = 100
+REGRESSION_RATIO = 1.25
+
+
+class QueryCounter:
+    """Counts SQL statements sent on the engine while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_case(fn, repeat, warmup=WARMUP):
+    """
+    Call fn(i) `warmup + repeat` times with a fresh session each call
+    Returns latency stats in milliseconds plus the median SQL statement count.
+    """
+    timings = []
+    queries = []
+    for i in range(warmup + repeat):
+        db.session.remove()
+        with QueryCounter(db.engine) as counter:
+            started = time.perf_counter()
+            fn(i)
+            elapsed = time.perf_counter() - started
+        if i >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(counter.count)
+    db.session.remove()
+    timings.sort()
+    return {
+        'runs': repeat,
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(_percentile(timings, 0.95), 3),
+        'max_ms': round(timings[-1], 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'queries': int(statistics.median(queries)),
+    }
+
+
+def _ids(stmt, count):
+    return list(db.session.scalars(stmt.limit(count)))
+
+
+def pick_fixtures(needed):
+    """
+    Sample ids the cases operate on; write cases get `needed` distinct targets
+    each so every call does real work (e.g. a Draft order to move to Ordered)
+    """
+    top_test = PathologyTest.query.filter(PathologyTest.test_code.like('SYN%')).order_by(PathologyTest.id).first()
+    latest_order = LabTestOrder.query.order_by(LabTestOrder.id.desc()).first()
+    completed_result = (
+        LabTestResult.query.filter_by(status=ResultStatusEnum.COMPLETED.value)
+        .order_by(LabTestResult.id.desc()).first()
+    )
+    has_result = select(LabTestResult.id).where(LabTestResult.order_id == LabTestOrder.id).exists()
+    draft_orders = _ids(
+        select(LabTestOrder.id).where(LabTestOrder.status == OrderStatusEnum.DRAFT.value)
+        .order_by(LabTestOrder.id.desc()),
+        needed * (1 + BATCH_SIZE),
+    )
+    ordered_without_result = _ids(
+        select(LabTestOrder.id).where(LabTestOrder.status == OrderStatusEnum.ORDERED.value, ~has_result)
+        .order_by(LabTestOrder.id.desc()),
+        needed,
+    )
+    draft_results = _ids(
+        select(LabTestResult.id).where(LabTestResult.status == ResultStatusEnum.DRAFT.value)
+        .order_by(LabTestResult.id.desc()),
+        needed * (2 + BATCH_SIZE),
+    )
+    fixtures = {
+        'test_id': top_test.id,
+        'test_price': float(top_test.price),
+        'order_id': latest_order.id,
+        'order_code': latest_order.order_id,
+        'patient_id': latest_order.patient_id,
+        'patient_fragment': latest_order.patient_name.split()[-1],
+        'phone_fragment': latest_order.patient_phone[-6:],
+        'result_id': completed_result.id if completed_result else None,
+        'transition_orders': draft_orders[:needed],
+        'batch_transition_orders': draft_orders[needed:],
+        'result_orders': ordered_without_result,
+        'update_results': draft_results[:needed],
+        'complete_results': draft_results[needed:needed * 2],
+        'batch_complete_results': draft_results[needed * 2:],
+    }
+    # Small datasets have few Draft rows; shrink the batch rather than run dry
+    fixtures['batch_size'] = max(1, min(
+        BATCH_SIZE,
+        len(fixtures['batch_transition_orders']) // needed,
+        len(fixtures['batch_complete_results']) // needed,
+    ))
+    second_page = LabTestOrderController.list_all_orders()
+    fixtures['orders_cursor'] = second_page.next_cursor
+    db.session.remove()
+    return fixtures
+
+
+def _chunk(ids, i, size):
+    chunk = ids[i * size:(i + 1) * size]
+    if not chunk:
+        raise RuntimeError("Dataset has too few rows in the required state; use a larger size")
+    return chunk
+
+
+def _target(ids, i):
+    return _chunk(ids, i, 1)[0]
+
+
+def controller_cases(fx, label):
+    """(name, fn(i)) for every controller method; read cases first, writes after"""
+    reads = [
+        ('PathologyTestController.list_active_tests', lambda i: PathologyTestController.list_active_tests()),
+        ('PathologyTestController.list_all_tests', lambda i: PathologyTestController.list_all_tests()),
+        ('PathologyTestController.search_tests', lambda i: PathologyTestController.search_tests('syn01')),
+        ('PathologyTestController.get_test_by_id', lambda i: PathologyTestController.get_test_by_id(fx['test_id'])),
+        ('PathologyTestController.get_cached_test', lambda i: PathologyTestController.get_cached_test(fx['test_id'])),
+        ('PathologyTestController.get_order_stats', lambda i: PathologyTestController.get_order_stats()),
+        ('LabTestOrderController.list_all_orders', lambda i: list(LabTestOrderController.list_all_orders())),
+        ('LabTestOrderController.list_all_orders[page 2]',
+         lambda i: list(LabTestOrderController.list_all_orders(cursor=fx['orders_cursor']))),
+        ('LabTestOrderController.list_today_orders', lambda i: list(LabTestOrderController.list_today_orders())),
+        ('LabTestOrderController.list_orders_by_status',
+         lambda i: list(LabTestOrderController.list_orders_by_status(OrderStatusEnum.ORDERED.value))),
+        ('LabTestOrderController.get_order_by_id',
+         lambda i: LabTestOrderController.get_order_by_id(fx['order_id'], profile='detail')),
+        ('LabTestOrderController.get_order_by_order_id',
+         lambda i: LabTestOrderController.get_order_by_order_id(fx['order_code'])),
+        ('LabTestOrderController.search_orders[name]',
+         lambda i: list(LabTestOrderController.search_orders(fx['patient_fragment']))),
+        ('LabTestOrderController.search_orders[phone]',
+         lambda i: list(LabTestOrderController.search_orders(fx['phone_fragment']))),
+        ('LabTestOrderController.search_orders[order_id]',
+         lambda i: list(LabTestOrderController.search_orders(fx['order_code']))),
+        ('PatientController.list_patient_orders',
+         lambda i: list(PatientController.list_patient_orders(fx['patient_id']))),
+        ('LabTestResultController.list_all_results', lambda i: list(LabTestResultController.list_all_results())),
+        ('LabTestResultController.list_completed_results',
+         lambda i: list(LabTestResultController.list_completed_results())),
+        ('LabTestResultController.list_abnormal_results',
+         lambda i: list(LabTestResultController.list_abnormal_results())),
+        ('LabTestResultController.get_result_by_order',
+         lambda i: LabTestResultController.get_result_by_order(fx['order_id'])),
+    ]
+    if fx['result_id']:
+        reads.append(('LabTestResultController.get_result_by_id',
+                      lambda i: LabTestResultController.get_result_by_id(fx['result_id'], profile='detail')))
+
+    writes = [
+        ('PathologyTestController.create_test',
+         lambda i: PathologyTestController.create_test(
+             test_name=f"Bench Test {label}-{i}", test_code=f"B{label}{i}"[:20], sample_type='Blood',
+             normal_range='10-20 mg/dL', price=100)),
+        ('PathologyTestController.update_test',
+         lambda i: PathologyTestController.update_test(fx['test_id'], price=fx['test_price'] + i % 2)),
+        ('LabTestOrderController.create_order',
+         lambda i: LabTestOrderController.create_order(
+             patient_name=f"Bench Patient {i}", patient_phone='9876543210',
+             test_ids=[fx['test_id']], order_date=date.today())),
+        ('LabTestOrderController.bulk_create_orders',
+         lambda i: LabTestOrderController.bulk_create_orders([
+             {'patient_name': f"Bulk Patient {i}-{n}", 'patient_phone': '9876543210',
+              'test_id': fx['test_id'], 'order_date': date.today().isoformat()}
+             for n in range(BULK_ROWS)
+         ])),
+        ('LabTestOrderController.transition_status',
+         lambda i: LabTestOrderController.transition_status(
+             _target(fx['transition_orders'], i), OrderStatusEnum.ORDERED.value)),
+        ('LabTestOrderController.batch_transition_status',
+         lambda i: LabTestOrderController.batch_transition_status(
+             _chunk(fx['batch_transition_orders'], i, fx['batch_size']), OrderStatusEnum.ORDERED.value)),
+        ('LabTestResultController.create_result',
+         lambda i: LabTestResultController.create_result(_target(fx['result_orders'], i), '12.5 mg/dL')),
+        ('LabTestResultController.update_result',
+         lambda i: LabTestResultController.update_result(_target(fx['update_results'], i), result_value='9.9')),
+        ('LabTestResultController.complete_result',
+         lambda i: LabTestResultController.complete_result(_target(fx['complete_results'], i))),
+        ('LabTestResultController.batch_complete_results',
+         lambda i: LabTestResultController.batch_complete_results(_chunk(fx['batch_complete_results'], i, fx['batch_size']))),
+    ]
+    return reads + writes
+
+
+def page_cases(client, fx):
+    """(name, fn(i)) rendering each page through the test client"""
+    pages = [
+        '/',
+        '/tests',
+        '/tests?search=syn01',
+        '/tests?sort=orders&dir=desc',
+        f"/tests/{fx['test_id']}/view",
+        '/orders',
+        '/orders?filter=today',
+        f"/orders?filter={OrderStatusEnum.ORDERED.value}",
+        f"/orders?search={fx['patient_fragment']}",
+        f"/orders/{fx['order_id']}",
+        f"/patients/{fx['patient_id']}",
+        '/results',
+        '/results?filter=completed',
+        '/results?filter=abnormal',
+        '/api/v1/tests',
+        '/api/v1/orders',
+        '/api/v1/results',
+    ]
+    if fx['result_id']:
+        pages.append(f"/results/{fx['result_id']}")
+
+    def render(path):
+        def fn(i):
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+        return fn
+
+    def revalidate(path):
+        etag = {}
+
+        def fn(i):
+            if 'value' not in etag:
+                etag['value'] = client.get(path).headers.get('ETag')
+            response = client.get(path, headers={'If-None-Match': etag['value']} if etag['value'] else {})
+            if response.status_code not in (200, 304):
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+        return fn
+
+    # Detail pages reopened by a browser holding the page (app.pagecache)
+    detail_pages = [f"/tests/{fx['test_id']}/view", f"/orders/{fx['order_id']}"]
+    if fx['result_id']:
+        detail_pages.append(f"/results/{fx['result_id']}")
+
+    return ([(f"GET {path}", render(path)) for path in pages]
+            + [(f"GET {path} [If-None-Match]", revalidate(path)) for path in detail_pages])
+
+
+def bench_size(app, size, repeat, label):
+    """Grow the dataset to `size` orders and run every case against it"""
+    with app.app_context():
+        existing = db.session.scalar(select(func.count(LabTestOrder.id)))
+        generated = generate(size - existing) if size > existing else None
+        fixtures = pick_fixtures(WARMUP + repeat)
+
+        cases = {}
+        for name, fn in page_cases(app.test_client(), fixtures) + controller_cases(fixtures, label):
+            cases[name] = run_case(fn, repeat)
+            print(f"  {name:<55} {cases[name]['median_ms']:>9.2f} ms  {cases[name]['queries']:>3} queries")
+
+        counts = {
+            'tests': db.session.scalar(select(func.count(PathologyTest.id))),
+            'orders': db.session.scalar(select(func.count(LabTestOrder.id))),
+            'results': db.session.scalar(select(func.count(LabTestResult.id))),
+        }
+    return {'size': size, 'rows': counts, 'generated': generated, 'batch_size': fixtures['batch_size'],
+            'cases': cases}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=project_root,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, ratio=REGRESSION_RATIO):
+    """Print cases whose median got slower than `ratio` x the baseline; returns the count"""
+    base_by_size = {dataset['size']: dataset['cases'] for dataset in baseline['datasets']}
+    regressions = 0
+    for dataset in current['datasets']:
+        base_cases = base_by_size.get(dataset['size'])
+        if not base_cases:
+            continue
+        for name, stats in dataset['cases'].items():
+            base = base_cases.get(name)
+            if not base or not base['median_ms']:
+                continue
+            change = stats['median_ms'] / base['median_ms']
+            more_queries = stats['queries'] > base['queries']
+            if change > ratio or more_queries:
+                regressions += 1
+                print(f"  ✗ [{dataset['size']}] {name}: {base['median_ms']:.2f} -> {stats['median_ms']:.2f} ms "
+                      f"({change:.2f}x), queries {base['queries']} -> {stats['queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--db', help='Database URI (default: new temporary SQLite file)')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated order counts, e.g. 1e3,1e5,1e7')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Timed runs per case')
+    parser.add_argument('-o', '--output', help='Write JSON results to this file (default: stdout)')
+    parser.add_argument('--compare', help='Earlier JSON results to check for regressions')
+    args = parser.parse_args()
+
+    sizes = sorted(int(float(size)) for size in args.sizes.split(','))
+    db_uri = args.db
+    if not db_uri:
+        tmp_dir = tempfile.mkdtemp(prefix='pathology-bench-')
+        db_uri = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+    app = create_app(make_config(db_uri))
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'started_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'dialect': db_uri.split(':', 1)[0],
+            'repeat': args.repeat,
+            'warmup': WARMUP,
+        },
+        'datasets': [],
+    }
+    run_label = str(int(time.time()))[-6:]
+    for size in sizes:
+        print(f"Dataset: {size} orders")
+        report['datasets'].append(bench_size(app, size, args.repeat, f"{run_label}{size}"))
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload + '\n')
+        print(f"✓ Results written to {args.output}")
+    else:
+        print(payload)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        print(f"Comparing against {args.compare} (commit {baseline['meta'].get('commit')})")
+        regressions = compare(report, baseline)
+        if regressions:
+            print(f"✗ {regressions} regression(s)")
+            return 1
+        print("✓ No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
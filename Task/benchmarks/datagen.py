@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+"""
+Synthetic data generator for benchmarks
+Fills a database with a realistic lab workload: a test catalog ordered
+with a skewed (Zipf-like) mix, orders (mostly single tests, some panels of
+up to four) spread over the last year in every status for patients who
+mostly come back more than once, and results in every status with values
+around each test's range.
+Rows are written with batched Core INSERTs, so 10^6+ orders stay practical.
+
+Usage:
+    python benchmarks/datagen.py --orders 100000
+    python benchmarks/datagen.py --orders 1000000 --db mysql+pymysql://root:@localhost:3306/pathology_bench
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from sqlalchemy import func, insert, select, update
+
+from app import create_app, db
+from app.models import (
+    PathologyTest, NamingSeries, Patient, LabTestOrder, LabTestOrderLine, LabTestResult,
+    OrderStatusEnum, ResultStatusEnum,
+)
+from app import order_stats, patients, ranges, search, tat
+
+
+BATCH_SIZE = 5000
+DEFAULT_TEST_COUNT = 40
+ZIPF_EXPONENT = 1.1
+HISTORY_DAYS = 365
+
+# Share of orders in each status (the rest of the workflow is derived from it)
+ORDER_STATUS_MIX = (
+    (OrderStatusEnum.COMPLETED.value, 0.55),
+    (OrderStatusEnum.ORDERED.value, 0.25),
+    (OrderStatusEnum.DRAFT.value, 0.12),
+    (OrderStatusEnum.CANCELLED.value, 0.08),
+)
+# Tests per order (visit): most are single tests, some are panels
+LINES_PER_ORDER_MIX = ((1, 0.7), (2, 0.15), (3, 0.1), (4, 0.05))
+# Share of orders placed by a returning patient rather than a new one
+RETURNING_PATIENT_SHARE = 0.6
+# Share of Ordered orders that already have a Draft result entered
+DRAFT_RESULT_SHARE = 0.4
+# Share of orders created today, so the "today" views have work to do
+TODAY_SHARE = 0.01
+
+_SAMPLE_TYPES = ('Blood', 'Serum', 'Plasma', 'Urine', 'Stool', 'Swab')
+_RANGES = (
+    ('4.5-11.0 (10^9/L)', 2.0, 30.0),
+    ('0.4-4.0 (mIU/L)', 0.2, 20.0),
+    ('70-110 (mg/dL)', 40.0, 400.0),
+    ('Total: <200 mg/dL', None, 300.0),
+    ('SGPT: 7-56 U/L', 1.0, 500.0),
+    ('>60 mL/min', 15.0, None),
+    ('135-145 mmol/L', 120.0, 160.0),
+    ('12.0-17.5 g/dL', 6.0, 20.0),
+)
+_FIRST_NAMES = ('Aarav', 'Vivaan', 'Aditya', 'Diya', 'Ananya', 'Ishaan', 'Kavya', 'Rohan', 'Saanvi',
+                'Arjun', 'Meera', 'Kabir', 'Priya', 'Neha', 'Rahul', 'Sneha', 'Vikram', 'Pooja',
+                'José', 'Zoë', 'Mohammed', 'Fatima', 'Chen', 'Olga')
+_LAST_NAMES = ('Patel', 'Shah', 'Mehta', 'Sharma', 'Gupta', 'Iyer', 'Reddy', 'Nair', 'Desai',
+               'Joshi', 'Kulkarni', 'Rao', 'Singh', 'Khan', 'Fernandes', 'Müller')
+
+
+def create_tests(rng, count):
+    """Create the test catalog; returns tests ordered by popularity rank"""
+    tests = []
+    for rank in range(count):
+        normal_range, low, high = _RANGES[rank % len(_RANGES)]
+        test = PathologyTest(
+            test_name=f"Synthetic Test {rank + 1:03d}",
+            test_code=f"SYN{rank + 1:03d}",
+            sample_type=_SAMPLE_TYPES[rank % len(_SAMPLE_TYPES)],
+            normal_range=normal_range,
+            price=round(rng.uniform(20, 500), 2),
+            is_active=rank % 17 != 16,
+            critical_low=low,
+            critical_high=high,
+        )
+        ranges.apply_parsed_range(test)
+        tests.append(test)
+    db.session.add_all(tests)
+    db.session.commit()
+    return tests
+
+
+def _result_value(rng, test):
+    """A numeric result mostly inside the range, sometimes outside it"""
+    low = test.range_low if test.range_low is not None else test.range_high / 4
+    high = test.range_high if test.range_high is not None else test.range_low * 4
+    span = high - low
+    if rng.random() < 0.8:
+        value = rng.uniform(low, high)
+    else:
+        value = rng.uniform(max(0.0, low - span), high + span)
+    return round(value, 2)
+
+
+def generate(order_count, test_count=DEFAULT_TEST_COUNT, seed=42, batch_size=BATCH_SIZE, progress=None):
+    """
+    Generate `order_count` orders (plus tests and results) into the current app's database
+    Returns a dict of row counts and elapsed seconds.
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    tests = PathologyTest.query.filter(PathologyTest.test_code.like('SYN%')).order_by(PathologyTest.id).all()
+    if not tests:
+        tests = create_tests(rng, test_count)
+    test_by_id = {test.id: test for test in tests}
+    test_ids = [test.id for test in tests]
+    # Cumulative weights are computed once; rng.choices would redo it per row
+    test_cum_weights = list(itertools.accumulate(1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(len(tests))))
+    statuses, status_weights = zip(*ORDER_STATUS_MIX)
+    status_cum_weights = list(itertools.accumulate(status_weights))
+    line_counts, line_weights = zip(*LINES_PER_ORDER_MIX)
+    line_cum_weights = list(itertools.accumulate(line_weights))
+
+    next_patient_pk = (db.session.scalar(select(func.max(Patient.id))) or 0) + 1
+    next_order_pk = (db.session.scalar(select(func.max(LabTestOrder.id))) or 0) + 1
+    next_line_pk = (db.session.scalar(select(func.max(LabTestOrderLine.id))) or 0) + 1
+    next_result_pk = (db.session.scalar(select(func.max(LabTestResult.id))) or 0) + 1
+    series = NamingSeries.query.filter_by(series_name='LabTestOrder').first()
+    if not series:
+        series = NamingSeries(series_name='LabTestOrder', series_prefix='LTO-', current_number=1000)
+        db.session.add(series)
+        db.session.commit()
+    next_number = series.current_number + 1
+
+    now = datetime.utcnow()
+    patient_table = Patient.__table__
+    order_table = LabTestOrder.__table__
+    line_table = LabTestOrderLine.__table__
+    result_table = LabTestResult.__table__
+    orders_written = lines_written = results_written = patients_written = 0
+    # (id, name, phone) of every patient generated so far, for return visits
+    known_patients = []
+
+    while orders_written < order_count:
+        size = min(batch_size, order_count - orders_written)
+        patient_rows = []
+        index_rows = []
+        order_rows = []
+        line_rows = []
+        result_rows = []
+        for _ in range(size):
+            if rng.random() < TODAY_SHARE:
+                created_at = now - timedelta(seconds=rng.uniform(0, 8 * 3600))
+            else:
+                created_at = now - timedelta(days=rng.uniform(1, HISTORY_DAYS))
+            status = rng.choices(statuses, cum_weights=status_cum_weights)[0]
+            line_count = rng.choices(line_counts, cum_weights=line_cum_weights)[0]
+            order_test_ids = []
+            while len(order_test_ids) < line_count:
+                test_id = rng.choices(test_ids, cum_weights=test_cum_weights)[0]
+                if test_id not in order_test_ids:
+                    order_test_ids.append(test_id)
+            if known_patients and rng.random() < RETURNING_PATIENT_SHARE:
+                patient = rng.choice(known_patients)
+            else:
+                # Phone numbers derive from the id, so they never collide on the unique key
+                patient = (next_patient_pk, f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}",
+                           f"+91 9{next_patient_pk:09d}")
+                patient_rows.append({
+                    'id': patient[0], 'name': patient[1], 'phone': patient[2],
+                    'phone_key': patients.phone_key(patient[2]), 'name_key': patients.name_key(patient[1]),
+                    'created_at': created_at, 'updated_at': created_at,
+                })
+                known_patients.append(patient)
+                next_patient_pk += 1
+            order_rows.append({
+                'id': next_order_pk,
+                'order_id': f"LTO-{next_number}",
+                'patient_id': patient[0],
+                'patient_name': patient[1],
+                'patient_phone': patient[2],
+                'test_id': order_test_ids[0],
+                'order_date': created_at.date(),
+                'status': status,
+                'ordered_at': None,
+                'completed_at': None,
+                'cancelled_at': None,
+                'created_at': created_at,
+                'updated_at': created_at,
+            })
+            index_rows.append((next_order_pk, order_rows[-1]['order_id'], patient[1], patient[2]))
+            if status != OrderStatusEnum.DRAFT.value:
+                order_rows[-1]['ordered_at'] = created_at + timedelta(minutes=rng.uniform(1, 30))
+            if status == OrderStatusEnum.CANCELLED.value:
+                order_rows[-1]['cancelled_at'] = order_rows[-1]['updated_at'] = (
+                    order_rows[-1]['ordered_at'] + timedelta(minutes=rng.uniform(5, 240)))
+
+            # Completed orders have a completed result on every line; some
+            # Ordered ones have a draft result on their first line
+            if status == OrderStatusEnum.COMPLETED.value:
+                result_lines = line_count
+            elif status == OrderStatusEnum.ORDERED.value and rng.random() < DRAFT_RESULT_SHARE:
+                result_lines = 1
+            else:
+                result_lines = 0
+            for line_no, test_id in enumerate(order_test_ids, start=1):
+                test = test_by_id[test_id]
+                line_rows.append({
+                    'id': next_line_pk,
+                    'order_id': next_order_pk,
+                    'line_no': line_no,
+                    'test_id': test_id,
+                    'price': test.price,
+                    'completed_at': None,
+                    'created_at': created_at,
+                })
+                if line_no <= result_lines:
+                    value = _result_value(rng, test)
+                    result_status = (ResultStatusEnum.COMPLETED.value if status == OrderStatusEnum.COMPLETED.value
+                                     else ResultStatusEnum.DRAFT.value)
+                    result_created = order_rows[-1]['ordered_at'] + timedelta(minutes=rng.uniform(20, 24 * 60))
+                    result_updated = result_created + timedelta(minutes=rng.uniform(1, 120))
+                    result_rows.append({
+                        'id': next_result_pk,
+                        'order_id': next_order_pk,
+                        'line_id': next_line_pk,
+                        'result_value': f"{value} {test.range_unit or ''}".strip(),
+                        'result_numeric': value,
+                        'flag': ranges.classify_value(value, test),
+                        'technician_notes': None,
+                        'status': result_status,
+                        'completed_at': result_updated if result_status == ResultStatusEnum.COMPLETED.value else None,
+                        'created_at': result_created,
+                        'updated_at': result_updated,
+                    })
+                    if status == OrderStatusEnum.COMPLETED.value:
+                        line_rows[-1]['completed_at'] = result_updated
+                        # The order completes with its last line
+                        order_rows[-1]['updated_at'] = order_rows[-1]['completed_at'] = max(
+                            result_updated, order_rows[-1]['completed_at'] or result_updated)
+                    next_result_pk += 1
+                next_line_pk += 1
+
+            next_order_pk += 1
+            next_number += 1
+
+        if patient_rows:
+            db.session.execute(insert(patient_table), patient_rows)
+        db.session.execute(insert(order_table), order_rows)
+        db.session.execute(insert(line_table), line_rows)
+        if result_rows:
+            db.session.execute(insert(result_table), result_rows)
+        search.index_orders(index_rows)
+        db.session.commit()
+
+        orders_written += size
+        patients_written += len(patient_rows)
+        lines_written += len(line_rows)
+        results_written += len(result_rows)
+        if progress:
+            progress(orders_written, order_count)
+
+    # Keep the naming series ahead of the generated order IDs
+    db.session.execute(
+        update(NamingSeries.__table__)
+        .where(NamingSeries.__table__.c.series_name == 'LabTestOrder')
+        .values(current_number=next_number - 1)
+    )
+    # Rows went in through Core, so recompute the per-test counters in one pass
+    order_stats.rebuild_stats()
+    db.session.commit()
+    tat.rebuild_rollups()
+
+    return {
+        'tests': len(tests),
+        'patients': patients_written,
+        'orders': orders_written,
+        'lines': lines_written,
+        'results': results_written,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def make_config(db_uri):
+    config = {
+        'SQLALCHEMY_DATABASE_URI': db_uri,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SECRET_KEY': 'benchmark',
+        'SCHEMA_BOOT_MODE': 'create',  # benchmark databases are created on the fly
+    }
+    if db_uri.startswith('sqlite'):
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}}
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--db', help='Database URI (default: new temporary SQLite file)')
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--tests', type=int, default=DEFAULT_TEST_COUNT)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    db_uri = args.db
+    if not db_uri:
+        tmp_dir = tempfile.mkdtemp(prefix='pathology-bench-')
+        db_uri = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+    def progress(done, total):
+        print(f"\r  {done}/{total} orders", end='', flush=True)
+
+    app = create_app(make_config(db_uri))
+    with app.app_context():
+        print(f"Generating {args.orders} orders into {db_uri}")
+        counts = generate(args.orders, test_count=args.tests, seed=args.seed,
+                          batch_size=args.batch_size, progress=progress)
+    print()
+    print(f"✓ {counts['tests']} tests, {counts['patients']} patients, {counts['orders']} orders "
+          f"({counts['lines']} lines), {counts['results']} results in {counts['seconds']:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
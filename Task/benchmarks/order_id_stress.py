@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Multi-process stress test for order ID allocation
+Spawns several worker processes that create orders concurrently against the
+same database, then checks every order_id is unique and reports inserts/s.
+
+Usage:
+    python benchmarks/order_id_stress.py --workers 8 --orders 500
+    python benchmarks/order_id_stress.py --db mysql+pymysql://root:@localhost:3306/pathology_db
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from app import create_app, db
+from app.models import PathologyTest, LabTestOrder
+
+
+def make_config(db_uri, block_size):
+    config = {
+        'SQLALCHEMY_DATABASE_URI': db_uri,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SECRET_KEY': 'stress-test',
+        'ORDER_ID_BLOCK_SIZE': block_size,
+        'SCHEMA_BOOT_MODE': 'off',  # prepare_test creates the schema once
+    }
+    if db_uri.startswith('sqlite'):
+        # Writers queue on SQLite's database lock instead of failing fast
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}}
+    return config
+
+
+def prepare_test(config):
+    """Create (or reuse) the test every worker orders against"""
+    from app.migrations import upgrade_schema
+
+    app = create_app(config)
+    with app.app_context():
+        upgrade_schema()
+        test = PathologyTest.query.filter_by(test_code='STRESS').first()
+        if not test:
+            test = PathologyTest(test_name='Stress Test Panel', test_code='STRESS',
+                                 sample_type='Blood', normal_range='0-1', price=1)
+            db.session.add(test)
+            db.session.commit()
+        return test.id
+
+
+def worker(config, test_id, count, barrier, queue):
+    """Create `count` orders and report the IDs handed out"""
+    from app.controllers import LabTestOrderController
+
+    app = create_app(config)
+    order_ids = []
+    errors = 0
+    with app.app_context():
+        barrier.wait()
+        for i in range(count):
+            try:
+                order = LabTestOrderController.create_order(
+                    patient_name=f'Stress Patient {os.getpid()}-{i}',
+                    patient_phone='9000000000',
+                    test_id=test_id,
+                    order_date=date.today(),
+                )
+                order_ids.append(order.order_id)
+            except Exception:
+                db.session.rollback()
+                errors += 1
+    queue.put((order_ids, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--db', help='Database URI (default: temporary SQLite file)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--orders', type=int, default=250, help='Orders per worker')
+    parser.add_argument('--block-size', type=int, default=20, help='ORDER_ID_BLOCK_SIZE')
+    args = parser.parse_args()
+
+    db_uri = args.db
+    if not db_uri:
+        tmp_dir = tempfile.mkdtemp(prefix='order-id-stress-')
+        db_uri = f"sqlite:///{os.path.join(tmp_dir, 'stress.db')}"
+
+    config = make_config(db_uri, args.block_size)
+    test_id = prepare_test(config)
+
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(args.workers + 1)
+    queue = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(config, test_id, args.orders, barrier, queue))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    barrier.wait()
+    started = time.perf_counter()
+    outcomes = [queue.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    order_ids = [order_id for ids, _ in outcomes for order_id in ids]
+    errors = sum(err for _, err in outcomes)
+    duplicates = len(order_ids) - len(set(order_ids))
+
+    app = create_app(config)
+    with app.app_context():
+        stored = LabTestOrder.query.filter(LabTestOrder.order_id.in_(order_ids)).count() if order_ids else 0
+
+    print("Order ID allocation stress test")
+    print("=" * 50)
+    print(f"Database:        {db_uri}")
+    print(f"Workers:         {args.workers} x {args.orders} orders (block size {args.block_size})")
+    print(f"Orders created:  {len(order_ids)} ({errors} failed)")
+    print(f"Stored in DB:    {stored}")
+    print(f"Duplicate IDs:   {duplicates}")
+    print(f"Elapsed:         {elapsed:.2f}s")
+    print(f"Throughput:      {len(order_ids) / elapsed:.1f} orders/s" if elapsed else "")
+
+    if duplicates or errors or stored != len(order_ids):
+        print("✗ Stress test FAILED")
+        return 1
+    print("✓ All order IDs unique")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Order lines vs one order per test
+Books the same patient visits two ways - k single-test orders, or one
+order with k lines - and runs each through the whole workflow (create,
+mark Ordered, enter and complete every result). Reports rows written,
+SQL statements and time per visit for k = 1, 3 and 5.
+
+Usage:
+    python benchmarks/order_lines_bench.py --visits 200
+    python benchmarks/order_lines_bench.py --db mysql+pymysql://root:@localhost:3306/pathology_bench
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from sqlalchemy import func, select
+
+from app import create_app, db
+from app.models import PathologyTest, LabTestOrder, LabTestOrderLine, LabTestResult, OrderStatusEnum
+from app.controllers import LabTestOrderController, LabTestResultController
+from benchmarks.controller_bench import QueryCounter
+from benchmarks.datagen import make_config
+
+
+DEFAULT_VISITS = 100
+PANEL_SIZES = (1, 3, 5)
+
+
+def prepare_tests(count):
+    """Create (or reuse) `count` tests for the visits to order"""
+    tests = PathologyTest.query.filter(PathologyTest.test_code.like('PANEL%')).order_by(PathologyTest.id).all()
+    for i in range(len(tests), count):
+        tests.append(PathologyTest(test_name=f'Panel Test {i}', test_code=f'PANEL{i}', sample_type='Blood',
+                                   normal_range='1-10', price=100 + i))
+        db.session.add(tests[-1])
+    db.session.commit()
+    return [test.id for test in tests[:count]]
+
+
+def book_visit(test_ids, as_panel, i):
+    """Book and finish one visit; returns the orders created"""
+    patient = {'patient_name': f'Visit Patient {i}', 'patient_phone': '9812345678', 'order_date': date.today()}
+    groups = [test_ids] if as_panel else [[test_id] for test_id in test_ids]
+    orders = [LabTestOrderController.create_order(test_ids=group, **patient) for group in groups]
+    for order in orders:
+        LabTestOrderController.transition_status(order.id, OrderStatusEnum.ORDERED.value)
+        for line in list(order.lines):
+            result = LabTestResultController.create_result(order.id, '5.0', line_id=line.id)
+            LabTestResultController.complete_result(result.id)
+    return orders
+
+
+def row_counts():
+    return {
+        model.__tablename__: db.session.scalar(select(func.count()).select_from(model))
+        for model in (LabTestOrder, LabTestOrderLine, LabTestResult)
+    }
+
+
+def measure(test_ids, as_panel, visits):
+    before = row_counts()
+    started = time.perf_counter()
+    with QueryCounter(db.engine) as counter:
+        for i in range(visits):
+            book_visit(test_ids, as_panel, i)
+    elapsed = time.perf_counter() - started
+    after = row_counts()
+    rows = {table: after[table] - before[table] for table in after}
+    return {
+        'orders_per_visit': rows['lab_test_order'] / visits,
+        'rows_per_visit': sum(rows.values()) / visits,
+        'queries_per_visit': counter.count / visits,
+        'ms_per_visit': elapsed * 1000 / visits,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='Database URI (default: a temporary SQLite file)')
+    parser.add_argument('--visits', type=int, default=DEFAULT_VISITS, help='Visits booked per case')
+    args = parser.parse_args(argv)
+
+    db_uri = args.db
+    if not db_uri:
+        tmp_dir = tempfile.mkdtemp(prefix='order-lines-bench-')
+        db_uri = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+    app = create_app(make_config(db_uri))
+    print("Order lines vs one order per test")
+    print("=" * 78)
+    print(f"Database: {db_uri}   Visits per case: {args.visits}")
+    print(f"{'tests':>5}  {'booking':<16}{'orders':>8}{'rows':>8}{'queries':>10}{'ms':>10}   (per visit)")
+    with app.app_context():
+        test_ids = prepare_tests(max(PANEL_SIZES))
+        for k in PANEL_SIZES:
+            for as_panel, label in ((False, f'{k} orders'), (True, f'1 order, {k} lines')):
+                stats = measure(test_ids[:k], as_panel, args.visits)
+                print(f"{k:>5}  {label:<16}{stats['orders_per_visit']:>8.1f}{stats['rows_per_visit']:>8.1f}"
+                      f"{stats['queries_per_visit']:>10.1f}{stats['ms_per_visit']:>10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Cold-boot timing for worker processes
+Starts fresh interpreter processes that import the app and call
+create_app() the way a gunicorn worker or `flask` CLI invocation does,
+and reports import, create_app and total process times.
+
+Usage:
+    python benchmarks/startup_time.py --runs 20
+    python benchmarks/startup_time.py --db mysql+pymysql://root:@localhost:3306/pathology_db
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from app import create_app
+imported = time.perf_counter()
+create_app()
+booted = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - started) * 1000, 'create_app_ms': (booted - imported) * 1000}}))
+"""
+
+
+def prepare(db_uri):
+    """Make sure the schema exists before timing boots against it"""
+    from app import create_app, db
+    from app.config import load_config
+    from app.migrations import upgrade_schema
+
+    config = load_config()
+    config['SQLALCHEMY_DATABASE_URI'] = db_uri
+    config['SCHEMA_BOOT_MODE'] = 'off'
+    app = create_app(config)
+    with app.app_context():
+        upgrade_schema()
+        db.engine.dispose()
+
+
+def boot_once(db_uri):
+    env = dict(os.environ, DATABASE_URL=db_uri)
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', _CHILD.format(root=str(project_root))],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    sample = json.loads(output.strip().splitlines()[-1])
+    sample['process_ms'] = (time.perf_counter() - started) * 1000
+    return sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--db', help='Database URI (default: temporary SQLite file)')
+    parser.add_argument('--runs', type=int, default=15)
+    args = parser.parse_args()
+
+    db_uri = args.db
+    if not db_uri:
+        tmp_dir = tempfile.mkdtemp(prefix='pathology-boot-')
+        db_uri = f"sqlite:///{os.path.join(tmp_dir, 'boot.db')}"
+    prepare(db_uri)
+
+    samples = [boot_once(db_uri) for _ in range(args.runs)]
+    print("Cold worker boot")
+    print("=" * 50)
+    print(f"Database:  {db_uri}")
+    print(f"Runs:      {args.runs}")
+    for key, label in (('import_ms', 'import app'), ('create_app_ms', 'create_app()'), ('process_ms', 'process')):
+        values = sorted(sample[key] for sample in samples)
+        print(f"{label:<14} median {statistics.median(values):8.1f} ms   min {values[0]:8.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Bytes on the wire per page view
+Fetches each page through the Flask test client the way a browser would:
+the HTML plus every stylesheet it links, once per Accept-Encoding. A first
+view pays for the HTML and its stylesheets; a repeat view pays only for
+the HTML when the stylesheets are served with a long max-age (otherwise
+they are counted again). Sizes include the status line and headers.
+
+Usage:
+    python benchmarks/wire_bench.py --orders 1000
+    python benchmarks/wire_bench.py --db mysql+pymysql://root:@localhost:3306/pathology_bench
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from sqlalchemy import func, select
+
+from app import create_app, db
+from app.models import PathologyTest, LabTestOrder, LabTestResult, ResultStatusEnum
+from benchmarks.datagen import generate, make_config
+
+
+DEFAULT_ORDERS = 1000
+ENCODINGS = ('identity', 'gzip', 'br')
+LONG_MAX_AGE = 86400
+_STYLESHEET = re.compile(r'<link[^>]+rel="stylesheet"[^>]+href="([^"]+)"')
+
+
+def wire_size(response):
+    """Status line + headers + body, as sent"""
+    head = len(f"HTTP/1.1 {response.status}\r\n")
+    head += sum(len(f"{name}: {value}\r\n") for name, value in response.headers.items()) + 2
+    return head + len(response.get_data())
+
+
+def view_bytes(client, path, encoding):
+    """(first view, repeat view) bytes for one page"""
+    headers = {'Accept-Encoding': encoding}
+    response = client.get(path, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {path} returned {response.status_code}")
+    html = response.get_data(as_text=True) if response.content_encoding is None else None
+    if html is None:
+        html = client.get(path, headers={'Accept-Encoding': 'identity'}).get_data(as_text=True)
+
+    page = wire_size(response)
+    first = repeat = page
+    for href in _STYLESHEET.findall(html):
+        asset = client.get(href, headers=headers)
+        first += wire_size(asset)
+        if (asset.cache_control.max_age or 0) < LONG_MAX_AGE:
+            repeat += wire_size(asset)
+    return first, repeat
+
+
+def sample_pages():
+    test_id = db.session.scalar(select(func.min(PathologyTest.id)))
+    order = LabTestOrder.query.order_by(LabTestOrder.id.desc()).first()
+    result_id = db.session.scalar(
+        select(func.max(LabTestResult.id)).where(LabTestResult.status == ResultStatusEnum.COMPLETED.value)
+    )
+    pages = ['/', '/tests', '/orders', '/results', f"/tests/{test_id}/view", f"/orders/{order.id}",
+             f"/patients/{order.patient_id}"]
+    if result_id:
+        pages.append(f"/results/{result_id}")
+    return pages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='Database URI (default: a temporary SQLite file)')
+    parser.add_argument('--orders', type=int, default=DEFAULT_ORDERS, help='Orders to generate')
+    args = parser.parse_args(argv)
+
+    db_uri = args.db
+    if not db_uri:
+        tmp_dir = tempfile.mkdtemp(prefix='wire-bench-')
+        db_uri = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+    app = create_app(make_config(db_uri))
+    with app.app_context():
+        existing = db.session.scalar(select(func.count(LabTestOrder.id)))
+        if existing < args.orders:
+            generate(args.orders - existing)
+        pages = sample_pages()
+
+    client = app.test_client()
+    print("Bytes on the wire per page view (first / repeat)")
+    print("=" * 78)
+    print(f"{'page':<28}" + ''.join(f"{encoding:>17}" for encoding in ENCODINGS))
+    totals = dict.fromkeys(ENCODINGS, (0, 0))
+    for path in pages:
+        row = f"{path:<28}"
+        for encoding in ENCODINGS:
+            first, repeat = view_bytes(client, path, encoding)
+            totals[encoding] = (totals[encoding][0] + first, totals[encoding][1] + repeat)
+            row += f"{first:>9} /{repeat:>6}"
+        print(row)
+    print(f"{'mean':<28}" + ''.join(
+        f"{totals[encoding][0] // len(pages):>9} /{totals[encoding][1] // len(pages):>6}" for encoding in ENCODINGS
+    ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,15 +8,24 @@ import os
 import sys
 from pathlib import Path
 
+import click
+
 # Add project root to path
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
 from app import create_app, db
+from app.config import load_config
 from app.models import PathologyTest, LabTestOrder, LabTestResult, NamingSeries
 
+# Commands that create or upgrade the schema, so must start without one
+SCHEMA_COMMANDS = ('upgrade-db', 'init-db')
+
 # Create Flask app
-app = create_app()
+config = load_config()
+if config.get('SCHEMA_BOOT_MODE', 'check') == 'check' and set(SCHEMA_COMMANDS) & set(sys.argv[1:]):
+    config['SCHEMA_BOOT_MODE'] = 'warn'
+app = create_app(config)
 
 
 @app.shell_context_processor
@@ -32,11 +41,351 @@ def make_shell_context():
 
 
 @app.cli.command()
-def init_db():
-    """Initialize the database with tables"""
+def upgrade_db():
+    """Create missing tables, apply schema upgrades and stamp the schema version"""
+    from app.migrations import upgrade_schema, SCHEMA_VERSION
+
+    with app.app_context():
+        applied = upgrade_schema()
+        for step in applied:
+            print(f"  ✓ {step}")
+        print(f"✓ Database at schema version {SCHEMA_VERSION} ({len(applied)} change(s) applied)")
+
+
+# A fresh database and an existing one go through the same upgrade
+app.cli.add_command(upgrade_db, 'init-db')
+
+
+@app.cli.command()
+def check_indexes():
+    """EXPLAIN controller queries and verify each uses its index"""
+    from app.migrations import check_index_usage
+
+    with app.app_context():
+        failures = 0
+        for label, index_name, used, plan in check_index_usage():
+            mark = '✓' if used else '✗'
+            print(f"  {mark} {label}: {index_name}")
+            if not used:
+                failures += 1
+                for line in plan.splitlines():
+                    print(f"      {line}")
+        if failures:
+            print(f"✗ {failures} query(ies) not using their index")
+            sys.exit(1)
+        print("✓ All controller queries use their indexes")
+
+
+@app.cli.command()
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Input format (default: from extension)')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per INSERT batch')
+def import_orders(path, fmt, chunk_size):
+    """Bulk-create orders from a CSV or JSON-lines file"""
+    import time
+    from app.controllers import LabTestOrderController
+    from app.ingest import detect_format, parse_order_rows
+
+    with app.app_context(), open(path, encoding='utf-8-sig', newline='') as handle:
+        fmt = fmt or detect_format(filename=path)
+        started = time.perf_counter()
+        report = LabTestOrderController.bulk_create_orders(
+            parse_order_rows(handle, fmt), chunk_size=chunk_size
+        )
+        elapsed = time.perf_counter() - started
+
+        for failure in report['failed']:
+            print(f"  ✗ Row {failure['row']}: {failure['error']}")
+        rate = report['created'] / elapsed if elapsed else 0
+        print(f"✓ Imported {report['created']} order(s) in {elapsed:.2f}s ({rate:.0f} orders/s), "
+              f"{len(report['failed'])} row(s) failed")
+
+
+def _export_command(stream_factory, statuses, date_from, date_to, status, test_code, include_archived, output):
+    from app.export import parse_export_filters
+
+    with app.app_context():
+        try:
+            filters = parse_export_filters(date_from, date_to, status, test_code, statuses, include_archived)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        with click.open_file(output, 'w', encoding='utf-8', newline='') as handle:
+            for chunk in stream_factory(filters):
+                handle.write(chunk)
+
+
+export_options = [
+    click.option('--from', 'date_from', help='First order date (YYYY-MM-DD)'),
+    click.option('--to', 'date_to', help='Last order date (YYYY-MM-DD)'),
+    click.option('--status', help='Status filter'),
+    click.option('--test-code', help='Test code filter'),
+    click.option('--include-archived', is_flag=True, help='Also export archived orders (see archive-orders)'),
+    click.option('-o', '--output', default='-', show_default=True, help='Output file'),
+]
+
+
+def with_export_options(command):
+    for option in reversed(export_options):
+        command = option(command)
+    return command
+
+
+@app.cli.command()
+@with_export_options
+def export_orders(date_from, date_to, status, test_code, include_archived, output):
+    """Stream orders (with any results) to CSV; archived orders only with --include-archived"""
+    from app.export import stream_orders_csv, ORDER_STATUSES
+
+    _export_command(stream_orders_csv, ORDER_STATUSES, date_from, date_to, status, test_code, include_archived, output)
+
+
+@app.cli.command()
+@with_export_options
+def export_results(date_from, date_to, status, test_code, include_archived, output):
+    """Stream results joined with order and test to NDJSON; archived ones only with --include-archived"""
+    from app.export import stream_results_ndjson, RESULT_STATUSES
+
+    _export_command(stream_results_ndjson, RESULT_STATUSES, date_from, date_to, status, test_code, include_archived,
+                    output)
+
+
+@app.cli.command()
+@click.option('--batch-size', default=1000, show_default=True, help='Orders per batch')
+def reindex_search(batch_size):
+    """Rebuild the order search index from lab_test_order"""
+    from app.search import reindex_all_orders
+
+    with app.app_context():
+        total = reindex_all_orders(batch_size=batch_size)
+        print(f"✓ Indexed {total} order(s)")
+
+
+@app.cli.command()
+def backfill_ranges():
+    """Parse reference ranges and result values, then flag all results"""
+    from app.ranges import backfill_ranges as run_backfill
+
+    with app.app_context():
+        tests, results = run_backfill()
+        print(f"✓ Parsed ranges for {tests} test(s), flagged {results} result(s)")
+
+
+@app.cli.command()
+def rebuild_test_stats():
+    """Recompute per-test order counts and revenue from the order lines"""
+    from app.order_stats import rebuild_stats
+
+    with app.app_context():
+        tests = rebuild_stats()
+        db.session.commit()
+        print(f"✓ Rebuilt order counters for {tests} test(s)")
+
+
+@app.cli.command()
+@click.option('--batch-size', default=5000, show_default=True, help='Order lines per batch')
+@click.option('--lag', 'lag_seconds', default=60, show_default=True,
+              help='Leave lines completed in the last N seconds for the next run')
+@click.option('--rebuild', is_flag=True, help='Empty the rollups and recount every completed order line')
+def rollup_tat(batch_size, lag_seconds, rebuild):
+    """Fold newly completed order lines into the daily turnaround-time rollups"""
+    from app.tat import rebuild_rollups, rollup, rollup_status
+
+    with app.app_context():
+        if rebuild:
+            total = rebuild_rollups(batch_size=batch_size)
+        else:
+            total = rollup(batch_size=batch_size, lag_seconds=lag_seconds)
+        state = rollup_status()
+        print(f"✓ Rolled up {total} order line(s); watermark {state['last_completed_at'] or '-'} "
+              f"(line #{state['last_line_id']})")
+
+
+@app.cli.command()
+@click.option('--batch-size', default=5000, show_default=True, help='Patients per transaction')
+def dedupe_patients(batch_size):
+    """Re-key patients by normalized phone and name and merge duplicates"""
+    from app.patients import dedupe_patients as run_dedupe
+
+    with app.app_context():
+        rekeyed, merged = run_dedupe(batch_size=batch_size)
+        print(f"✓ Re-keyed {rekeyed} patient(s), merged {merged} duplicate(s)")
+
+
+@app.cli.command()
+@click.option('--older-than', 'days', default=180, show_default=True, type=click.IntRange(min=1),
+              help='Days since the order was completed or cancelled')
+@click.option('--batch-size', default=500, show_default=True, help='Orders per transaction')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches')
+@click.option('--dry-run', is_flag=True, help='Report what would be archived without writing')
+def archive_orders(days, batch_size, max_batches, dry_run):
+    """Move old Completed/Cancelled orders into the archive tables"""
+    from app.archive import archive_orders as run_archive, archive_status
+
+    with app.app_context():
+        summary = run_archive(older_than_days=days, batch_size=batch_size, max_batches=max_batches, dry_run=dry_run)
+        verb = 'Would archive' if dry_run else 'Archived'
+        print(f"✓ {verb} {summary['orders']} order(s), {summary['lines']} line(s), "
+              f"{summary['results']} result(s) in {summary['batches']} batch(es)")
+        status = archive_status()
+        print(f"  {status['live_orders']} live order(s), oldest {status['oldest_live_order'] or '-'}; "
+              f"{status['archived_orders']} archived, last at {status['last_archived_at'] or '-'}")
+
+
+@app.cli.command()
+@click.option('--window', 'window_minutes', default=120, show_default=True,
+              help='Orders created within N minutes of the visit\'s first order are one visit')
+@click.option('--batch-size', default=500, show_default=True, help='Candidate groups per transaction')
+@click.option('--dry-run', is_flag=True, help='Report what would be merged without writing')
+def merge_visits(window_minutes, batch_size, dry_run):
+    """Merge same-visit single-test orders into one multi-test order"""
+    from app.order_lines import merge_visits as run_merge
+
+    with app.app_context():
+        summary = run_merge(window_minutes=window_minutes, batch_size=batch_size, dry_run=dry_run)
+        verb = 'Would merge' if dry_run else 'Merged'
+        print(f"✓ {verb} {summary['orders_merged']} order(s) into {summary['visits']} visit(s)")
+        for survivor, retired in summary['examples']:
+            print(f"  {survivor} <- {', '.join(retired)}")
+        if summary['orders_merged'] and not dry_run:
+            print("  Run `flask rollup-tat --rebuild` to re-time the merged visits")
+
+
+@app.cli.command()
+@click.option('--by', type=click.Choice(['test', 'day']), default='test', show_default=True)
+@click.option('--from', 'date_from', type=click.DateTime(['%Y-%m-%d']), help='First completion day (YYYY-MM-DD)')
+@click.option('--to', 'date_to', type=click.DateTime(['%Y-%m-%d']), help='Last completion day (YYYY-MM-DD)')
+@click.option('--test-code', help='Only this test (with --by day)')
+def tat_report(by, date_from, date_to, test_code):
+    """Print p50/p90/p99 turnaround times from the daily rollups"""
+    from app.tat import PERCENTILES, format_duration, tat_by_day, tat_by_test
+
+    date_from = date_from.date() if date_from else None
+    date_to = date_to.date() if date_to else None
+    with app.app_context():
+        try:
+            if by == 'test':
+                rows = tat_by_test(date_from, date_to)
+            else:
+                rows = tat_by_day(date_from, date_to, test_code=test_code)
+        except ValueError as e:
+            print(f"✗ {e}")
+            sys.exit(1)
+
+        label = 'Test' if by == 'test' else 'Day'
+        columns = ['avg'] + [f'p{p}' for p in PERCENTILES] + ['max']
+        print(f"{label:<12} {'Orders':>8} " + ' '.join(f"{column:>8}" for column in columns))
+        for row in rows:
+            key = row['test_code'] if by == 'test' else row['day'].isoformat()
+            values = [row['avg_seconds']] + [row[f'p{p}_seconds'] for p in PERCENTILES] + [row['max_seconds']]
+            print(f"{key:<12} {row['completed']:>8} " + ' '.join(f"{format_duration(v):>8}" for v in values))
+        if not rows:
+            print("(no completed orders rolled up yet; run `flask rollup-tat`)")
+
+
+@app.cli.command()
+@click.option('--concurrency', default=4, show_default=True,
+              help='Jobs run at once (threads); keep within the DB pool size')
+@click.option('--poll', 'poll_interval', default=1.0, show_default=True, help='Seconds between queue polls when idle')
+@click.option('--kind', 'kinds', multiple=True, help='Only run jobs of this kind (repeatable)')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more')
+def run_worker(concurrency, poll_interval, kinds, burst):
+    """Run background jobs from the queue until interrupted"""
+    import signal
+    from app.jobs import Worker
+
+    worker = Worker(app, concurrency=concurrency, poll_interval=poll_interval, kinds=list(kinds))
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    print(f"Worker {worker.name}: {concurrency} thread(s), kinds {', '.join(kinds) or 'all'}")
+    try:
+        counts = worker.run(burst=burst)
+    except KeyboardInterrupt:
+        # Second Ctrl+C would abandon running jobs; they are requeued once stale
+        worker.stop()
+        counts = worker.counts
+    print(f"✓ {counts['done']} done, {counts['queued']} to retry, {counts['dead']} dead")
+
+
+@app.cli.command()
+@click.option('--failed', is_flag=True, help='Also list recent failures')
+def jobs(failed):
+    """Show background job counts by kind and status"""
+    from app.jobs import failed_jobs, queue_stats
+    from app.models import JobStatusEnum
+
     with app.app_context():
-        db.create_all()
-        print("✓ Database initialized successfully")
+        stats = queue_stats()
+        statuses = [status.value for status in JobStatusEnum]
+        print(f"{'Kind':<16} " + ' '.join(f"{status:>8}" for status in statuses))
+        for kind in sorted({kind for kind, _ in stats['counts']}):
+            print(f"{kind:<16} " + ' '.join(f"{stats['counts'].get((kind, status), 0):>8}" for status in statuses))
+        if stats['oldest_due_seconds'] is not None:
+            print(f"Oldest due job has waited {stats['oldest_due_seconds']:.0f}s")
+        if failed:
+            for job in failed_jobs():
+                error = (job.last_error or '').splitlines()[0]
+                print(f"  #{job.id} {job.kind} {job.status} attempt {job.attempts}/{job.max_attempts}: {error}")
+
+
+@app.cli.command()
+@click.argument('job_ids', nargs=-1, type=int)
+def jobs_retry(job_ids):
+    """Requeue dead jobs (all, or the given IDs)"""
+    from app.jobs import retry_jobs
+
+    with app.app_context():
+        print(f"✓ Requeued {retry_jobs(job_ids)} job(s)")
+
+
+@app.cli.command()
+@click.option('--older-than', 'days', default=7, show_default=True, help='Days since the job finished')
+def jobs_purge(days):
+    """Delete finished jobs"""
+    from app.jobs import purge_jobs
+
+    with app.app_context():
+        print(f"✓ Deleted {purge_jobs(days)} finished job(s)")
+
+
+@app.cli.command()
+@click.option('--workers', type=int, default=lambda: int(os.environ.get('WEB_CONCURRENCY', 4)),
+              show_default='$WEB_CONCURRENCY or 4', help='Gunicorn worker processes')
+@click.option('--threads', type=int, default=1, show_default=True, help='Threads per worker (gthread)')
+@click.option('--max-connections', type=int, help='Server max_connections (default: ask the server)')
+def pool_advice(workers, threads, max_connections):
+    """Suggest DB_POOL_SIZE / DB_MAX_OVERFLOW for a gunicorn layout"""
+    from sqlalchemy import text
+    from app.config import pool_sizing
+    from app.poolstats import pool_stats
+
+    with app.app_context():
+        wait_timeout = None
+        if db.engine.dialect.name == 'mysql':
+            with db.engine.connect() as conn:
+                variables = dict(conn.execute(text(
+                    "SHOW VARIABLES WHERE Variable_name IN ('max_connections', 'wait_timeout')"
+                )).all())
+            max_connections = max_connections or int(variables['max_connections'])
+            wait_timeout = int(variables['wait_timeout'])
+        max_connections = max_connections or 151
+
+        try:
+            sizing = pool_sizing(workers, threads, max_connections)
+        except ValueError as e:
+            print(f"✗ {e}")
+            sys.exit(1)
+
+        print(f"Layout: {workers} worker(s) x {threads} thread(s), max_connections {max_connections}")
+        print(f"  DB_POOL_SIZE={sizing['pool_size']}")
+        print(f"  DB_MAX_OVERFLOW={sizing['max_overflow']}")
+        print(f"  Up to {sizing['per_worker']} connection(s) per worker, {sizing['total']} in total")
+
+        recycle = app.config.get('DB_POOL_RECYCLE')
+        if wait_timeout and recycle and recycle >= wait_timeout:
+            print(f"✗ DB_POOL_RECYCLE={recycle} is not below the server's wait_timeout={wait_timeout}")
+        stats = pool_stats(db.engine)
+        if stats and stats['checkouts']:
+            print(f"  This process: {stats['checkouts']} checkout(s), avg wait {stats['avg_wait_ms']} ms, "
+                  f"max {stats['max_wait_ms']} ms, {stats['timeouts']} timeout(s)")
 
 
 @app.cli.command()
@@ -107,19 +456,19 @@ def seed_db():
                 {
                     'patient_name': 'Mr patel',
                     'patient_phone': '+91 9898745612',
-                    'test_id': created_tests[0].id,
+                    'test_ids': [test.id for test in created_tests[:2]],
                     'order_date': date.today(),
                 },
                 {
                     'patient_name': 'Patel Sir',
                     'patient_phone': '9898255612',
-                    'test_id': created_tests[1].id,
+                    'test_ids': [created_tests[1].id],
                     'order_date': date.today(),
                 },
                 {
                     'patient_name': 'V',
                     'patient_phone': '9898745625',
-                    'test_id': created_tests[2].id,
+                    'test_ids': [created_tests[2].id],
                     'order_date': date.today() + timedelta(days=1),
                 },
             ]
@@ -138,16 +487,31 @@ if __name__ == '__main__':
     # For development
     print("🏥 Pathology Module - Starting Flask Application")
     print("=" * 50)
-    print("Database: MySQL (XAMPP)")
-    print("Host: localhost:3306")
-    print("User: root")
-    print("Database: pathology_db")
+    from sqlalchemy.engine import make_url
+
+    db_url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    print(f"Database: {db_url.render_as_string(hide_password=True)}")
+    print(f"Pool: size {app.config.get('DB_POOL_SIZE')}, overflow {app.config.get('DB_MAX_OVERFLOW')}, "
+          f"recycle {app.config.get('DB_POOL_RECYCLE')}s")
     print("URL: http://localhost:5000")
     print("=" * 50)
     print("\nUseful commands:")
     print("  python setup_mysql.py     Create MySQL database")
-    print("  flask init-db              Initialize tables")
+    print("  flask upgrade-db           Create or upgrade tables (alias: flask init-db)")
+    print("  flask check-indexes        Verify hot queries use their indexes")
     print("  flask seed-db              Seed database with sample data")
+    print("  flask reindex-search       Rebuild the order search index")
+    print("  flask import-orders FILE   Bulk-import orders from CSV/JSON lines")
+    print("  flask export-orders        Stream orders to CSV")
+    print("  flask export-results       Stream results to NDJSON")
+    print("  flask pool-advice          Size the DB connection pool for gunicorn")
+    print("  flask rollup-tat           Roll up turnaround times (run from cron)")
+    print("  flask tat-report           p50/p90/p99 turnaround per test or day")
+    print("  flask merge-visits         Merge same-visit orders into multi-test orders")
+    print("  flask dedupe-patients      Merge patients with the same phone and name")
+    print("  flask archive-orders       Move old finished orders to the archive tables")
+    print("  flask run-worker           Run background jobs (reports, SMS, LIS push)")
+    print("  flask jobs                 Inspect the background job queue")
     print("=" * 50)
     print()
     
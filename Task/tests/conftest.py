@@ -0,0 +1,36 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from app import create_app
+
+
+@pytest.fixture
+def db_uri(tmp_path):
+    """A file-backed SQLite database, so other processes can share it"""
+    return f"sqlite:///{os.path.join(tmp_path, 'test.db')}"
+
+
+@pytest.fixture
+def app_config(db_uri):
+    return {
+        'SQLALCHEMY_DATABASE_URI': db_uri,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SECRET_KEY': 'test',
+        'SCHEMA_BOOT_MODE': 'create',  # test databases are created on the fly
+        # Writers queue on SQLite's database lock instead of failing fast
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 60}},
+    }
+
+
+@pytest.fixture
+def app(app_config):
+    app = create_app(app_config)
+    with app.app_context():
+        yield app
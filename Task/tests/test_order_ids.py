@@ -0,0 +1,88 @@
+"""
+Order ID allocation (app.sequences) under concurrent worker processes
+"""
+
+import multiprocessing
+import os
+from datetime import date
+
+from app import create_app, db
+from app.models import PathologyTest, LabTestOrder
+
+
+FIRST_NUMBER = 1001  # order_id_allocator starts its series at 1000
+
+
+def create_orders(config, test_id, count, barrier, queue):
+    """Worker process: create `count` orders and report the IDs handed out"""
+    from app.controllers import LabTestOrderController
+
+    app = create_app(config)
+    order_ids = []
+    errors = 0
+    with app.app_context():
+        barrier.wait()
+        for i in range(count):
+            try:
+                order = LabTestOrderController.create_order(
+                    patient_name=f'Stress Patient {os.getpid()}-{i}',
+                    patient_phone='9000000000',
+                    test_id=test_id,
+                    order_date=date.today(),
+                )
+                order_ids.append(order.order_id)
+            except Exception:
+                db.session.rollback()
+                errors += 1
+    queue.put((order_ids, errors))
+
+
+def run_workers(config, workers, orders):
+    """Create `orders` orders in each of `workers` processes at once; returns (order IDs, errors)"""
+    test = PathologyTest(test_name='Stress Test Panel', test_code='STRESS',
+                         sample_type='Blood', normal_range='0-1', price=1)
+    db.session.add(test)
+    db.session.commit()
+
+    config = dict(config, SCHEMA_BOOT_MODE='off')  # the app fixture created the schema
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(workers)
+    queue = ctx.Queue()
+    processes = [
+        ctx.Process(target=create_orders, args=(config, test.id, orders, barrier, queue))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return [order_id for ids, _ in outcomes for order_id in ids], sum(errors for _, errors in outcomes)
+
+
+def _numbers(order_ids):
+    return sorted(int(order_id.rsplit('-', 1)[1]) for order_id in order_ids)
+
+
+def test_concurrent_workers_get_unique_gap_free_ids(app, app_config):
+    # Every worker uses up whole blocks, so no reserved number is left over
+    workers, orders, block_size = 4, 40, 10
+    order_ids, errors = run_workers(dict(app_config, ORDER_ID_BLOCK_SIZE=block_size), workers, orders)
+
+    assert errors == 0
+    assert len(order_ids) == workers * orders
+    assert len(set(order_ids)) == len(order_ids)
+    assert LabTestOrder.query.filter(LabTestOrder.order_id.in_(order_ids)).count() == len(order_ids)
+    assert _numbers(order_ids) == list(range(FIRST_NUMBER, FIRST_NUMBER + workers * orders))
+
+
+def test_partly_used_blocks_skip_numbers_but_never_repeat(app, app_config):
+    # Numbers left in a worker's last block are skipped, never handed out twice
+    workers, orders, block_size = 3, 15, 10
+    order_ids, errors = run_workers(dict(app_config, ORDER_ID_BLOCK_SIZE=block_size), workers, orders)
+
+    numbers = _numbers(order_ids)
+    assert errors == 0
+    assert len(set(numbers)) == len(numbers) == workers * orders
+    assert numbers[0] >= FIRST_NUMBER
+    assert numbers[-1] < FIRST_NUMBER + workers * 2 * block_size
@@ -0,0 +1,132 @@
+"""
+Multi-test orders backed by lab_test_order_line
+"""
+
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.controllers import PathologyTestController, LabTestOrderController, LabTestResultController
+from app.models import LabTestOrder, OrderStatusEnum
+from app.order_lines import merge_visits
+
+
+PATIENT = {'patient_name': 'Asha Kumar', 'patient_phone': '9811111111'}
+
+
+@pytest.fixture
+def tests(app):
+    app.config['ORDER_ID_BLOCK_SIZE'] = 1000
+    tests = [
+        PathologyTestController.create_test(f'Test {code}', code, 'Blood', '1-10', price)
+        for code, price in (('CBC', 300), ('LFT', 500), ('TSH', 400))
+    ]
+    # Reserve the order ID block up front, so it does not count as a commit below
+    LabTestOrderController.create_order(test_ids=[tests[0].id], order_date=date.today(), **PATIENT)
+    return tests
+
+
+@contextmanager
+def count_commits():
+    commits = []
+    listener = lambda conn: commits.append(conn)
+    event.listen(db.engine, 'commit', listener)
+    try:
+        yield commits
+    finally:
+        event.remove(db.engine, 'commit', listener)
+
+
+@contextmanager
+def count_statements():
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+
+def test_panel_order_is_one_order_with_a_line_per_test(tests):
+    with count_commits() as commits:
+        order = LabTestOrderController.create_order(
+            test_ids=[test.id for test in tests], order_date=date.today(), **PATIENT
+        )
+
+    assert len(commits) == 1
+    assert [(line.line_no, line.test_id) for line in order.lines] == [(1, tests[0].id), (2, tests[1].id), (3, tests[2].id)]
+    assert [float(line.price) for line in order.lines] == [300, 500, 400]
+
+
+def test_single_test_id_keyword_is_still_accepted(tests):
+    order = LabTestOrderController.create_order(test_id=tests[1].id, order_date=date.today(), **PATIENT)
+
+    assert [line.test_id for line in order.lines] == [tests[1].id]
+    with pytest.raises(ValueError):
+        LabTestOrderController.create_order(test_id=tests[0].id, test_ids=[tests[1].id], order_date=date.today(),
+                                            **PATIENT)
+
+
+def test_duplicate_tests_on_one_order_are_rejected(tests):
+    with pytest.raises(ValueError):
+        LabTestOrderController.create_order(test_ids=[tests[0].id, tests[0].id], order_date=date.today(), **PATIENT)
+
+
+def test_order_completes_when_every_line_has_a_completed_result(tests):
+    order = LabTestOrderController.create_order(test_ids=[test.id for test in tests], order_date=date.today(), **PATIENT)
+    LabTestOrderController.transition_status(order.id, OrderStatusEnum.ORDERED.value)
+    results = [LabTestResultController.create_result(order.id, '5.0', line_id=line.id) for line in order.lines]
+
+    LabTestResultController.complete_result(results[0].id)
+    assert db.session.get(LabTestOrder, order.id).status == OrderStatusEnum.ORDERED.value
+
+    LabTestResultController.batch_complete_results([result.id for result in results[1:]])
+    db.session.expire_all()
+    order = db.session.get(LabTestOrder, order.id)
+    assert order.status == OrderStatusEnum.COMPLETED.value
+    assert all(line.completed_at is not None for line in order.lines)
+
+
+def test_bulk_creation_writes_panels_in_one_transaction(tests):
+    rows = [{'test_code': 'CBC+LFT+TSH', 'order_date': date.today().isoformat(), **PATIENT} for _ in range(5)]
+    rows.append({'test_code': 'CBC+NOPE', 'order_date': date.today().isoformat(), **PATIENT})
+    with count_commits() as commits:
+        report = LabTestOrderController.bulk_create_orders(rows)
+
+    assert len(commits) == 1
+    assert report['created'] == 5
+    assert [failure['row'] for failure in report['failed']] == [6]
+    created = LabTestOrder.query.filter(LabTestOrder.order_id.in_(report['order_ids'])).all()
+    assert sorted(len(order.lines) for order in created) == [3] * 5
+
+
+def test_merge_visits_folds_single_test_orders_into_one(tests):
+    test_ids = [test.id for test in tests]
+    single_ids = [
+        LabTestOrderController.create_order(test_ids=[test_id], order_date=date.today(), patient_name='Ravi S',
+                                            patient_phone='9822222222').id
+        for test_id in test_ids
+    ]
+
+    summary = merge_visits()
+    assert summary == {'visits': 1, 'orders_merged': 2, 'examples': summary['examples']}
+    db.session.expire_all()
+    survivor = db.session.get(LabTestOrder, single_ids[0])
+    assert [line.test_id for line in survivor.lines] == test_ids
+    assert LabTestOrder.query.filter(LabTestOrder.id.in_(single_ids[1:])).count() == 0
+    assert merge_visits()['orders_merged'] == 0
+
+
+def test_panel_visit_needs_fewer_queries_than_single_test_orders(tests):
+    test_ids = [test.id for test in tests]
+    with count_statements() as separate:
+        for test_id in test_ids:
+            LabTestOrderController.create_order(test_id=test_id, order_date=date.today(), **PATIENT)
+    with count_statements() as panel:
+        LabTestOrderController.create_order(test_ids=test_ids, order_date=date.today(), **PATIENT)
+
+    assert len(panel) < len(separate)
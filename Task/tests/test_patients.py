@@ -0,0 +1,67 @@
+"""
+Patient resolution (app.patients) and the per-order name/phone snapshot
+"""
+
+from datetime import date
+
+import pytest
+
+from app import db
+from app.controllers import PathologyTestController, LabTestOrderController, PatientController
+from app.models import Patient
+
+
+@pytest.fixture
+def test_id(app):
+    return PathologyTestController.create_test('Test CBC', 'CBC', 'Blood', '1-10', 300).id
+
+
+def _order(test_id, name, phone):
+    return LabTestOrderController.create_order(name, phone, [test_id], date.today())
+
+
+def test_same_phone_and_name_in_any_format_is_one_patient(test_id):
+    first = _order(test_id, 'Mr Patel', '+91 98987 45612')
+    again = _order(test_id, 'mr. PATEL', '098987 45612')
+
+    assert again.patient_id == first.patient_id
+    assert Patient.query.count() == 1
+
+
+def test_family_members_sharing_a_phone_are_separate_patients(test_id):
+    father = _order(test_id, 'Mr Patel', '9898745612')
+    son = _order(test_id, 'Ravi Patel', '9898745612')
+
+    assert son.patient_id != father.patient_id
+    found = PatientController.find_patients_by_phone('+91 98987 45612')
+    assert [patient.name for patient in found] == ['Mr Patel', 'Ravi Patel']
+    assert [patient.id for patient in PatientController.find_patients_by_phone('9898745612', 'ravi patel')] == [
+        son.patient_id
+    ]
+
+
+def test_orders_keep_the_name_and_phone_entered_on_them(test_id):
+    first = _order(test_id, 'Mr Patel', '+91 98987 45612')
+    again = _order(test_id, 'MR. PATEL', '9898745612')
+
+    db.session.expire_all()
+    patient = db.session.get(Patient, first.patient_id)
+    assert (patient.name, patient.phone) == ('Mr Patel', '+91 98987 45612')
+    assert (again.patient_name, again.patient_phone) == ('MR. PATEL', '9898745612')
+    assert [order.order_id for order in LabTestOrderController.search_orders('MR. PATEL')] == [
+        again.order_id, first.order_id
+    ]
+
+
+def test_bulk_creation_resolves_patients_by_phone_and_name(test_id):
+    rows = [
+        {'patient_name': name, 'patient_phone': phone, 'test_id': str(test_id), 'order_date': date.today().isoformat()}
+        for name, phone in (('Asha Rao', '9811111111'), ('Ravi Rao', '9811111111'), ('asha rao', '+91 98111 11111'))
+    ]
+    report = LabTestOrderController.bulk_create_orders(rows)
+
+    assert report['created'] == 3
+    assert Patient.query.count() == 2
+    assert [patient.name for patient in PatientController.find_patients_by_phone('9811111111')] == [
+        'Asha Rao', 'Ravi Rao'
+    ]